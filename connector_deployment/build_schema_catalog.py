@@ -0,0 +1,93 @@
+import argparse
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv
+
+from bulk_load import add_connection_arguments, connection_from_args
+
+# The catalog is read by the agent, so it is written into the db_buddy package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_buddy.tools import schema_catalog
+
+
+# Introspects the tables, columns, types and indexes of the Postgres and SQL
+# Server databases and writes db_buddy/schema_catalog.json. The agent renders
+# it into the Postgres and SQL Server agents' instructions. Rerun it after
+# changing either schema, before deploying; only the databases whose schema
+# changed get a new version.
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def build_catalog(connections, path=schema_catalog.SCHEMA_CATALOG_PATH):
+    """
+    Introspects each database in connections and updates the catalog file.
+
+    connections maps "postgres" and/or "sqlsvr" to connection settings.
+    Databases that are not given keep their existing entry. Returns the
+    catalog.
+    """
+    catalog = schema_catalog.load_catalog(path)
+    for database, connection in connections.items():
+        if database == "postgres":
+            import psycopg2
+
+            conn = psycopg2.connect(
+                host=connection["host"], port=connection["port"], dbname=connection["database"],
+                user=connection["user"], password=connection["password"],
+            )
+            introspect = schema_catalog.introspect_postgres
+        else:
+            import pymssql
+
+            conn = pymssql.connect(
+                server=connection["host"], port=connection["port"], database=connection["database"],
+                user=connection["user"], password=connection["password"],
+            )
+            introspect = schema_catalog.introspect_sqlsvr
+        try:
+            entry = schema_catalog.catalog_entry(introspect(conn))
+        finally:
+            conn.close()
+        previous = catalog.get(database, {}).get("version")
+        if previous == entry["version"]:
+            logger.info(f"{database}: {len(entry['tables'])} tables, unchanged (version {previous})")
+            continue
+        catalog[database] = entry
+        logger.info(f"{database}: {len(entry['tables'])} tables, version {previous} -> {entry['version']}")
+    schema_catalog.save_catalog(catalog, path)
+    return catalog
+
+
+def main():
+    """Writes the schema catalog of the DB Buddy databases."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Build the schema catalog rendered into the SQL agents' instructions.")
+    parser.add_argument("databases", nargs="*", help="Databases to introspect: postgres, sqlsvr or both (default: both)")
+    parser.add_argument("--output", default=schema_catalog.SCHEMA_CATALOG_PATH, help="Catalog file to update")
+    add_connection_arguments(parser, "postgres")
+    add_connection_arguments(parser, "sqlsvr")
+    args = parser.parse_args()
+    databases = args.databases or ["postgres", "sqlsvr"]
+    unknown = set(databases) - {"postgres", "sqlsvr"}
+    if unknown:
+        parser.error(f"unknown databases: {', '.join(sorted(unknown))}")
+
+    connections = {
+        database: connection_from_args(args, database, prefixed=True) for database in databases
+    }
+    try:
+        catalog = build_catalog(connections, args.output)
+    except Exception as e:
+        logger.error(f"Could not build the schema catalog: {e}")
+        sys.exit(1)
+    for database in databases:
+        print(schema_catalog.render_catalog(catalog[database]))
+
+
+if __name__ == "__main__":
+    main()
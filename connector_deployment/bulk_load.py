@@ -0,0 +1,398 @@
+import argparse
+import csv
+import io
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+# The daily rollup is emptied along with the taxi table
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_buddy.tools import rollups
+
+
+# Streams CSV or Parquet files into the Postgres and SQL Server tables.
+# Postgres rows go through COPY FROM STDIN, SQL Server rows through multi-row
+# parameterized INSERTs. Each input file is a partition; partitions load in
+# parallel on their own connections, one chunk per transaction. The same
+# transaction records the partition's row offset in the bulk_load_checkpoint
+# table of the target database, so a chunk and its checkpoint are committed
+# together and a rerun resumes exactly where the last commit stopped, without
+# loading any row twice.
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(threadName)s] %(message)s")
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 50000
+CHECKPOINT_TABLE = "bulk_load_checkpoint"
+# SQL Server allows at most 1000 rows per VALUES list and 2100 parameters per statement
+SQLSVR_MAX_ROWS_PER_INSERT = 1000
+SQLSVR_MAX_PARAMS = 2100
+
+
+def list_partitions(paths):
+    """Expands files and directories into a sorted list of CSV and Parquet files."""
+    partitions = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith((".csv", ".parquet")):
+                    partitions.append(os.path.join(path, name))
+        else:
+            partitions.append(path)
+    return partitions
+
+
+def _format_value(value):
+    if value is None:
+        return None
+    if hasattr(value, "isoformat"):
+        return value.isoformat(sep=" ") if hasattr(value, "hour") else value.isoformat()
+    return value
+
+
+def read_chunks(path, chunk_rows, skip_rows=0):
+    """Yields (columns, rows) chunks of a CSV or Parquet file, holding one chunk in memory.
+
+    Empty CSV fields are read as NULL.
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        columns = parquet_file.schema_arrow.names
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+            rows = [tuple(_format_value(v) for v in row.values()) for row in batch.to_pylist()]
+            if skip_rows >= len(rows):
+                skip_rows -= len(rows)
+                continue
+            yield columns, rows[skip_rows:]
+            skip_rows = 0
+        return
+
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+        for _ in range(skip_rows):
+            if next(reader, None) is None:
+                return
+        rows = []
+        for row in reader:
+            rows.append(tuple(v if v != "" else None for v in row))
+            if len(rows) >= chunk_rows:
+                yield columns, rows
+                rows = []
+        if rows:
+            yield columns, rows
+
+
+class PostgresWriter:
+    """Writes chunks to a Postgres table with COPY FROM STDIN."""
+
+    def __init__(self, host, port, database, user, password, table):
+        import psycopg2
+
+        self.table = table
+        self.conn = psycopg2.connect(
+            host=host, port=port, dbname=database, user=user, password=password
+        )
+
+    def create_checkpoint_table(self):
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (\n"
+                "    target_table TEXT NOT NULL,\n"
+                "    source_file TEXT NOT NULL,\n"
+                "    rows_loaded BIGINT NOT NULL,\n"
+                "    done BOOLEAN NOT NULL DEFAULT FALSE,\n"
+                "    PRIMARY KEY (target_table, source_file)\n"
+                ")"
+            )
+        self.conn.commit()
+
+    def checkpoint(self, partition):
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"SELECT rows_loaded, done FROM {CHECKPOINT_TABLE} WHERE target_table = %s AND source_file = %s",
+                (self.table, partition),
+            )
+            row = cur.fetchone()
+        self.conn.rollback()
+        return {"rows": row[0], "done": row[1]} if row else {"rows": 0, "done": False}
+
+    def _save_checkpoint(self, cur, partition, rows, done):
+        cur.execute(
+            f"INSERT INTO {CHECKPOINT_TABLE} (target_table, source_file, rows_loaded, done) "
+            f"VALUES (%s, %s, %s, %s) ON CONFLICT (target_table, source_file) "
+            f"DO UPDATE SET rows_loaded = EXCLUDED.rows_loaded, done = EXCLUDED.done",
+            (self.table, partition, rows, done),
+        )
+
+    def finish(self, partition, rows):
+        with self.conn.cursor() as cur:
+            self._save_checkpoint(cur, partition, rows, True)
+        self.conn.commit()
+
+    def truncate(self):
+        from psycopg2 import sql
+
+        with self.conn.cursor() as cur:
+            cur.execute(sql.SQL("TRUNCATE TABLE {}").format(sql.Identifier(self.table)))
+            cur.execute(f"DELETE FROM {CHECKPOINT_TABLE} WHERE target_table = %s", (self.table,))
+            if self.table == rollups.TAXI_TABLE:
+                # The rollup's sums and watermark describe the rows just removed
+                rollups.reset_daily_rollup(cur)
+        self.conn.commit()
+
+    def write(self, columns, rows, partition, loaded):
+        """Writes a chunk and records loaded, the partition's rows after it, in one transaction."""
+        from psycopg2 import sql
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows(rows)
+        buffer.seek(0)
+        # Columns were created unquoted, so Postgres stores them lower-cased
+        copy = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+            sql.Identifier(self.table),
+            sql.SQL(", ").join(sql.Identifier(c.lower()) for c in columns),
+        )
+        with self.conn.cursor() as cur:
+            cur.copy_expert(copy.as_string(self.conn), buffer)
+            self._save_checkpoint(cur, partition, loaded, False)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class SqlServerWriter:
+    """Writes chunks to a SQL Server table with batched multi-row INSERTs."""
+
+    def __init__(self, host, port, database, user, password, table):
+        import pymssql
+
+        self.table = table
+        self.conn = pymssql.connect(
+            server=host, port=port, database=database, user=user, password=password
+        )
+
+    def create_checkpoint_table(self):
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"IF OBJECT_ID('{CHECKPOINT_TABLE}') IS NULL CREATE TABLE {CHECKPOINT_TABLE} (\n"
+                "    target_table NVARCHAR(128) NOT NULL,\n"
+                "    source_file NVARCHAR(320) NOT NULL,\n"
+                "    rows_loaded BIGINT NOT NULL,\n"
+                "    done BIT NOT NULL DEFAULT 0,\n"
+                "    PRIMARY KEY (target_table, source_file)\n"
+                ")"
+            )
+        self.conn.commit()
+
+    def checkpoint(self, partition):
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"SELECT rows_loaded, done FROM {CHECKPOINT_TABLE} WHERE target_table = %s AND source_file = %s",
+                (self.table, partition),
+            )
+            row = cur.fetchone()
+        self.conn.rollback()
+        return {"rows": row[0], "done": bool(row[1])} if row else {"rows": 0, "done": False}
+
+    def _save_checkpoint(self, cur, partition, rows, done):
+        cur.execute(
+            f"UPDATE {CHECKPOINT_TABLE} SET rows_loaded = %s, done = %s "
+            f"WHERE target_table = %s AND source_file = %s; "
+            f"IF @@ROWCOUNT = 0 INSERT INTO {CHECKPOINT_TABLE} (target_table, source_file, rows_loaded, done) "
+            f"VALUES (%s, %s, %s, %s)",
+            (rows, done, self.table, partition, self.table, partition, rows, done),
+        )
+
+    def finish(self, partition, rows):
+        with self.conn.cursor() as cur:
+            self._save_checkpoint(cur, partition, rows, True)
+        self.conn.commit()
+
+    def truncate(self):
+        with self.conn.cursor() as cur:
+            cur.execute(f"TRUNCATE TABLE [{self.table}]")
+            cur.execute(f"DELETE FROM {CHECKPOINT_TABLE} WHERE target_table = %s", (self.table,))
+        self.conn.commit()
+
+    def write(self, columns, rows, partition, loaded):
+        """Writes a chunk and records loaded, the partition's rows after it, in one transaction."""
+        rows_per_insert = min(SQLSVR_MAX_ROWS_PER_INSERT, SQLSVR_MAX_PARAMS // len(columns) - 1)
+        column_list = ", ".join(f"[{c}]" for c in columns)
+        placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        with self.conn.cursor() as cur:
+            for start in range(0, len(rows), rows_per_insert):
+                batch = rows[start:start + rows_per_insert]
+                statement = (
+                    f"INSERT INTO [{self.table}] ({column_list}) VALUES "
+                    + ", ".join([placeholders] * len(batch))
+                )
+                cur.execute(statement, tuple(v for row in batch for v in row))
+            self._save_checkpoint(cur, partition, loaded, False)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+WRITERS = {"postgres": PostgresWriter, "sqlsvr": SqlServerWriter}
+
+
+class Progress:
+    """Aggregates loaded rows across partitions and logs throughput."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.rows = 0
+
+    def add(self, partition, partition_rows, rows):
+        with self._lock:
+            self.rows += rows
+            elapsed = time.monotonic() - self.started
+            logger.info(
+                f"{os.path.basename(partition)}: {partition_rows} rows, "
+                f"total {self.rows} rows at {self.rows / elapsed:,.0f} rows/s"
+            )
+
+
+def load_partition(make_writer, partition, progress, chunk_rows):
+    """Loads one partition, resuming after its last checkpointed row."""
+    # Checkpoints are keyed by absolute path, so a rerun from another directory resumes
+    key = os.path.abspath(partition)
+    writer = make_writer()
+    try:
+        state = writer.checkpoint(key)
+        if state["done"]:
+            logger.info(f"Skipping {partition}, already loaded ({state['rows']} rows)")
+            return 0
+        loaded = state["rows"]
+        if loaded:
+            logger.info(f"Resuming {partition} after row {loaded}")
+        for columns, rows in read_chunks(partition, chunk_rows, skip_rows=loaded):
+            writer.write(columns, rows, key, loaded + len(rows))
+            loaded += len(rows)
+            progress.add(partition, loaded, len(rows))
+        writer.finish(key, loaded)
+    finally:
+        writer.close()
+    return loaded - state["rows"]
+
+
+def bulk_load(target, inputs, table, connection, chunk_rows=DEFAULT_CHUNK_ROWS, workers=4, truncate=False):
+    """Loads CSV/Parquet files into a table in parallel and returns the rows/s achieved.
+
+    connection holds host, port, database, user and password. Progress is
+    checkpointed in the target database; truncate empties the table and
+    discards its checkpoints first.
+    """
+    partitions = list_partitions(inputs)
+    if not partitions:
+        raise ValueError(f"No CSV or Parquet files found in {inputs}")
+
+    def make_writer():
+        return WRITERS[target](table=table, **connection)
+
+    writer = make_writer()
+    try:
+        writer.create_checkpoint_table()
+        if truncate:
+            writer.truncate()
+    finally:
+        writer.close()
+
+    progress = Progress()
+    logger.info(f"Loading {len(partitions)} partitions into {table} with {workers} workers")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="load") as executor:
+        futures = [
+            executor.submit(load_partition, make_writer, p, progress, chunk_rows)
+            for p in partitions
+        ]
+        rows = sum(f.result() for f in futures)
+
+    elapsed = time.monotonic() - progress.started
+    rows_per_second = rows / elapsed if elapsed else 0.0
+    logger.info(f"Loaded {rows} rows into {table} in {elapsed:.1f}s ({rows_per_second:,.0f} rows/s)")
+    return rows_per_second
+
+
+def add_connection_arguments(parser, target=None):
+    """
+    Adds the database connection options shared by the data loading scripts.
+
+    With a target the options are prefixed with it (--sqlsvr-host and so on),
+    so a script can take connections to both databases.
+    """
+    option = f"--{target}-" if target else "--"
+    name = target.upper() if target else "<TARGET>"
+    default_port = {"postgres": "5432", "sqlsvr": "1433"}.get(target, "5432 for postgres, 1433 for sqlsvr")
+    parser.add_argument(f"{option}host", default="127.0.0.1", help="Database host, e.g. a local Cloud SQL Auth Proxy")
+    parser.add_argument(f"{option}port", type=int, help=f"Database port (default: {default_port})")
+    parser.add_argument(f"{option}database", help=f"Database name (default: GOOGLE_CLOUD_{name}_DB)")
+    parser.add_argument(f"{option}user", help=f"Database user (default: GOOGLE_CLOUD_{name}_USER)")
+    parser.add_argument(f"{option}password", help=f"Database password (default: GOOGLE_CLOUD_{name}_PASSWORD)")
+
+
+def connection_from_args(args, target, prefixed=False):
+    """Builds connection settings from the parsed options, falling back to the environment."""
+    prefix = f"GOOGLE_CLOUD_{target.upper()}"
+    option = f"{target}_" if prefixed else ""
+
+    def arg(name):
+        return getattr(args, f"{option}{name}")
+
+    return {
+        "host": arg("host"),
+        "port": arg("port") or (5432 if target == "postgres" else 1433),
+        "database": arg("database") or os.getenv(f"{prefix}_DB"),
+        "user": arg("user") or os.getenv(f"{prefix}_USER"),
+        "password": arg("password") or os.getenv(f"{prefix}_PASSWORD"),
+    }
+
+
+def main():
+    """Bulk loads taxi or weather data files into Postgres or SQL Server."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Bulk load CSV or Parquet files into a DB Buddy table.")
+    parser.add_argument("target", choices=list(WRITERS), help="The database to load into")
+    parser.add_argument("inputs", nargs="+", help="CSV/Parquet files or directories of them; each file is one partition")
+    parser.add_argument("--table", help="Target table (default: GOOGLE_CLOUD_<TARGET>_TABLE)")
+    add_connection_arguments(parser)
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per chunk and transaction")
+    parser.add_argument("--workers", type=int, default=4, help="Partitions loaded in parallel")
+    parser.add_argument("--truncate", action="store_true", help="Empty the table and discard its checkpoints first")
+    args = parser.parse_args()
+
+    prefix = f"GOOGLE_CLOUD_{args.target.upper()}"
+    table = args.table or os.getenv(f"{prefix}_TABLE")
+    connection = connection_from_args(args, args.target)
+    if not table or not connection["database"]:
+        parser.error(f"set --table/--database or {prefix}_TABLE/{prefix}_DB")
+
+    try:
+        bulk_load(
+            args.target,
+            args.inputs,
+            table,
+            connection,
+            chunk_rows=args.chunk_rows,
+            workers=args.workers,
+            truncate=args.truncate,
+        )
+    except Exception as e:
+        logger.error(f"Bulk load failed: {e}. Rerun the same command to resume.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,33 @@
 import os
 import logging
+import random
 import time
 import subprocess
 from dotenv import load_dotenv
 from google.cloud import storage
 from google.api_core.exceptions import NotFound
-from googleapiclient import discovery
 from googleapiclient.errors import HttpError
 import argparse
 
+from provisioning_client import get_resource_manager_service, get_sqladmin_service
+
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Polling backoff for long-running Cloud SQL operations
+POLL_INITIAL_DELAY_SECONDS = float(os.getenv("POLL_INITIAL_DELAY_SECONDS", "2"))
+POLL_MAX_DELAY_SECONDS = float(os.getenv("POLL_MAX_DELAY_SECONDS", "60"))
+
+def poll_delays():
+    """Yields exponentially growing, jittered delays between status checks."""
+    delay = POLL_INITIAL_DELAY_SECONDS
+    while True:
+        # Jitter keeps parallel provisioning runs from polling in lockstep
+        yield random.uniform(delay / 2, delay)
+        delay = min(delay * 2, POLL_MAX_DELAY_SECONDS)
+
 def create_bucket_if_not_exists(project_id, bucket_name, location):
     """Creates a new bucket if it does not exist."""
     storage_client = storage.Client(project=project_id)
@@ -28,6 +42,7 @@ def create_bucket_if_not_exists(project_id, bucket_name, location):
 def wait_for_instance_to_be_runnable(service, project_id, instance_name):
     """Waits for a Cloud SQL instance to become RUNNABLE."""
     logger.info(f"Waiting for instance '{instance_name}' to be ready...")
+    delays = poll_delays()
     while True:
         try:
             instance_info = service.instances().get(project=project_id, instance=instance_name).execute()
@@ -38,8 +53,9 @@ def wait_for_instance_to_be_runnable(service, project_id, instance_name):
                 logger.info(f"Instance '{instance_name}' is now RUNNABLE.")
                 return True
             elif state in ["PENDING_CREATE", "MAINTENANCE", "STOPPED", "UNKNOWN_STATE"]:
-                logger.info("Instance is not ready yet. Checking again in 60 seconds...")
-                time.sleep(60)
+                delay = next(delays)
+                logger.info(f"Instance is not ready yet. Checking again in {delay:.0f} seconds...")
+                time.sleep(delay)
             else: # FAILED, SUSPENDED
                 logger.error(f"Instance '{instance_name}' is in a non-recoverable state: {state}. Aborting.")
                 return False
@@ -54,6 +70,7 @@ def wait_for_instance_to_be_runnable(service, project_id, instance_name):
 def wait_for_operation_to_complete(service, project_id, operation_name):
     """Waits for a Cloud SQL operation to complete."""
     logger.info(f"Waiting for operation '{operation_name}' to complete...")
+    delays = poll_delays()
     while True:
         try:
             operation = service.operations().get(project=project_id, operation=operation_name).execute()
@@ -67,7 +84,7 @@ def wait_for_operation_to_complete(service, project_id, operation_name):
                     return False
                 return True
             
-            time.sleep(10) # Poll every 10 seconds
+            time.sleep(next(delays))
         except HttpError as e:
             logger.error(f"Error checking operation status: {e}")
             return False
@@ -75,10 +92,10 @@ def wait_for_operation_to_complete(service, project_id, operation_name):
             logger.error(f"An unexpected error occurred while waiting for operation: {e}")
             return False
 
-def create_db_instance_if_not_exists(project_id, instance_name, region, db_type, db_version):
+def create_db_instance_if_not_exists(project_id, instance_name, region, db_type, db_version, service=None):
     f"""Creates a {db_type} instance if it does not exist."""
     # Initialize the Cloud SQL Admin API client
-    service = discovery.build("sqladmin", "v1beta4")
+    service = service or get_sqladmin_service()
 
     try:
         instance = service.instances().get(project=project_id, instance=instance_name).execute()
@@ -166,10 +183,10 @@ def create_db_instance_if_not_exists(project_id, instance_name, region, db_type,
     
     return wait_for_instance_to_be_runnable(service, project_id, instance_name)
 
-def create_database_if_not_exists(project_id, instance_name, db_name, db_type):
+def create_database_if_not_exists(project_id, instance_name, db_name, db_type, service=None):
     f"""Creates a {db_type} database within an instance if it does not exist."""
     # Initialize the Cloud SQL Admin API client
-    service = discovery.build("sqladmin", "v1beta4")
+    service = service or get_sqladmin_service()
 
     try:
         service.databases().get(project=project_id, instance=instance_name, database=db_name).execute()
@@ -192,15 +209,18 @@ def create_database_if_not_exists(project_id, instance_name, db_name, db_type):
                 logger.error(f"Database creation operation for '{db_name}' failed.")
                 return False
 
-            # Validation step
-            try:
-                time.sleep(5) # Give a moment for the API to be consistent
-                service.databases().get(project=project_id, instance=instance_name, database=db_name).execute()
-                logger.info(f"Successfully validated that database '{db_name}' was created.")
-                return True
-            except HttpError as e_validate:
-                logger.error(f"Validation failed. Database '{db_name}' not found after creation attempt. Error: {e_validate}")
-                return False
+            # Validation step, retried while the API becomes consistent
+            delays = poll_delays()
+            for attempt in range(3):
+                try:
+                    service.databases().get(project=project_id, instance=instance_name, database=db_name).execute()
+                    logger.info(f"Successfully validated that database '{db_name}' was created.")
+                    return True
+                except HttpError as e_validate:
+                    if attempt == 2:
+                        logger.error(f"Validation failed. Database '{db_name}' not found after creation attempt. Error: {e_validate}")
+                        return False
+                    time.sleep(next(delays))
         elif e.resp.status == 400 and "instance is not running" in str(e.content):
             logger.error(f"Cannot create database '{db_name}' because instance '{instance_name}' is not running. Please start the instance and try again.")
             raise
@@ -228,64 +248,60 @@ def get_gcloud_user():
         logger.error(f"Error getting gcloud user: {e.stderr}")
         raise
 
-def add_iam_policy_binding(project_id, user_email):
+def add_iam_policy_binding(project_id, user_email, service=None):
     """Adds the Cloud SQL Admin role to the user."""
     logger.info(f"Adding Cloud SQL Admin role to {user_email}...")
-    command = [
-        "gcloud",
-        "projects",
-        "add-iam-policy-binding",
-        project_id,
-        f"--member=user:{user_email}",
-        "--role=roles/cloudsql.admin",
-    ]
-    try:
-        subprocess.run(command, check=True, capture_output=True, text=True)
-        logger.info("Cloud SQL Admin role added successfully.")
-    except subprocess.CalledProcessError as e:
-        # It's possible the policy binding already exists, which would cause an error.
-        # We can safely ignore this.
-        if "already exists" in e.stderr:
+    service = service or get_resource_manager_service()
+    role = "roles/cloudsql.admin"
+    member = f"user:{user_email}"
+    # setIamPolicy fails with 409 if the policy changed since it was read, so retry a few times
+    for attempt in range(3):
+        policy = service.projects().getIamPolicy(
+            resource=project_id, body={"options": {"requestedPolicyVersion": 3}}
+        ).execute()
+        bindings = policy.setdefault("bindings", [])
+        binding = next((b for b in bindings if b["role"] == role and "condition" not in b), None)
+        if binding and member in binding.get("members", []):
             logger.info("IAM policy binding already exists.")
+            return
+        if binding:
+            binding["members"].append(member)
         else:
-            logger.error(f"Error adding IAM policy binding: {e.stderr}")
+            bindings.append({"role": role, "members": [member]})
+        try:
+            service.projects().setIamPolicy(resource=project_id, body={"policy": policy}).execute()
+            logger.info("Cloud SQL Admin role added successfully.")
+            return
+        except HttpError as e:
+            if e.resp.status == 409 and attempt < 2:
+                logger.info("IAM policy changed concurrently, retrying...")
+                continue
+            logger.error(f"Error adding IAM policy binding: {e}")
             raise
 
-def add_iam_user_to_instance(project_id, instance_name, user_email):
+def add_iam_user_to_instance(project_id, instance_name, user_email, service=None):
     """Adds an IAM user to the Cloud SQL instance."""
     logger.info(f"Adding IAM user {user_email} to instance {instance_name}...")
-    command = [
-        "gcloud",
-        "sql",
-        "users",
-        "create",
-        user_email,
-        f"--instance={instance_name}",
-        "--type=CLOUD_IAM_USER",
-        f"--project={project_id}",
-    ]
+    service = service or get_sqladmin_service()
+    user_body = {"name": user_email, "type": "CLOUD_IAM_USER"}
     try:
-        subprocess.run(command, check=True, capture_output=True, text=True)
+        operation = service.users().insert(project=project_id, instance=instance_name, body=user_body).execute()
+        wait_for_operation_to_complete(service, project_id, operation["name"])
         logger.info(f"IAM user {user_email} added successfully.")
-    except subprocess.CalledProcessError as e:
-        if "already exists" in e.stderr:
+    except HttpError as e:
+        if e.resp.status == 409:
             logger.info(f"IAM user {user_email} already exists.")
         else:
-            logger.error(f"Error adding IAM user: {e.stderr}")
+            logger.error(f"Error adding IAM user: {e}")
             raise
 
-def main():
-    """Main function to create bucket, upload files, create data store, import documents, create Postgres instance and database."""
-    parser = argparse.ArgumentParser(description="Deploy back end services.")
-    parser.add_argument(
-        "db_type",
-        choices=["postgres", "sqlsvr", "mysql", "bq"],
-        help="The type of database to deploy. Choose from: postgres, sqlserver, mysql, bq",
-    )
-    args = parser.parse_args()
-    db_type=args.db_type
-    print(f"Deploying dabase back end for {args.db_type}")
-    
+def deploy_database(db_type, service=None, gcloud_user=None, bind_iam_policy=True):
+    """Creates the instance and database for a database type, configured from the environment.
+
+    When bind_iam_policy is set, the active gcloud user is looked up and granted
+    Cloud SQL Admin; callers that already did this pass the user in instead.
+    Returns True if the database is ready.
+    """
     logger.info(f"Deploying for database type: {db_type}")
     load_dotenv()
 
@@ -312,15 +328,15 @@ def main():
     if not all([project_id, gcs_bucket_name, gcs_location,
                 db_instance_name, db_name, db_region, ]):
         logger.error("Missing required environment variables. Please check your .env file.")
-        return
+        return False
 
-    gcloud_user = None
-    try:
-        gcloud_user = get_gcloud_user()
-    except Exception as e:
-        logger.error(f"Could not get gcloud user: {e}")
+    if bind_iam_policy:
+        try:
+            gcloud_user = gcloud_user or get_gcloud_user()
+        except Exception as e:
+            logger.error(f"Could not get gcloud user: {e}")
 
-    if gcloud_user:
+    if gcloud_user and bind_iam_policy:
         try:
             add_iam_policy_binding(project_id, gcloud_user)
         except Exception as e:
@@ -328,22 +344,36 @@ def main():
 
     # DB Instance and Database
     logger.info(f"Creating {db_type} instance...")
-    instance_ready = create_db_instance_if_not_exists(project_id, db_instance_name, db_region, db_type, db_version)
+    instance_ready = create_db_instance_if_not_exists(project_id, db_instance_name, db_region, db_type, db_version, service=service)
     
     if instance_ready:
         if gcloud_user and db_type != "sqlsvr":
             try:
-                add_iam_user_to_instance(project_id, db_instance_name, gcloud_user)
+                add_iam_user_to_instance(project_id, db_instance_name, gcloud_user, service=service)
             except Exception as e:
                 logger.error(f"Could not add IAM user to instance: {e}")
 
         logger.info(f"Creating {db_type} database...")
-        db_created = create_database_if_not_exists(project_id, db_instance_name, db_name, db_type)
+        db_created = create_database_if_not_exists(project_id, db_instance_name, db_name, db_type, service=service)
         if not db_created:
             logger.error(f"Failed to create database '{db_name}'. Aborting further steps.")
-            return
+            return False
+        return True
     else:
         logger.error(f"Could not proceed to database creation because instance '{db_instance_name}' is not ready.")
+        return False
+
+def main():
+    """Main function to create the Cloud SQL instance and database for one database type."""
+    parser = argparse.ArgumentParser(description="Deploy back end services.")
+    parser.add_argument(
+        "db_type",
+        choices=["postgres", "sqlsvr", "mysql", "bq"],
+        help="The type of database to deploy. Choose from: postgres, sqlserver, mysql, bq",
+    )
+    args = parser.parse_args()
+    print(f"Deploying dabase back end for {args.db_type}")
+    deploy_database(args.db_type)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
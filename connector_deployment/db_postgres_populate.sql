@@ -5,10 +5,12 @@
 -- Drop the table if it already exists to ensure a clean start
 DROP TABLE IF EXISTS nyc_taxi_table;
 
--- Recreate the table with the correct data types
+-- Recreate the table partitioned by month of pickup. The statements below are
+-- generated by db_schema.py; rows outside 2020-2021 go to the default partition
 CREATE TABLE nyc_taxi_table (
+    trip_id BIGINT GENERATED BY DEFAULT AS IDENTITY,
     VendorID INTEGER,
-    tpep_pickup_datetime TIMESTAMP,
+    tpep_pickup_datetime TIMESTAMP NOT NULL,
     tpep_dropoff_datetime TIMESTAMP,
     passenger_count INTEGER,
     trip_distance NUMERIC(10, 2),
@@ -24,8 +26,40 @@ CREATE TABLE nyc_taxi_table (
     tolls_amount NUMERIC(10, 2),
     improvement_surcharge NUMERIC(10, 2),
     total_amount NUMERIC(10, 2),
-    congestion_surcharge NUMERIC(10, 2)
-);
+    congestion_surcharge NUMERIC(10, 2),
+    PRIMARY KEY (trip_id, tpep_pickup_datetime)
+) PARTITION BY RANGE (tpep_pickup_datetime);
+
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2020_01 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2020-01-01') TO ('2020-02-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2020_02 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2020-02-01') TO ('2020-03-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2020_03 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2020-03-01') TO ('2020-04-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2020_04 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2020-04-01') TO ('2020-05-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2020_05 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2020-05-01') TO ('2020-06-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2020_06 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2020-06-01') TO ('2020-07-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2020_07 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2020-07-01') TO ('2020-08-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2020_08 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2020-08-01') TO ('2020-09-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2020_09 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2020-09-01') TO ('2020-10-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2020_10 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2020-10-01') TO ('2020-11-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2020_11 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2020-11-01') TO ('2020-12-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2020_12 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2020-12-01') TO ('2021-01-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2021_01 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2021-01-01') TO ('2021-02-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2021_02 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2021-02-01') TO ('2021-03-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2021_03 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2021-03-01') TO ('2021-04-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2021_04 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2021-04-01') TO ('2021-05-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2021_05 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2021-05-01') TO ('2021-06-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2021_06 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2021-06-01') TO ('2021-07-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2021_07 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2021-07-01') TO ('2021-08-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2021_08 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2021-08-01') TO ('2021-09-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2021_09 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2021-09-01') TO ('2021-10-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2021_10 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2021-10-01') TO ('2021-11-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2021_11 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2021-11-01') TO ('2021-12-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_2021_12 PARTITION OF nyc_taxi_table FOR VALUES FROM ('2021-12-01') TO ('2022-01-01');
+CREATE TABLE IF NOT EXISTS nyc_taxi_table_default PARTITION OF nyc_taxi_table DEFAULT;
+
+-- Every "by day" question filters or groups on DATE(tpep_pickup_datetime)
+CREATE INDEX IF NOT EXISTS nyc_taxi_table_pickup_date_idx ON nyc_taxi_table (DATE(tpep_pickup_datetime));
+CREATE INDEX IF NOT EXISTS nyc_taxi_table_pulocationid_idx ON nyc_taxi_table (PULocationID);
+CREATE INDEX IF NOT EXISTS nyc_taxi_table_dolocationid_idx ON nyc_taxi_table (DOLocationID);
 
 -- Insert all 202 data rows from the CSV file
 INSERT INTO nyc_taxi_table (VendorID, tpep_pickup_datetime, tpep_dropoff_datetime, passenger_count, trip_distance, RatecodeID, store_and_fwd_flag, PULocationID, DOLocationID, payment_type, fare_amount, extra, mta_tax, tip_amount, tolls_amount, improvement_surcharge, total_amount, congestion_surcharge) VALUES
@@ -49,5 +83,75 @@ INSERT INTO nyc_taxi_table (VendorID, tpep_pickup_datetime, tpep_dropoff_datetim
 (2, '2021-07-09 11:24:22', '2021-07-09 11:24:22', 1, 0.00, 1, 'N', 193, 193, 2, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00);
 
 
+-- Daily rollup used to answer per-day aggregates (see db_buddy/tools/rollups.py).
+-- It is built from the new rows by connector_deployment/refresh_rollup.py.
+DROP TABLE IF EXISTS nyc_taxi_daily_rollup, nyc_taxi_daily_rollup_state;
+CREATE TABLE IF NOT EXISTS nyc_taxi_daily_rollup (
+    travel_date DATE PRIMARY KEY,
+    ride_count BIGINT NOT NULL,
+    travel_seconds_sum NUMERIC NOT NULL,
+    travel_seconds_count BIGINT NOT NULL,
+    trip_distance_sum NUMERIC NOT NULL,
+    trip_distance_count BIGINT NOT NULL,
+    passenger_count_sum NUMERIC NOT NULL,
+    passenger_count_count BIGINT NOT NULL,
+    fare_amount_sum NUMERIC NOT NULL,
+    fare_amount_count BIGINT NOT NULL,
+    tip_amount_sum NUMERIC NOT NULL,
+    tip_amount_count BIGINT NOT NULL,
+    tolls_amount_sum NUMERIC NOT NULL,
+    tolls_amount_count BIGINT NOT NULL,
+    total_amount_sum NUMERIC NOT NULL,
+    total_amount_count BIGINT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS nyc_taxi_daily_rollup_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    last_trip_id BIGINT NOT NULL,
+    refreshed_at TIMESTAMPTZ,
+    invalidated BOOLEAN NOT NULL DEFAULT FALSE
+);
+INSERT INTO nyc_taxi_daily_rollup_state (last_trip_id) VALUES (0) ON CONFLICT DO NOTHING;
+-- UPDATE, DELETE and TRUNCATE on the taxi table mark the rollup for a rebuild.
+CREATE OR REPLACE FUNCTION nyc_taxi_daily_rollup_invalidate() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE nyc_taxi_daily_rollup_state SET invalidated = TRUE WHERE NOT invalidated;
+    RETURN NULL;
+END
+$$;
+DROP TRIGGER IF EXISTS nyc_taxi_daily_rollup_invalidate ON nyc_taxi_table;
+CREATE TRIGGER nyc_taxi_daily_rollup_invalidate AFTER UPDATE OR DELETE OR TRUNCATE ON nyc_taxi_table
+    FOR EACH STATEMENT EXECUTE FUNCTION nyc_taxi_daily_rollup_invalidate();
+
+
+-- Copy of the SQL Server weather table, kept up to date by
+-- connector_deployment/replicate_weather.py (see db_buddy/tools/weather_replica.py).
+CREATE TABLE IF NOT EXISTS nyc_weather_replica (
+    source_row_version BIGINT PRIMARY KEY,
+    date DATE,
+    max_temp_f INTEGER,
+    low_temp_f INTEGER,
+    condition VARCHAR(50),
+    location VARCHAR(100)
+);
+CREATE INDEX IF NOT EXISTS nyc_weather_replica_date_idx ON nyc_weather_replica (date);
+CREATE TABLE IF NOT EXISTS nyc_weather_replica_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    last_row_version BIGINT NOT NULL,
+    synced_at TIMESTAMPTZ,
+    source_rows BIGINT,
+    rows_copied BIGINT,
+    rows_deleted BIGINT
+);
+INSERT INTO nyc_weather_replica_state (last_row_version) VALUES (0) ON CONFLICT DO NOTHING;
+
+
 -- Grant privileges to the user 'dbbuddy'
-GRANT ALL PRIVILEGES ON TABLE nyc_taxi_table TO dbbuddy;
\ No newline at end of file
+GRANT ALL PRIVILEGES ON TABLE nyc_taxi_table TO dbbuddy;
+GRANT ALL PRIVILEGES ON TABLE nyc_taxi_daily_rollup, nyc_taxi_daily_rollup_state TO dbbuddy;
+GRANT ALL PRIVILEGES ON TABLE nyc_weather_replica, nyc_weather_replica_state TO dbbuddy;
+
+-- Queries sent through the Application Integration connector run as dbbuddy;
+-- stop any that run longer than POSTGRES_STATEMENT_TIMEOUT_MS (see db_buddy/tools/query_guard.py).
+-- Keep this in sync with it, or run `python connector_deployment/db_schema.py postgres`,
+-- which sets the timeout from POSTGRES_STATEMENT_TIMEOUT_MS.
+ALTER ROLE dbbuddy SET statement_timeout = '30s';
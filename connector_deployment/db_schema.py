@@ -0,0 +1,296 @@
+import argparse
+import calendar
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+from bulk_load import add_connection_arguments, bulk_load, connection_from_args
+
+# The rollup tables are defined next to the query rewrite that reads them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_buddy.tools import query_guard, rollups
+
+
+# Creates nyc_taxi_table range-partitioned by month of pickup, with an
+# expression index on the pickup date (every "by day" question groups or
+# filters on DATE(tpep_pickup_datetime)) and indexes on the pickup and drop-off
+# zones. Also indexes the weather table's [date] column in SQL Server and adds
+# the ROWVERSION column replicate_weather.py uses to capture changes. The
+# benchmark loads the same data into a plain and a partitioned, indexed copy of
+# the taxi table and times the prompts.py example queries against both.
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+logger = logging.getLogger(__name__)
+
+TAXI_COLUMNS = [
+    ("VendorID", "INTEGER"),
+    ("tpep_pickup_datetime", "TIMESTAMP NOT NULL"),
+    ("tpep_dropoff_datetime", "TIMESTAMP"),
+    ("passenger_count", "INTEGER"),
+    ("trip_distance", "NUMERIC(10, 2)"),
+    ("RatecodeID", "INTEGER"),
+    ("store_and_fwd_flag", "VARCHAR(1)"),
+    ("PULocationID", "INTEGER"),
+    ("DOLocationID", "INTEGER"),
+    ("payment_type", "INTEGER"),
+    ("fare_amount", "NUMERIC(10, 2)"),
+    ("extra", "NUMERIC(10, 2)"),
+    ("mta_tax", "NUMERIC(10, 2)"),
+    ("tip_amount", "NUMERIC(10, 2)"),
+    ("tolls_amount", "NUMERIC(10, 2)"),
+    ("improvement_surcharge", "NUMERIC(10, 2)"),
+    ("total_amount", "NUMERIC(10, 2)"),
+    ("congestion_surcharge", "NUMERIC(10, 2)"),
+]
+
+WEATHER_TABLE = "nyc-weather-table"
+# The role the Application Integration connector connects as
+CONNECTOR_ROLE = "dbbuddy"
+
+
+def _months(start_month, end_month):
+    year, month = map(int, start_month.split("-"))
+    end_year, end = map(int, end_month.split("-"))
+    while (year, month) <= (end_year, end):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def postgres_taxi_table_ddl(table, start_month, end_month, partitioned=True):
+    """Returns the statements creating the taxi table, its partitions and indexes.
+
+    Months are given as YYYY-MM. Rows outside the range land in a default
+    partition, so loads never fail; add months later with
+    postgres_taxi_partition_ddl. With partitioned=False the original
+    unindexed heap table is created, which the benchmark uses as a baseline.
+    Every statement can be rerun, so running them on an existing table only
+    adds the missing partitions and indexes.
+    """
+    columns = ",\n    ".join(f"{name} {type_}" for name, type_ in TAXI_COLUMNS)
+    if not partitioned:
+        return [f"CREATE TABLE IF NOT EXISTS {table} (\n    {columns}\n)"]
+
+    statements = [
+        f"CREATE TABLE IF NOT EXISTS {table} (\n"
+        f"    trip_id BIGINT GENERATED BY DEFAULT AS IDENTITY,\n"
+        f"    {columns},\n"
+        f"    PRIMARY KEY (trip_id, tpep_pickup_datetime)\n"
+        f") PARTITION BY RANGE (tpep_pickup_datetime)"
+    ]
+    for year, month in _months(start_month, end_month):
+        statements.append(postgres_taxi_partition_ddl(table, year, month))
+    statements.append(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+    # Indexes on the parent are created on every partition, including future ones
+    statements += [
+        f"CREATE INDEX IF NOT EXISTS {table}_pickup_date_idx ON {table} (DATE(tpep_pickup_datetime))",
+        f"CREATE INDEX IF NOT EXISTS {table}_pulocationid_idx ON {table} (PULocationID)",
+        f"CREATE INDEX IF NOT EXISTS {table}_dolocationid_idx ON {table} (DOLocationID)",
+    ]
+    return statements
+
+
+def postgres_taxi_partition_ddl(table, year, month):
+    """Returns the statement creating the partition of the taxi table for one month."""
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {table}_{year:04d}_{month:02d} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{year:04d}-{month:02d}-01') TO ('{next_year:04d}-{next_month:02d}-01')"
+    )
+
+
+def sqlsvr_weather_index_ddl(table=WEATHER_TABLE):
+    """Returns the statement creating the index on the weather table's [date] column."""
+    return (
+        f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_{table}_date') "
+        f"CREATE INDEX [IX_{table}_date] ON [{table}] ([date])"
+    )
+
+
+def apply_postgres_schema(connection, table, start_month, end_month, drop=False, partitioned=True,
+                          with_rollup=False, connector_role=None):
+    """Creates the taxi table with its partitions and indexes, optionally dropping it first.
+
+    with_rollup also creates the daily rollup tables, emptied when the taxi
+    table is dropped. connector_role gets POSTGRES_STATEMENT_TIMEOUT_MS as its
+    statement_timeout.
+    """
+    import psycopg2
+
+    conn = psycopg2.connect(
+        host=connection["host"], port=connection["port"], dbname=connection["database"],
+        user=connection["user"], password=connection["password"],
+    )
+    try:
+        with conn.cursor() as cur:
+            if drop:
+                cur.execute(f"DROP TABLE IF EXISTS {table}")
+            for statement in postgres_taxi_table_ddl(table, start_month, end_month, partitioned):
+                cur.execute(statement)
+            if with_rollup and drop:
+                cur.execute(f"DROP TABLE IF EXISTS {rollups.ROLLUP_TABLE}, {rollups.ROLLUP_STATE_TABLE}")
+        conn.commit()
+        if with_rollup:
+            rollups.create_rollup_tables(conn)
+        if connector_role:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(query_guard.role_statement_timeout_ddl(connector_role))
+                conn.commit()
+            except psycopg2.Error as e:
+                conn.rollback()
+                logger.warning(f"Could not set the statement timeout of {connector_role}: {e}")
+    finally:
+        conn.close()
+    logger.info(f"Created {'partitioned' if partitioned else 'plain'} table {table}")
+
+
+def sqlsvr_weather_rowversion_ddl(table=WEATHER_TABLE):
+    """Returns the statement adding the ROWVERSION column that replicate_weather.py reads."""
+    return (
+        f"IF COL_LENGTH('dbo.[{table}]', 'row_version') IS NULL "
+        f"ALTER TABLE [{table}] ADD [row_version] ROWVERSION"
+    )
+
+
+def apply_sqlsvr_schema(connection, table=WEATHER_TABLE):
+    """Creates the [date] index and the [row_version] column on the weather table."""
+    import pymssql
+
+    conn = pymssql.connect(
+        server=connection["host"], port=connection["port"], database=connection["database"],
+        user=connection["user"], password=connection["password"],
+    )
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sqlsvr_weather_index_ddl(table))
+            cur.execute(sqlsvr_weather_rowversion_ddl(table))
+        conn.commit()
+    finally:
+        conn.close()
+    logger.info(f"Created the [date] index and [row_version] column on {table}")
+
+
+# The prompts.py example questions, plus the per-day and per-zone filters they lead to
+BENCHMARK_QUERIES = {
+    "avg_travel_time_by_day": """
+        SELECT DATE(tpep_pickup_datetime) AS travel_date,
+               AVG(EXTRACT(EPOCH FROM (tpep_dropoff_datetime - tpep_pickup_datetime))) AS average_travel_time_seconds
+        FROM {table} GROUP BY travel_date ORDER BY travel_date""",
+    "avg_travel_time_one_month": """
+        SELECT DATE(tpep_pickup_datetime) AS travel_date,
+               AVG(EXTRACT(EPOCH FROM (tpep_dropoff_datetime - tpep_pickup_datetime))) AS average_travel_time_seconds
+        FROM {table}
+        WHERE tpep_pickup_datetime >= '2020-07-01' AND tpep_pickup_datetime < '2020-08-01'
+        GROUP BY travel_date ORDER BY travel_date""",
+    "rides_on_one_day": """
+        SELECT COUNT(*), AVG(fare_amount) FROM {table}
+        WHERE DATE(tpep_pickup_datetime) = '2020-07-10'""",
+    "rides_from_one_zone": """
+        SELECT DATE(tpep_pickup_datetime) AS travel_date, COUNT(*) FROM {table}
+        WHERE PULocationID = 161 GROUP BY travel_date ORDER BY travel_date""",
+}
+
+
+def run_benchmark(connection, data_dir=None, rows=1_000_000, repeat=5, start_month="2020-01", end_month="2021-12"):
+    """Times BENCHMARK_QUERIES on a plain and on a partitioned, indexed taxi table.
+
+    Loads the files in data_dir, or generates `rows` rows with generate_data.py.
+    Returns a dictionary of query name to the median seconds on each table.
+    """
+    import psycopg2
+
+    if data_dir is None:
+        from generate_data import TAXI_TABLE, generate
+
+        data_dir = tempfile.mkdtemp(prefix="db-buddy-bench-")
+        end_year, end = map(int, end_month.split("-"))
+        last_day = calendar.monthrange(end_year, end)[1]
+        generate(data_dir, rows, start_date=f"{start_month}-01", end_date=f"{end_month}-{last_day:02d}")
+        data_dir = os.path.join(data_dir, TAXI_TABLE)
+
+    tables = {"plain": "nyc_taxi_table_bench_plain", "tuned": "nyc_taxi_table_bench_tuned"}
+    for variant, table in tables.items():
+        apply_postgres_schema(connection, table, start_month, end_month, drop=True, partitioned=variant == "tuned")
+        bulk_load("postgres", [data_dir], table, connection, truncate=True)
+
+    conn = psycopg2.connect(
+        host=connection["host"], port=connection["port"], dbname=connection["database"],
+        user=connection["user"], password=connection["password"],
+    )
+    results = {}
+    try:
+        with conn.cursor() as cur:
+            for table in tables.values():
+                cur.execute(f"ANALYZE {table}")
+            conn.commit()
+            for name, query in BENCHMARK_QUERIES.items():
+                results[name] = {}
+                for variant, table in tables.items():
+                    timings = []
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        cur.execute(query.format(table=table))
+                        cur.fetchall()
+                        timings.append(time.perf_counter() - started)
+                    results[name][variant] = statistics.median(timings)
+        with conn.cursor() as cur:
+            for table in tables.values():
+                cur.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.commit()
+    finally:
+        conn.close()
+    return results
+
+
+def print_benchmark(results):
+    print(f"\n{'query':<28}{'plain (ms)':>12}{'tuned (ms)':>12}{'speedup':>10}")
+    for name, timing in results.items():
+        plain_ms, tuned_ms = timing["plain"] * 1000, timing["tuned"] * 1000
+        print(f"{name:<28}{plain_ms:>12.1f}{tuned_ms:>12.1f}{plain_ms / tuned_ms:>9.1f}x")
+
+
+def main():
+    """Creates the partitioned taxi table and indexes, or benchmarks them."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Create or benchmark the DB Buddy table layout.")
+    parser.add_argument("command", choices=["postgres", "sqlsvr", "benchmark"],
+                        help="Create the Postgres taxi table, the SQL Server weather index and row version, or run the benchmark")
+    parser.add_argument("--table", help="Table name (default: GOOGLE_CLOUD_<TARGET>_TABLE)")
+    parser.add_argument("--start-month", default="2020-01", help="First monthly partition (YYYY-MM)")
+    parser.add_argument("--end-month", default="2021-12", help="Last monthly partition (YYYY-MM)")
+    parser.add_argument("--drop", action="store_true", help="Drop the existing taxi table first")
+    parser.add_argument("--data-dir", help="Benchmark: taxi data files to load (default: generate --rows rows)")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Benchmark: rows to generate")
+    parser.add_argument("--repeat", type=int, default=5, help="Benchmark: runs per query")
+    add_connection_arguments(parser)
+    args = parser.parse_args()
+
+    target = "sqlsvr" if args.command == "sqlsvr" else "postgres"
+    connection = connection_from_args(args, target)
+    if args.command == "benchmark":
+        print_benchmark(run_benchmark(connection, args.data_dir, args.rows, args.repeat,
+                                      args.start_month, args.end_month))
+        return
+
+    table = args.table or os.getenv(f"GOOGLE_CLOUD_{target.upper()}_TABLE")
+    if not table:
+        parser.error(f"set --table or GOOGLE_CLOUD_{target.upper()}_TABLE")
+    try:
+        if args.command == "postgres":
+            apply_postgres_schema(connection, table, args.start_month, args.end_month, drop=args.drop,
+                                  with_rollup=table == rollups.TAXI_TABLE, connector_role=CONNECTOR_ROLE)
+        else:
+            apply_sqlsvr_schema(connection, table)
+    except Exception as e:
+        logger.error(f"Could not create the schema: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
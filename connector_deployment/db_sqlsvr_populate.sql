@@ -12,9 +12,14 @@ CREATE TABLE [nyc-weather-table] (
     [max_temp_f] INT,
     [low_temp_f] INT,
     [condition] VARCHAR(50),
-    [location] VARCHAR(100)
+    [location] VARCHAR(100),
+    -- Read by connector_deployment/replicate_weather.py to capture changes
+    [row_version] ROWVERSION
 );
 
+PRINT 'Creating the [date] index...';
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_nyc-weather-table_date') CREATE INDEX [IX_nyc-weather-table_date] ON [nyc-weather-table] ([date]);
+
 PRINT 'Inserting 30 rows of data...';
 INSERT INTO [nyc-weather-table] ([date], [max_temp_f], [low_temp_f], [condition], [location])
 VALUES
@@ -0,0 +1,91 @@
+import base64
+import hashlib
+import os
+import shutil
+import threading
+
+from google.api_core import exceptions
+
+
+# A filesystem stand-in for a Cloud Storage bucket, used to exercise the RAG
+# upload code offline. It implements the parts of google.cloud.storage's
+# Bucket and Blob that rag_create.py uses. Objects are files under a root
+# directory, and the first `failures_per_object` uploads of each object raise
+# ServiceUnavailable so the retry path can be tested.
+
+
+def _md5_base64(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return base64.b64encode(digest.digest()).decode()
+
+
+class LocalBlob:
+    def __init__(self, bucket, name, chunk_size=None):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size
+        self.md5_hash = None
+        self.generation = None
+
+    @property
+    def _path(self):
+        return os.path.join(self.bucket.root, self.name)
+
+    def _maybe_fail(self):
+        with self.bucket._lock:
+            attempts = self.bucket.upload_attempts.get(self.name, 0) + 1
+            self.bucket.upload_attempts[self.name] = attempts
+        if attempts <= self.bucket.failures_per_object:
+            raise exceptions.ServiceUnavailable(f"Simulated failure uploading {self.name}")
+
+    def exists(self):
+        return os.path.exists(self._path)
+
+    def reload(self):
+        if not self.exists():
+            raise exceptions.NotFound(f"{self.name} not found")
+        self.md5_hash = _md5_base64(self._path)
+        self.generation = os.stat(self._path).st_mtime_ns
+
+    def upload_from_filename(self, filename, if_generation_match=None, **kwargs):
+        self._maybe_fail()
+        if if_generation_match is not None:
+            generation = os.stat(self._path).st_mtime_ns if self.exists() else 0
+            if generation != if_generation_match:
+                raise exceptions.PreconditionFailed(f"{self.name} has generation {generation}")
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        shutil.copyfile(filename, self._path)
+
+    def upload_from_string(self, data, content_type=None, **kwargs):
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with open(self._path, "wb") as f:
+            f.write(data.encode() if isinstance(data, str) else data)
+
+    def download_as_text(self):
+        if not self.exists():
+            raise exceptions.NotFound(f"{self.name} not found")
+        with open(self._path) as f:
+            return f.read()
+
+    def delete(self):
+        if not self.exists():
+            raise exceptions.NotFound(f"{self.name} not found")
+        os.remove(self._path)
+
+
+class LocalBucket:
+    """A bucket whose objects are files under root."""
+
+    def __init__(self, root, name="local-bucket", failures_per_object=0):
+        self.root = root
+        self.name = name
+        self.failures_per_object = failures_per_object
+        self.upload_attempts = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def blob(self, name, chunk_size=None):
+        return LocalBlob(self, name, chunk_size=chunk_size)
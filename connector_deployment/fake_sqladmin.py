@@ -0,0 +1,147 @@
+import itertools
+import json
+import threading
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+# An in-memory stand-in for the Cloud SQL Admin API (sqladmin v1beta4), used to
+# exercise the provisioning code offline. It mirrors the discovery client's
+# resource().method(**kwargs).execute() shape. Instances and operations move
+# through their states after a configurable number of status checks.
+
+
+def _http_error(status, message):
+    resp = httplib2.Response({"status": status})
+    resp.reason = message
+    return HttpError(resp, json.dumps({"error": {"message": message}}).encode())
+
+
+class _Request:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self, **kwargs):
+        return self._fn()
+
+
+class _Resource:
+    def __init__(self, service, methods):
+        self._service = service
+        self._methods = methods
+
+    def __getattr__(self, name):
+        if name not in self._methods:
+            raise AttributeError(name)
+        method = self._methods[name]
+        return lambda **kwargs: _Request(lambda: method(**kwargs))
+
+
+class FakeSqlAdminService:
+    """In-memory Cloud SQL Admin API with instances, databases, users and operations."""
+
+    def __init__(self, polls_until_done=2, polls_until_runnable=2):
+        self.polls_until_done = polls_until_done
+        self.polls_until_runnable = polls_until_runnable
+        self.instances_db = {}
+        self.databases_db = {}
+        self.users_db = {}
+        self.operations_db = {}
+        self.calls = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _record(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    def _operation(self, on_done=None):
+        with self._lock:
+            name = f"operation-{next(self._ids)}"
+            self.operations_db[name] = {"polls": 0, "on_done": on_done}
+        return {"name": name, "status": "PENDING"}
+
+    # instances
+    def _instances_get(self, project, instance):
+        self._record(("instances.get", instance))
+        with self._lock:
+            if instance not in self.instances_db:
+                raise _http_error(404, f"Instance {instance} not found")
+            record = self.instances_db[instance]
+            if record["state"] == "PENDING_CREATE":
+                record["polls"] += 1
+                if record["polls"] >= self.polls_until_runnable:
+                    record["state"] = "RUNNABLE"
+            return {k: v for k, v in record.items() if k != "polls"}
+
+    def _instances_insert(self, project, body):
+        self._record(("instances.insert", body["name"]))
+        with self._lock:
+            if body["name"] in self.instances_db:
+                raise _http_error(409, f"Instance {body['name']} already exists")
+            self.instances_db[body["name"]] = {**body, "state": "PENDING_CREATE", "polls": 0}
+        return self._operation()
+
+    def _instances_patch(self, project, instance, body):
+        self._record(("instances.patch", instance))
+        with self._lock:
+            self.instances_db[instance]["settings"] = body.get("settings", {})
+        return self._operation()
+
+    # databases
+    def _databases_get(self, project, instance, database):
+        self._record(("databases.get", database))
+        with self._lock:
+            if (instance, database) not in self.databases_db:
+                raise _http_error(404, f"Database {database} not found")
+            return self.databases_db[(instance, database)]
+
+    def _databases_insert(self, project, instance, body):
+        self._record(("databases.insert", body["name"]))
+
+        def create():
+            self.databases_db[(instance, body["name"])] = dict(body)
+
+        return self._operation(on_done=create)
+
+    # users
+    def _users_insert(self, project, instance, body):
+        self._record(("users.insert", body["name"]))
+        with self._lock:
+            if (instance, body["name"]) in self.users_db:
+                raise _http_error(409, f"User {body['name']} already exists")
+            self.users_db[(instance, body["name"])] = dict(body)
+        return self._operation()
+
+    # operations
+    def _operations_get(self, project, operation):
+        self._record(("operations.get", operation))
+        with self._lock:
+            record = self.operations_db[operation]
+            record["polls"] += 1
+            if record["polls"] < self.polls_until_done:
+                return {"name": operation, "status": "RUNNING"}
+            if record["on_done"] is not None:
+                record["on_done"]()
+                record["on_done"] = None
+            return {"name": operation, "status": "DONE"}
+
+    def instances(self):
+        return _Resource(self, {
+            "get": self._instances_get,
+            "insert": self._instances_insert,
+            "patch": self._instances_patch,
+        })
+
+    def databases(self):
+        return _Resource(self, {
+            "get": self._databases_get,
+            "insert": self._databases_insert,
+        })
+
+    def users(self):
+        return _Resource(self, {"insert": self._users_insert})
+
+    def operations(self):
+        return _Resource(self, {"get": self._operations_get})
@@ -0,0 +1,210 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+
+# Generates synthetic nyc_taxi_table and nyc-weather-table data at any scale
+# for benchmarks and load tests. Rows are generated with vectorized numpy in
+# fixed-size parts, so memory stays bounded at any row count. Each part draws
+# from its own generator seeded with (seed, part), so output is reproducible
+# and parts can be generated in parallel. Taxi pickups and weather days cover
+# the same date range, so every trip joins to a weather row. The part files
+# are the partitions bulk_load.py loads in parallel.
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+logger = logging.getLogger(__name__)
+
+TAXI_TABLE = "nyc_taxi_table"
+WEATHER_TABLE = "nyc-weather-table"
+NUM_LOCATIONS = 265
+DEFAULT_ROWS_PER_PART = 1_000_000
+
+# Relative pickup volume per hour of day, with morning and evening peaks
+HOURLY_WEIGHTS = np.array([
+    3, 2, 1.5, 1, 1, 1.5, 3, 5, 6, 6, 5.5, 5.5,
+    6, 6, 6.5, 7, 7.5, 8, 8.5, 8, 7, 6.5, 5.5, 4.5,
+])
+HOURLY_WEIGHTS = HOURLY_WEIGHTS / HOURLY_WEIGHTS.sum()
+
+WEATHER_CONDITIONS = np.array(["sunny", "cloudy", "windy", "rain", "snow"])
+
+
+def _location_weights(seed):
+    # Zipf-like popularity, assigned to zones in a fixed shuffled order
+    weights = 1.0 / np.arange(1, NUM_LOCATIONS + 1) ** 1.1
+    np.random.default_rng(seed + 1).shuffle(weights)
+    return weights / weights.sum()
+
+
+def _days(start_date, end_date):
+    return np.arange(np.datetime64(start_date), np.datetime64(end_date) + 1, dtype="datetime64[D]")
+
+
+def generate_taxi_part(rows, start_date, end_date, seed, part):
+    """Generates one part of nyc_taxi_table as a pyarrow Table."""
+    rng = np.random.default_rng([seed, part])
+    days = _days(start_date, end_date)
+
+    day = rng.choice(days, size=rows)
+    seconds = rng.choice(24, size=rows, p=HOURLY_WEIGHTS) * 3600 + rng.integers(0, 3600, size=rows)
+    pickup = day.astype("datetime64[s]") + seconds.astype("timedelta64[s]")
+
+    distance = np.round(np.clip(rng.lognormal(0.6, 0.8, size=rows), 0, 60), 2)
+    # Average speeds around 11 mph, slower for short hops
+    speed_mph = np.clip(rng.gamma(6.0, 11 / 6.0, size=rows), 2, 45)
+    duration_s = (distance / speed_mph * 3600 + rng.integers(60, 300, size=rows)).astype(np.int64)
+    dropoff = pickup + duration_s.astype("timedelta64[s]")
+
+    location_weights = _location_weights(seed)
+    payment_type = rng.choice([1, 2, 3, 4], size=rows, p=[0.70, 0.27, 0.02, 0.01])
+    fare = np.round(2.5 + 2.5 * distance + 0.5 * duration_s / 60, 2)
+    extra = rng.choice([0.0, 0.5, 1.0, 2.5], size=rows, p=[0.45, 0.3, 0.15, 0.1])
+    mta_tax = np.full(rows, 0.5)
+    tip = np.where(payment_type == 1, np.round(fare * rng.uniform(0.1, 0.3, size=rows), 2), 0.0)
+    tolls = np.where(rng.random(rows) < 0.05, 6.12, 0.0)
+    improvement = np.full(rows, 0.3)
+    congestion = np.where(rng.random(rows) < 0.75, 2.5, 0.0)
+    total = np.round(fare + extra + mta_tax + tip + tolls + improvement + congestion, 2)
+
+    return pa.table({
+        "VendorID": rng.choice([1, 2], size=rows, p=[0.35, 0.65]).astype(np.int32),
+        "tpep_pickup_datetime": pickup,
+        "tpep_dropoff_datetime": dropoff,
+        "passenger_count": rng.choice(
+            np.arange(1, 7), size=rows, p=[0.70, 0.14, 0.05, 0.03, 0.05, 0.03]
+        ).astype(np.int32),
+        "trip_distance": distance,
+        "RatecodeID": rng.choice(
+            [1, 2, 3, 4, 5], size=rows, p=[0.96, 0.02, 0.005, 0.005, 0.01]
+        ).astype(np.int32),
+        "store_and_fwd_flag": np.where(rng.random(rows) < 0.01, "Y", "N"),
+        "PULocationID": (rng.choice(NUM_LOCATIONS, size=rows, p=location_weights) + 1).astype(np.int32),
+        "DOLocationID": (rng.choice(NUM_LOCATIONS, size=rows, p=location_weights) + 1).astype(np.int32),
+        "payment_type": payment_type.astype(np.int32),
+        "fare_amount": fare,
+        "extra": extra,
+        "mta_tax": mta_tax,
+        "tip_amount": tip,
+        "tolls_amount": tolls,
+        "improvement_surcharge": improvement,
+        "total_amount": total,
+        "congestion_surcharge": congestion,
+    })
+
+
+def generate_weather(start_date, end_date, seed):
+    """Generates one nyc-weather-table row per day as a pyarrow Table."""
+    rng = np.random.default_rng(seed)
+    days = _days(start_date, end_date)
+    day_of_year = (days - days.astype("datetime64[Y]")).astype(np.int64)
+
+    # Seasonal highs peak in late July, with day-to-day noise
+    max_temp = np.round(
+        55 + 25 * np.sin(2 * np.pi * (day_of_year - 110) / 365) + rng.normal(0, 6, size=len(days))
+    ).astype(np.int32)
+    low_temp = (max_temp - rng.integers(8, 17, size=len(days))).astype(np.int32)
+    condition = rng.choice(WEATHER_CONDITIONS[:4], size=len(days), p=[0.45, 0.25, 0.1, 0.2])
+    # Precipitation falls as snow on cold days
+    condition = np.where((condition == "rain") & (max_temp <= 34), "snow", condition)
+
+    return pa.table({
+        "date": days,
+        "max_temp_f": max_temp,
+        "low_temp_f": low_temp,
+        "condition": condition,
+        "location": np.full(len(days), "new york city"),
+    })
+
+
+def write_table(table, path, file_format):
+    if file_format == "parquet":
+        pq.write_table(table, path)
+    else:
+        pa_csv.write_csv(table, path, pa_csv.WriteOptions(quoting_style="none"))
+
+
+def _write_taxi_part(out_dir, rows, start_date, end_date, seed, part, file_format):
+    table = generate_taxi_part(rows, start_date, end_date, seed, part)
+    path = os.path.join(out_dir, f"part-{part:05d}.{file_format}")
+    write_table(table, path, file_format)
+    return path
+
+
+def generate(out_dir, taxi_rows, start_date="2020-01-01", end_date="2021-12-31", seed=42,
+             file_format="parquet", rows_per_part=DEFAULT_ROWS_PER_PART, workers=None):
+    """Writes taxi and weather data under out_dir/<table>/ and returns the paths written."""
+    taxi_dir = os.path.join(out_dir, TAXI_TABLE)
+    weather_dir = os.path.join(out_dir, WEATHER_TABLE)
+    os.makedirs(taxi_dir, exist_ok=True)
+    os.makedirs(weather_dir, exist_ok=True)
+
+    started = time.monotonic()
+    weather_path = os.path.join(weather_dir, f"part-00000.{file_format}")
+    write_table(generate_weather(start_date, end_date, seed), weather_path, file_format)
+
+    parts = [
+        (part, min(rows_per_part, taxi_rows - start))
+        for part, start in enumerate(range(0, taxi_rows, rows_per_part))
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_write_taxi_part, taxi_dir, rows, start_date, end_date, seed, part, file_format)
+            for part, rows in parts
+        ]
+        taxi_paths = []
+        for (part, rows), future in zip(parts, futures):
+            taxi_paths.append(future.result())
+            logger.info(f"Wrote {TAXI_TABLE} part {part + 1}/{len(parts)} ({rows} rows)")
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"Generated {taxi_rows} taxi rows and weather for {start_date}..{end_date} "
+        f"in {elapsed:.1f}s ({taxi_rows / elapsed:,.0f} rows/s)"
+    )
+    return {TAXI_TABLE: taxi_paths, WEATHER_TABLE: [weather_path]}
+
+
+def _row_count(value):
+    # Accepts 1000, 1_000, 10K, 5M, 1B
+    multipliers = {"K": 10**3, "M": 10**6, "B": 10**9}
+    value = value.replace("_", "").upper()
+    if value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+
+def main():
+    """Generates synthetic taxi and weather data files."""
+    parser = argparse.ArgumentParser(description="Generate synthetic NYC taxi and weather data.")
+    parser.add_argument("--rows", type=_row_count, default=1000, help="Taxi rows to generate, e.g. 1K, 10M, 100M")
+    parser.add_argument("--start-date", default="2020-01-01", help="First pickup and weather date")
+    parser.add_argument("--end-date", default="2021-12-31", help="Last pickup and weather date")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed; the same arguments give the same data")
+    parser.add_argument("--format", choices=["parquet", "csv"], default="parquet", help="Output file format")
+    parser.add_argument("--rows-per-part", type=_row_count, default=DEFAULT_ROWS_PER_PART, help="Taxi rows per output file")
+    parser.add_argument("--workers", type=int, help="Parts generated in parallel (default: CPU count)")
+    parser.add_argument("--out-dir", default="data", help="Output directory")
+    args = parser.parse_args()
+
+    generate(
+        args.out_dir,
+        args.rows,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        seed=args.seed,
+        file_format=args.format,
+        rows_per_part=args.rows_per_part,
+        workers=args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+import db_deploy
+from fake_sqladmin import FakeSqlAdminService
+
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(threadName)s] %(message)s")
+logger = logging.getLogger(__name__)
+
+ALL_TARGETS = ["postgres", "sqlsvr", "rag"]
+
+
+def run_graph(steps):
+    """Runs steps concurrently, each as soon as the steps it depends on have succeeded.
+
+    steps maps a step name to (dependencies, fn); fn receives a dict of the
+    results of its dependencies. Returns a dict of step name to a report with
+    status, start offset, duration and result.
+    """
+    report = {}
+    started = time.monotonic()
+    pending = dict(steps)
+    running = {}
+
+    def run(name, fn, inputs):
+        step_started = time.monotonic()
+        report[name]["start_s"] = round(step_started - started, 2)
+        try:
+            return fn(inputs)
+        finally:
+            report[name]["duration_s"] = round(time.monotonic() - step_started, 2)
+
+    with ThreadPoolExecutor(max_workers=len(steps) or 1) as executor:
+        while pending or running:
+            for name, (deps, fn) in list(pending.items()):
+                if any(report.get(d, {}).get("status") in ("failed", "skipped") for d in deps):
+                    report[name] = {"status": "skipped", "start_s": None, "duration_s": 0}
+                    logger.error(f"Skipping '{name}' because a dependency failed")
+                    del pending[name]
+                elif all(report.get(d, {}).get("status") == "ok" for d in deps):
+                    report[name] = {"status": "running"}
+                    inputs = {d: report[d]["result"] for d in deps}
+                    running[executor.submit(run, name, fn, inputs)] = name
+                    del pending[name]
+
+            if not running:
+                # Whatever is still pending depends on steps that never ran
+                for name in pending:
+                    report[name] = {"status": "skipped", "start_s": None, "duration_s": 0}
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    result = future.result()
+                    # Steps signal failure by returning False or exiting
+                    report[name]["status"] = "failed" if result is False else "ok"
+                    report[name]["result"] = result
+                except BaseException as e:
+                    logger.error(f"Step '{name}' failed: {e!r}")
+                    report[name]["status"] = "failed"
+                    report[name]["result"] = None
+
+    report["total"] = {"duration_s": round(time.monotonic() - started, 2)}
+    return report
+
+
+def print_timing_report(report):
+    """Prints per-step timings and the time saved by running steps in parallel."""
+    total = report.pop("total")["duration_s"]
+    print("\nProvisioning timing report")
+    print(f"{'step':<12}{'status':<10}{'start (s)':>10}{'duration (s)':>14}")
+    for name, step in report.items():
+        start = "-" if step.get("start_s") is None else step["start_s"]
+        print(f"{name:<12}{step['status']:<10}{start:>10}{step['duration_s']:>14}")
+    sequential = sum(step["duration_s"] for step in report.values())
+    print(f"\nWall time: {total}s (sequential would be about {round(sequential, 2)}s)")
+
+
+def build_steps(targets, fake=False):
+    """Builds the provisioning dependency graph for the requested targets."""
+    service = FakeSqlAdminService() if fake else None
+    db_deps = [] if fake else ["iam"]
+    steps = {}
+
+    if not fake and ({"postgres", "sqlsvr"} & set(targets)):
+        def iam(_):
+            user = db_deploy.get_gcloud_user()
+            db_deploy.add_iam_policy_binding(os.getenv("GOOGLE_CLOUD_PROJECT_ID"), user)
+            return user
+        steps["iam"] = ([], iam)
+
+    for db_type in ("postgres", "sqlsvr"):
+        if db_type in targets:
+            steps[db_type] = (
+                db_deps,
+                lambda inputs, db_type=db_type: db_deploy.deploy_database(
+                    db_type,
+                    service=service,
+                    gcloud_user=inputs.get("iam"),
+                    bind_iam_policy=False,
+                ),
+            )
+
+    if "rag" in targets:
+        if fake:
+            logger.info("Skipping the RAG corpus in --fake mode")
+        else:
+            def rag(_):
+                import rag_create
+                rag_create.main([])
+            steps["rag"] = ([], rag)
+
+    return steps
+
+
+def _default_env(key, value):
+    if not os.getenv(key):
+        os.environ[key] = value
+
+
+def main():
+    """Provisions the Postgres, SQL Server and RAG back ends concurrently."""
+    parser = argparse.ArgumentParser(description="Provision all DB Buddy back end services in parallel.")
+    parser.add_argument(
+        "targets",
+        nargs="*",
+        metavar="{postgres,sqlsvr,rag}",
+        help="Back ends to provision (default: all)",
+    )
+    parser.add_argument(
+        "--fake",
+        action="store_true",
+        help="Run against an in-memory Cloud SQL Admin API instead of Google Cloud",
+    )
+    args = parser.parse_args()
+    unknown = set(args.targets) - set(ALL_TARGETS)
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(sorted(unknown))}")
+    load_dotenv()
+
+    if args.fake:
+        db_deploy.POLL_INITIAL_DELAY_SECONDS = 0.01
+        db_deploy.POLL_MAX_DELAY_SECONDS = 0.05
+        for db_type in ("POSTGRES", "SQLSVR"):
+            for key, value in {
+                "INSTANCE": f"fake-{db_type.lower()}-instance",
+                "DB": f"fake-{db_type.lower()}-db",
+                "REGION": "us-central1",
+                "VERSION": f"FAKE_{db_type}",
+                "INSTANCE_TIER": "db-fake",
+                "PASSWORD": "fake",
+            }.items():
+                _default_env(f"GOOGLE_CLOUD_{db_type}_{key}", value)
+        _default_env("GOOGLE_CLOUD_PROJECT_ID", "fake-project")
+        _default_env("GOOGLE_CLOUD_STORAGE_BUCKET_DOCS", "fake-bucket")
+        _default_env("GOOGLE_CLOUD_STORAGE_REGION", "us-central1")
+
+    report = run_graph(build_steps(args.targets or ALL_TARGETS, fake=args.fake))
+    print_timing_report(report)
+    if any(step["status"] != "ok" for step in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
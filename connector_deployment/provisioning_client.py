@@ -0,0 +1,62 @@
+import threading
+
+import google.auth
+import google_auth_httplib2
+import httplib2
+from googleapiclient import discovery
+
+
+# Shared client layer for the provisioning scripts. Services are built from the
+# discovery documents bundled with google-api-python-client, so building one
+# needs no network call. Credentials are loaded once per process, and each
+# thread reuses one authorized HTTP session and one built service per API
+# (httplib2 sessions are not thread-safe, so they are not shared across threads).
+
+_credentials_lock = threading.Lock()
+_credentials = None
+_local = threading.local()
+
+
+def get_credentials():
+    """Returns the application default credentials, loaded once per process."""
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials, _ = google.auth.default(
+                scopes=["https://www.googleapis.com/auth/cloud-platform"]
+            )
+        return _credentials
+
+
+def get_authorized_http():
+    """Returns this thread's authorized HTTP session."""
+    http = getattr(_local, "http", None)
+    if http is None:
+        http = _local.http = google_auth_httplib2.AuthorizedHttp(
+            get_credentials(), http=httplib2.Http(timeout=60)
+        )
+    return http
+
+
+def get_service(api, version):
+    """Returns this thread's client for a Google API, built from its bundled discovery document."""
+    services = getattr(_local, "services", None)
+    if services is None:
+        services = _local.services = {}
+    if (api, version) not in services:
+        services[(api, version)] = discovery.build(
+            api,
+            version,
+            http=get_authorized_http(),
+        )
+    return services[(api, version)]
+
+
+def get_sqladmin_service():
+    """Returns this thread's Cloud SQL Admin API client."""
+    return get_service("sqladmin", "v1beta4")
+
+
+def get_resource_manager_service():
+    """Returns this thread's Cloud Resource Manager API client."""
+    return get_service("cloudresourcemanager", "v1")
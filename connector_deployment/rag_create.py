@@ -1,10 +1,19 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
 import os
+import random
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import vertexai
 from vertexai import rag
 from google.cloud import storage
+from google.cloud.storage.retry import DEFAULT_RETRY
 from google.api_core import exceptions
 
 # Load environment variables
@@ -19,8 +28,421 @@ rag_source_bucket = os.getenv("RAG_SOURCE_BUCKET")
 rag_source_bucket_folder = os.getenv("RAG_SOURCE_BUCKET_FOLDER")
 rag_import_results_bucket_folder = os.getenv("RAG_IMPORT_RESULTS_BUCKET_FOLDER")
 
-def main():
-    """Main function to create a RAG engine."""
+# Content hashes of the last synced source files, stored next to them in GCS
+SYNC_MANIFEST_NAME = ".rag_sync_manifest.json"
+
+# Imports
+IMPORT_POLL_INTERVAL_SECONDS = 10
+
+# Uploads
+UPLOAD_WORKERS = int(os.getenv("RAG_UPLOAD_WORKERS", "8"))
+UPLOAD_MAX_ATTEMPTS = 5
+UPLOAD_INITIAL_RETRY_DELAY_SECONDS = 1.0
+# Files above this size are sent as chunked resumable uploads. Uploads carry
+# a generation precondition, which lets the client retry a failed chunk on its
+# own instead of restarting the whole file
+RESUMABLE_THRESHOLD_BYTES = 8 * 1024 * 1024
+RESUMABLE_CHUNK_BYTES = 8 * 1024 * 1024  # must be a multiple of 256 KiB
+TRANSIENT_UPLOAD_ERRORS = (
+    exceptions.TooManyRequests,
+    exceptions.InternalServerError,
+    exceptions.BadGateway,
+    exceptions.ServiceUnavailable,
+    exceptions.GatewayTimeout,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _md5_base64(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return base64.b64encode(digest.digest()).decode()
+
+
+def list_source_files(source_folder, bucket_folder):
+    """Returns {gcs_path: local_path} for every file in the RAG source folder.
+
+    Paths relative to the source folder are kept, so files with the same name
+    in different subfolders do not overwrite each other.
+    """
+    files = {}
+    for root, _, names in os.walk(source_folder):
+        for name in names:
+            local_path = os.path.join(root, name)
+            relative_path = os.path.relpath(local_path, source_folder).replace(os.sep, "/")
+            files[f"{bucket_folder.rstrip('/')}/{relative_path}"] = local_path
+    return files
+
+
+def load_sync_manifest(bucket, bucket_folder):
+    """Returns the {gcs_path: sha256} manifest of the last sync, or {} if there is none."""
+    blob = bucket.blob(os.path.join(bucket_folder, SYNC_MANIFEST_NAME))
+    try:
+        return json.loads(blob.download_as_text())
+    except exceptions.NotFound:
+        return {}
+
+
+def write_sync_manifest(bucket, bucket_folder, manifest):
+    blob = bucket.blob(os.path.join(bucket_folder, SYNC_MANIFEST_NAME))
+    blob.upload_from_string(json.dumps(manifest, indent=2, sort_keys=True), content_type="application/json")
+
+
+def upload_file(bucket, gcs_path, local_path, max_attempts=UPLOAD_MAX_ATTEMPTS):
+    """
+    Uploads one file, retrying transient errors with jittered exponential backoff.
+
+    A file whose object already has the same MD5 is skipped, so rerunning an
+    interrupted upload only sends what is missing. The upload only replaces
+    the object generation seen here, so the client retries requests and
+    resumable chunks itself; errors left after its retries restart the file.
+    Returns the bytes sent.
+    """
+    size = os.path.getsize(local_path)
+    md5 = _md5_base64(local_path)
+    chunk_size = RESUMABLE_CHUNK_BYTES if size > RESUMABLE_THRESHOLD_BYTES else None
+    blob = bucket.blob(gcs_path, chunk_size=chunk_size)
+    try:
+        blob.reload()
+        if blob.md5_hash == md5:
+            print(f"File {local_path} already uploaded to gs://{bucket.name}/{gcs_path}, skipping.")
+            return 0
+        generation = blob.generation
+    except exceptions.NotFound:
+        # 0 means the object must not exist yet
+        generation = 0
+
+    delay = UPLOAD_INITIAL_RETRY_DELAY_SECONDS
+    for attempt in range(1, max_attempts + 1):
+        try:
+            blob.upload_from_filename(local_path, if_generation_match=generation, retry=DEFAULT_RETRY)
+            print(f"File {local_path} uploaded to gs://{bucket.name}/{gcs_path}.")
+            return size
+        except exceptions.PreconditionFailed:
+            # A retried request may have written the object already
+            blob.reload()
+            if blob.md5_hash != md5:
+                raise
+            print(f"File {local_path} uploaded to gs://{bucket.name}/{gcs_path}.")
+            return size
+        except TRANSIENT_UPLOAD_ERRORS as e:
+            if attempt == max_attempts:
+                raise
+            wait = random.uniform(delay / 2, delay)
+            print(f"Upload of {local_path} failed ({e}), retrying in {wait:.1f}s...")
+            time.sleep(wait)
+            delay *= 2
+
+
+def upload_files(bucket, files, max_workers=UPLOAD_WORKERS):
+    """Uploads {gcs_path: local_path} to the bucket concurrently and reports throughput.
+
+    Returns a dictionary with the files uploaded, skipped and failed, the
+    bytes sent and the elapsed seconds.
+    """
+    started = time.monotonic()
+    stats = {"uploaded": [], "skipped": [], "failed": [], "bytes": 0}
+    lock = threading.Lock()
+
+    def upload(gcs_path, local_path):
+        try:
+            sent = upload_file(bucket, gcs_path, local_path)
+        except Exception as e:
+            print(f"Error: could not upload {local_path}: {e}")
+            with lock:
+                stats["failed"].append(gcs_path)
+            return
+        with lock:
+            stats["uploaded" if sent else "skipped"].append(gcs_path)
+            stats["bytes"] += sent
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload") as executor:
+        for gcs_path, local_path in files.items():
+            executor.submit(upload, gcs_path, local_path)
+
+    stats["seconds"] = time.monotonic() - started
+    megabytes = stats["bytes"] / (1024 * 1024)
+    print(
+        f"Uploaded {len(stats['uploaded'])} files ({megabytes:.1f} MiB) in {stats['seconds']:.1f}s "
+        f"({megabytes / max(stats['seconds'], 1e-6):.1f} MiB/s), {len(stats['skipped'])} already "
+        f"up to date, {len(stats['failed'])} failed."
+    )
+    return stats
+
+
+def get_or_create_corpus(display_name):
+    """Returns the RAG corpus with this display name, creating it if needed."""
+    for corpus in rag.list_corpora():
+        if corpus.display_name == display_name:
+            print(f"Using existing RAG Corpus '{display_name}' ({corpus.name}).")
+            return corpus
+    print(f"Creating RAG Corpus '{display_name}'...")
+    corpus = rag.create_corpus(display_name=display_name)
+    print(f"RAG Corpus {corpus.name} created successfully.")
+    return corpus
+
+
+def list_corpus_files_by_uri(corpus_name):
+    """Returns {gcs_uri: [RagFile, ...]} for the files in a corpus, newest first."""
+    by_uri = {}
+    for rag_file in rag.list_files(corpus_name=corpus_name):
+        for uri in rag_file.gcs_source.uris:
+            by_uri.setdefault(uri, []).append(rag_file)
+    for files in by_uri.values():
+        files.sort(key=lambda f: f.create_time.timestamp(), reverse=True)
+    return by_uri
+
+
+def build_import_options(chunk_size=None, chunk_overlap=None, layout_parser_processor=None,
+                         llm_parser_model=None, parsing_requests_per_min=None,
+                         embedding_requests_per_min=None):
+    """Builds the rag.import_files keyword arguments for chunking, parsing and embedding."""
+    options = {}
+    if chunk_size is not None or chunk_overlap is not None:
+        options["transformation_config"] = rag.TransformationConfig(
+            chunking_config=rag.ChunkingConfig(
+                chunk_size=chunk_size or 1024,
+                chunk_overlap=chunk_overlap if chunk_overlap is not None else 200,
+            )
+        )
+    if layout_parser_processor:
+        options["layout_parser"] = rag.LayoutParserConfig(
+            processor_name=layout_parser_processor,
+            max_parsing_requests_per_min=parsing_requests_per_min,
+        )
+    elif llm_parser_model:
+        options["llm_parser"] = rag.LlmParserConfig(
+            model_name=llm_parser_model,
+            max_parsing_requests_per_min=parsing_requests_per_min,
+        )
+    if embedding_requests_per_min:
+        options["max_embedding_requests_per_min"] = embedding_requests_per_min
+    return options
+
+
+def import_files(corpus_name, paths, bucket, import_options=None, poll_interval_s=IMPORT_POLL_INTERVAL_SECONDS):
+    """
+    Imports files into the corpus as a long-running operation, printing progress.
+
+    Per-file results are written as NDJSON to RAG_IMPORT_RESULTS_BUCKET_FOLDER
+    in the bucket when it is set. Returns the ImportRagFilesResponse.
+    """
+    options = dict(import_options or {})
+    if rag_import_results_bucket_folder:
+        # The sink must be a new object for every import
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        options["import_result_sink"] = (
+            f"gs://{bucket.name}/{rag_import_results_bucket_folder.strip('/')}/"
+            f"import-{stamp}-{random.randrange(16**6):06x}.ndjson"
+        )
+
+    async def run():
+        operation = await rag.import_files_async(corpus_name=corpus_name, paths=paths, **options)
+        print(f"Import operation {operation.operation.name} started for {len(paths)} files.")
+        while not await operation.done():
+            progress = getattr(operation.metadata, "progress_percentage", None)
+            elapsed = time.monotonic() - started
+            print(f"Import in progress: {progress or 0}% after {elapsed:.0f}s...")
+            await asyncio.sleep(poll_interval_s)
+        return await operation.result()
+
+    started = time.monotonic()
+    response = asyncio.run(run())
+    elapsed = time.monotonic() - started
+    print(
+        f"Import finished in {elapsed:.1f}s: {response.imported_rag_files_count} imported, "
+        f"{response.skipped_rag_files_count} skipped, {response.failed_rag_files_count} failed "
+        f"({len(paths) / max(elapsed, 1e-6):.2f} files/s)."
+    )
+    if "import_result_sink" in options:
+        print(f"Per-file results: {options['import_result_sink']}")
+    return response
+
+
+def sync_corpus(bucket, source_folder, bucket_folder, corpus_display_name, upload_workers=UPLOAD_WORKERS,
+                import_options=None):
+    """
+    Brings the corpus in line with the source folder, touching only what changed.
+
+    New and changed files are uploaded and imported, and files removed locally
+    are deleted from the bucket and the corpus. A changed file is imported
+    before its old RagFile is deleted, so it stays searchable throughout.
+    Returns a dictionary of gcs_path lists per change type.
+    """
+    started = time.monotonic()
+    files = list_source_files(source_folder, bucket_folder)
+    hashes = {gcs_path: _sha256(local_path) for gcs_path, local_path in files.items()}
+    manifest = load_sync_manifest(bucket, bucket_folder)
+    changes = {
+        "added": sorted(p for p in files if p not in manifest),
+        "changed": sorted(p for p in files if p in manifest and manifest[p] != hashes[p]),
+        "removed": sorted(p for p in manifest if p not in files),
+    }
+    changes["unchanged"] = sorted(p for p in files if manifest.get(p) == hashes[p])
+    print(
+        f"Sync: {len(changes['added'])} added, {len(changes['changed'])} changed, "
+        f"{len(changes['removed'])} removed, {len(changes['unchanged'])} unchanged."
+    )
+
+    to_import = changes["added"] + changes["changed"]
+    upload_failed = upload_files(bucket, {p: files[p] for p in to_import}, upload_workers)["failed"]
+    to_import = [p for p in to_import if p not in upload_failed]
+
+    corpus = get_or_create_corpus(corpus_display_name)
+
+    def uri(gcs_path):
+        return f"gs://{bucket.name}/{gcs_path}"
+
+    before = list_corpus_files_by_uri(corpus.name)
+    import_started = time.time()
+    if to_import:
+        print(f"Importing {len(to_import)} files into corpus {corpus.name}...")
+        import_files(corpus.name, [uri(p) for p in to_import], bucket, import_options)
+
+    # A changed file imported as a new RagFile leaves the old one behind. If
+    # the import left the existing RagFile untouched instead, that file is
+    # deleted and imported again; only it is briefly missing from the corpus.
+    after = list_corpus_files_by_uri(corpus.name)
+    stale, reimport = [], []
+    for gcs_path in to_import:
+        old_names = {f.name for f in before.get(uri(gcs_path), [])}
+        current = after.get(uri(gcs_path), [])
+        if not current:
+            continue
+        if current[0].name not in old_names:
+            stale += [f.name for f in current[1:]]
+        elif current[0].update_time.timestamp() < import_started:
+            stale += [f.name for f in current]
+            reimport.append(gcs_path)
+    for gcs_path in changes["removed"]:
+        stale += [f.name for f in after.get(uri(gcs_path), [])]
+    for name in stale:
+        print(f"Deleting superseded RagFile {name}...")
+        rag.delete_file(name=name)
+    if reimport:
+        print(f"Re-importing {len(reimport)} files that were not updated in place...")
+        import_files(corpus.name, [uri(p) for p in reimport], bucket, import_options)
+        after = list_corpus_files_by_uri(corpus.name)
+
+    for gcs_path in changes["removed"]:
+        try:
+            bucket.blob(gcs_path).delete()
+        except exceptions.NotFound:
+            pass
+
+    # Files that failed to import stay out of the manifest and are retried next time
+    failed = upload_failed + [p for p in to_import if uri(p) not in after]
+    if failed:
+        print(f"Warning: {len(failed)} files were not imported: {', '.join(failed)}")
+    write_sync_manifest(bucket, bucket_folder, {p: h for p, h in hashes.items() if p not in failed})
+    print(f"Sync finished in {time.monotonic() - started:.1f}s.")
+    return changes
+
+
+def rebuild_corpus(bucket, source_folder, bucket_folder, corpus_display_name, upload_workers=UPLOAD_WORKERS,
+                   import_options=None):
+    """Uploads every file, deletes and recreates the corpus, and imports everything."""
+    files = list_source_files(source_folder, bucket_folder)
+    if upload_files(bucket, files, upload_workers)["failed"]:
+        print("Error: some files could not be uploaded; rerun to retry them.")
+        sys.exit(1)
+    gcs_uris = [f"gs://{bucket.name}/{gcs_path}" for gcs_path in files]
+
+    # Delete existing corpus to force re-import
+    for corpus in rag.list_corpora():
+        if corpus.display_name == corpus_display_name:
+            print(f"Deleting existing RAG Corpus '{corpus_display_name}'...")
+            rag.delete_corpus(name=corpus.name)
+            print("Corpus deleted.")
+            break
+
+    # Create a new RAG Corpus
+    print(f"Creating RAG Corpus '{corpus_display_name}'...")
+    rag_corpus = rag.create_corpus(
+        display_name=corpus_display_name,
+    )
+    print(f"RAG Corpus {rag_corpus.name} created successfully.")
+
+    print(f"Importing files into corpus {rag_corpus.name}...")
+    import_files(rag_corpus.name, gcs_uris, bucket, import_options)
+    write_sync_manifest(bucket, bucket_folder, {p: _sha256(l) for p, l in files.items()})
+
+
+def main(argv=None):
+    """Main function to create or sync a RAG engine."""
+    parser = argparse.ArgumentParser(description="Create or sync the DB Buddy RAG corpus.")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Delete and recreate the corpus and re-import every file instead of syncing changes",
+    )
+    parser.add_argument(
+        "--upload-only",
+        action="store_true",
+        help="Only upload the source files, without touching the corpus",
+    )
+    parser.add_argument(
+        "--local-bucket",
+        metavar="DIR",
+        help="With --upload-only, upload to a directory standing in for the bucket",
+    )
+    parser.add_argument(
+        "--upload-workers",
+        type=int,
+        default=UPLOAD_WORKERS,
+        help="Files uploaded concurrently (default: RAG_UPLOAD_WORKERS or 8)",
+    )
+    parser.add_argument("--chunk-size", type=int, help="Chunk size in tokens (default: the RAG Engine default)")
+    parser.add_argument("--chunk-overlap", type=int, help="Overlap between chunks in tokens")
+    parser.add_argument(
+        "--parser",
+        choices=["default", "layout", "llm"],
+        default="default",
+        help="Document parser: the default parser, a Document AI layout parser, or an LLM parser",
+    )
+    parser.add_argument(
+        "--layout-parser-processor",
+        help="Document AI layout parser processor resource name, for --parser layout",
+    )
+    parser.add_argument("--llm-parser-model", help="Vertex AI model resource name, for --parser llm")
+    parser.add_argument("--parsing-requests-per-min", type=int, help="Rate limit for the layout or LLM parser")
+    parser.add_argument(
+        "--embedding-requests-per-min",
+        type=int,
+        help="Rate limit for embedding requests made by the import (default: 1000)",
+    )
+    args = parser.parse_args(argv)
+    if args.parser == "layout" and not args.layout_parser_processor:
+        parser.error("--parser layout requires --layout-parser-processor")
+    if args.parser == "llm" and not args.llm_parser_model:
+        parser.error("--parser llm requires --llm-parser-model")
+    if args.local_bucket and not args.upload_only:
+        parser.error("--local-bucket requires --upload-only")
+
+    if args.upload_only:
+        if not rag_source_folder or not os.path.isdir(rag_source_folder):
+            print(f"Error: RAG source folder '{rag_source_folder}' not found.")
+            sys.exit(1)
+        if args.local_bucket:
+            from fake_gcs import LocalBucket
+            bucket = LocalBucket(args.local_bucket)
+        else:
+            bucket = storage.Client(project=project_id).get_bucket(rag_source_bucket)
+        files = list_source_files(rag_source_folder, rag_source_bucket_folder or "rag_source")
+        if upload_files(bucket, files, max_workers=args.upload_workers)["failed"]:
+            sys.exit(1)
+        return
 
     # Validate environment variables
     required_env_vars = {
@@ -50,43 +472,26 @@ def main():
         print(f"Bucket {rag_source_bucket} not found. Creating bucket.")
         storage_client.create_bucket(rag_source_bucket, location=rag_engine_region)
         print(f"Bucket {rag_source_bucket} created.")
-
-    # Upload files to GCS
     bucket = storage_client.get_bucket(rag_source_bucket)
-    gcs_uris = []
-    for root, _, files in os.walk(rag_source_folder):
-        for file in files:
-            local_path = os.path.join(root, file)
-            gcs_path = os.path.join(rag_source_bucket_folder, file)
-            blob = bucket.blob(gcs_path)
-            blob.upload_from_filename(local_path)
-            gcs_uris.append(f"gs://{rag_source_bucket}/{gcs_path}")
-            print(f"File {local_path} uploaded to gs://{rag_source_bucket}/{gcs_path}.")
 
     # Initialize Vertex AI
     vertexai.init(project=project_id, location=rag_engine_region)
 
-    # Delete existing corpus to force re-import
-    for corpus in rag.list_corpora():
-        if corpus.display_name == rag_engine_name:
-            print(f"Deleting existing RAG Corpus '{rag_engine_name}'...")
-            rag.delete_corpus(name=corpus.name)
-            print("Corpus deleted.")
-            break
-
-    # Create a new RAG Corpus
-    print(f"Creating RAG Corpus '{rag_engine_name}'...")
-    rag_corpus = rag.create_corpus(
-        display_name=rag_engine_name,
+    import_options = build_import_options(
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        layout_parser_processor=args.layout_parser_processor if args.parser == "layout" else None,
+        llm_parser_model=args.llm_parser_model if args.parser == "llm" else None,
+        parsing_requests_per_min=args.parsing_requests_per_min,
+        embedding_requests_per_min=args.embedding_requests_per_min,
     )
-    print(f"RAG Corpus {rag_corpus.name} created successfully.")
+    if args.rebuild:
+        rebuild_corpus(bucket, rag_source_folder, rag_source_bucket_folder, rag_engine_name,
+                       args.upload_workers, import_options)
+    else:
+        sync_corpus(bucket, rag_source_folder, rag_source_bucket_folder, rag_engine_name,
+                    args.upload_workers, import_options)
 
-    print(f"Importing files into corpus {rag_corpus.name}...")
-    response = rag.import_files(
-        corpus_name=rag_corpus.name,
-        paths=gcs_uris,
-    )
-    print(response)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from bulk_load import add_connection_arguments, connection_from_args
+
+# The rollup tables and their refresh live with the agent's query rewrite
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_buddy.tools import rollups
+
+
+# Brings nyc_taxi_daily_rollup up to date with nyc_taxi_table. New rows are
+# added to the rollup; after an UPDATE, DELETE or TRUNCATE of the taxi table
+# the rollup is rebuilt. The refresh locks the taxi table in SHARE mode, so it
+# waits for running loads and new loads wait for it. The agent only reads the
+# rollup while it is current, and runs the original query otherwise, so run
+# this after each load, or with --every to repeat on a schedule.
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def refresh(connection, rebuild=False):
+    """Refreshes the rollup once. rebuild recomputes every day. Returns the number of days updated."""
+    import psycopg2
+
+    conn = psycopg2.connect(
+        host=connection["host"], port=connection["port"], dbname=connection["database"],
+        user=connection["user"], password=connection["password"],
+    )
+    try:
+        rollups.create_rollup_tables(conn)
+        if rebuild:
+            with conn.cursor() as cur:
+                cur.execute(f"UPDATE {rollups.ROLLUP_STATE_TABLE} SET invalidated = TRUE")
+            conn.commit()
+        days = rollups.refresh_daily_rollup(conn)
+    finally:
+        conn.close()
+    logger.info(f"Refreshed {rollups.ROLLUP_TABLE}: {days} days updated")
+    return days
+
+
+def main():
+    """Refreshes the daily taxi rollup in Postgres, once or on a schedule."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Refresh the daily taxi rollup in Postgres.")
+    parser.add_argument("--every", type=int, metavar="SECONDS", help="Repeat every SECONDS instead of running once")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute every day instead of adding new rows")
+    add_connection_arguments(parser, "postgres")
+    args = parser.parse_args()
+
+    connection = connection_from_args(args, "postgres", prefixed=True)
+    rebuild = args.rebuild
+    while True:
+        try:
+            refresh(connection, rebuild=rebuild)
+            rebuild = False
+        except Exception as e:
+            logger.error(f"Rollup refresh failed: {e}")
+            if not args.every:
+                sys.exit(1)
+        if not args.every:
+            return
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from bulk_load import add_connection_arguments, connection_from_args
+
+# The replica tables and the agent's staleness check live with the agent tools
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_buddy.tools import weather_replica
+
+
+# Keeps nyc_weather_replica in Postgres in step with the SQL Server weather
+# table. Each run reads the rows whose ROWVERSION is above the watermark stored
+# in Postgres, plus the versions of every source row, and applies both in one
+# Postgres transaction. Rows written by SQL Server transactions still in flight
+# are left for the next run: the run only reads up to MIN_ACTIVE_ROWVERSION(),
+# so a late commit can never land below the watermark. Run it once, on demand,
+# or with --every to repeat on a schedule. `db_schema.py sqlsvr` adds the
+# [row_version] column to an existing weather table.
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def read_changes(sqlsvr_conn, table, watermark):
+    """
+    Reads the source rows changed since the watermark.
+
+    Returns the new watermark, the changed rows as (row_version, *columns)
+    tuples and the versions of every source row up to the new watermark.
+    """
+    columns = ", ".join(f"[{name}]" for name, _ in weather_replica.WEATHER_COLUMNS)
+    with sqlsvr_conn.cursor() as cur:
+        cur.execute("SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) - 1")
+        new_watermark = cur.fetchone()[0]
+        cur.execute(
+            f"SELECT CAST([row_version] AS BIGINT), {columns} FROM [{table}] "
+            f"WHERE [row_version] > CAST(CAST(%s AS BIGINT) AS BINARY(8)) "
+            f"AND [row_version] <= CAST(CAST(%s AS BIGINT) AS BINARY(8))",
+            (watermark, new_watermark),
+        )
+        rows = cur.fetchall()
+        cur.execute(
+            f"SELECT CAST([row_version] AS BIGINT) FROM [{table}] "
+            f"WHERE [row_version] <= CAST(CAST(%s AS BIGINT) AS BINARY(8))",
+            (new_watermark,),
+        )
+        live_row_versions = [row[0] for row in cur.fetchall()]
+    sqlsvr_conn.commit()
+    return new_watermark, rows, live_row_versions
+
+
+def replicate(sqlsvr_connection, postgres_connection, table=weather_replica.WEATHER_SOURCE_TABLE, full=False):
+    """
+    Copies the weather rows changed since the last run into the Postgres replica.
+
+    full copies every row again. Returns a dictionary with the rows copied
+    and deleted and the number of source rows.
+    """
+    import psycopg2
+    import pymssql
+
+    pg_conn = psycopg2.connect(
+        host=postgres_connection["host"], port=postgres_connection["port"],
+        dbname=postgres_connection["database"], user=postgres_connection["user"],
+        password=postgres_connection["password"],
+    )
+    sqlsvr_conn = pymssql.connect(
+        server=sqlsvr_connection["host"], port=sqlsvr_connection["port"],
+        database=sqlsvr_connection["database"], user=sqlsvr_connection["user"],
+        password=sqlsvr_connection["password"],
+    )
+    try:
+        weather_replica.create_replica_tables(pg_conn)
+        watermark = weather_replica.get_watermark(pg_conn, full=full)
+        new_watermark, rows, live_row_versions = read_changes(sqlsvr_conn, table, watermark)
+        copied, deleted = weather_replica.apply_changes(pg_conn, rows, live_row_versions, new_watermark)
+    finally:
+        sqlsvr_conn.close()
+        pg_conn.close()
+    stats = {"copied": copied, "deleted": deleted, "source_rows": len(live_row_versions)}
+    logger.info(
+        f"Replicated {table} to {weather_replica.REPLICA_TABLE}: {copied} rows copied, "
+        f"{deleted} deleted, {len(live_row_versions)} rows in the source"
+    )
+    return stats
+
+
+def main():
+    """Replicates the SQL Server weather table into Postgres, once or on a schedule."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Replicate the weather table from SQL Server into Postgres.")
+    parser.add_argument("--table", help="Source weather table (default: GOOGLE_CLOUD_SQLSVR_TABLE)")
+    parser.add_argument("--every", type=int, metavar="SECONDS", help="Repeat every SECONDS instead of running once")
+    parser.add_argument("--full", action="store_true", help="Copy every row again instead of only the changes")
+    add_connection_arguments(parser, "sqlsvr")
+    add_connection_arguments(parser, "postgres")
+    args = parser.parse_args()
+
+    table = args.table or os.getenv("GOOGLE_CLOUD_SQLSVR_TABLE") or weather_replica.WEATHER_SOURCE_TABLE
+    sqlsvr_connection = connection_from_args(args, "sqlsvr", prefixed=True)
+    postgres_connection = connection_from_args(args, "postgres", prefixed=True)
+    if args.every and args.every >= weather_replica.WEATHER_REPLICA_MAX_STALENESS_SECONDS:
+        logger.warning(
+            f"--every {args.every} is not below WEATHER_REPLICA_MAX_STALENESS_SECONDS "
+            f"({weather_replica.WEATHER_REPLICA_MAX_STALENESS_SECONDS}); the agent will often find the replica stale"
+        )
+
+    full = args.full
+    while True:
+        try:
+            replicate(sqlsvr_connection, postgres_connection, table, full=full)
+            full = False
+        except Exception as e:
+            logger.error(f"Replication failed: {e}")
+            if not args.every:
+                sys.exit(1)
+        if not args.every:
+            return
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,11 @@
-from . import agent
+import importlib
 
 __all__ = ["agent"]
+
+
+def __getattr__(name):
+    # Import the agent (and with it google.adk and the tools) on first access
+    # so that importing the package itself stays cheap.
+    if name == "agent":
+        return importlib.import_module(f"{__name__}.agent")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
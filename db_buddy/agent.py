@@ -5,10 +5,14 @@ import os
 from google.genai import types
 from google.adk.tools.agent_tool import AgentTool
 from google.adk.agents import Agent
+from .tools.query_guard import guard_postgres_queries, mark_limited_results
+from .tools.reference_data import lookup_reference_data
+from .tools.rollups import rewrite_rollup_queries
+from .tools.schema_catalog import instruction_with_catalog
+from .tools.sql_validation import validate_postgres_queries, validate_sqlsvr_filters
+from .tools.weather_replica import guard_weather_replica
 from .tools.tools_native import app_int_cloud_sql_sqlsvr_connector, app_int_cloud_sql_postgres_connector, rag_engine_connector
 from .prompts import root_agent_instructions, cloud_sql_postgres_agent_instructions, cloud_sql_sqlsvr_agent_instructions, rag_engine_agent_instructions
-import vertexai
-import os
 
 # Helper function to get environment variables
 def get_env_var(key):
@@ -25,15 +29,17 @@ rag_agent_model = get_env_var("RAG_AGENT_MODEL")
 project_id = get_env_var("GOOGLE_CLOUD_PROJECT_ID")
 region = get_env_var("GOOGLE_CLOUD_LOCATION")
 
-# Initialize Vertex AI
-vertexai.init(project=project_id, location=region)
+# Vertex AI is initialized once, lazily, by the RAG Engine connector the first
+# time the RAG agent runs (see tools_native); the Gemini models do not need it.
 
 # Define Cloud SQL Posgres Server Agent
 cloud_sql_postgres_agent = Agent(
     model=cloud_sql_postgres_agent_model,
     name="Cloud_SQL_Postgres_Agent",
-    instruction=cloud_sql_postgres_agent_instructions,
+    instruction=instruction_with_catalog(cloud_sql_postgres_agent_instructions, "postgres"),
     tools=[app_int_cloud_sql_postgres_connector],
+    before_tool_callback=[validate_postgres_queries, rewrite_rollup_queries, guard_postgres_queries, guard_weather_replica],
+    after_tool_callback=mark_limited_results,
     generate_content_config=types.GenerateContentConfig(temperature=0.01),
 )
 
@@ -41,8 +47,9 @@ cloud_sql_postgres_agent = Agent(
 cloud_sql_sqlsvr_agent = Agent(
     model=cloud_sql_sqlsvr_agent_model,
     name="Cloud_SQL_SQLServer_Agent",
-    instruction=cloud_sql_sqlsvr_agent_instructions,
+    instruction=instruction_with_catalog(cloud_sql_sqlsvr_agent_instructions, "sqlsvr"),
     tools=[app_int_cloud_sql_sqlsvr_connector],
+    before_tool_callback=validate_sqlsvr_filters,
     generate_content_config=types.GenerateContentConfig(temperature=0.01),
 )
 
@@ -60,6 +67,6 @@ root_agent = Agent(
     model=root_agent_model,
     name="RootAgent",
     instruction=root_agent_instructions,
-    tools=[AgentTool(agent=cloud_sql_postgres_agent), AgentTool(agent=cloud_sql_sqlsvr_agent), AgentTool(agent=rag_engine_agent)],
+    tools=[AgentTool(agent=cloud_sql_postgres_agent), AgentTool(agent=cloud_sql_sqlsvr_agent), AgentTool(agent=rag_engine_agent), lookup_reference_data],
     generate_content_config=types.GenerateContentConfig(temperature=0.01),
 )
\ No newline at end of file
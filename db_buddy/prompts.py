@@ -29,6 +29,12 @@ root_agent_instructions = """
     The database hosted here contains all of the taxi ride details.  You return specified 
     results with explanations and transparency of your reasoning.
 
+    It also holds nyc_weather_replica, a copy of the SQL Server weather table
+    that is refreshed on a schedule.  For questions about both taxi rides and
+    the weather, ask the Postgres agent for one query joining the taxi table to
+    nyc_weather_replica on the day.  If it reports that the replica is stale,
+    query both databases and join the results yourself.
+
     Available tools for postgres:
         - AgentTool(agent=cloud_sql_postgres_agent)
 
@@ -46,6 +52,17 @@ root_agent_instructions = """
     Finally, you return specified results with explanations 
     and transparency of your reasoning
 
+    ## Reference data
+
+    The daily weather and the car recommendations per weather condition are
+    also held in memory.  To get the weather for specific days or conditions,
+    or the recommended cars for a condition, use lookup_reference_data first:
+    it answers immediately.  If it returns an error or no rows, use the
+    database or RAG Engine agents instead.
+
+    Available tools for reference data:
+        - lookup_reference_data
+
     ## Vertex AI RAG Engine
 
     The RAG Engine contains car recommendations based upon weather conditions.
@@ -82,7 +99,7 @@ root_agent_instructions = """
             DATE(tpep_pickup_datetime) AS travel_date,
             AVG(EXTRACT(EPOCH FROM (tpep_dropoff_datetime - tpep_pickup_datetime))) AS average_travel_time_seconds
         FROM
-            nyc_taxi_data
+            nyc_taxi_table
         GROUP BY
             travel_date
         ORDER BY
@@ -96,16 +113,19 @@ root_agent_instructions = """
     
     ## Example 3:  User asking about both taxi rides and the weather on the days
     for each taxi ride
-    (This will require queries against Cloud SQL (Postgres - for taxi ride data)
-    and Cloud SQL (sql server - for weather data) which will be joined together
+    (This will use one Cloud SQL (Postgres) query joining the taxi ride data to
+    the weather replica, or queries against Cloud SQL (Postgres - for taxi ride
+    data) and Cloud SQL (sql server - for weather data) joined together if the
+    replica is stale
     
     User:  Please provide me the average taxi ride travel time by day along with
     the weather for each day.
     Agent:  Here are steps I will take to get you the information you need:
-    1. I will query the Postgres database to get the average travel time by day
-    2. I will query the SQL Server database to get the weather by day
-    3. I will join the two datasets together on the day field to provide you
-    with the final result.
+    1. I will query the Postgres database once, joining the taxi rides to
+    nyc_weather_replica on the day field, to get the average travel time and
+    the weather by day
+    2. If the weather replica is stale, I will instead query the SQL Server
+    database for the weather by day and join it to the travel times myself.
     Agent: 
     Here is what I found.
 
@@ -117,8 +137,8 @@ root_agent_instructions = """
     ## Example 4:  User asking about both taxi rides and the weather on the days
     for each taxi ride.  Then also asking about recommended list of cars to use
     based upon the weather conditions.
-    (This will require queries against Cloud SQL (Postgres - for taxi ride data)
-    and Cloud SQL (sql server - for weather data) which will be joined together. 
+    (This will use one Cloud SQL (Postgres) query joining the taxi ride data to
+    the weather replica, as in Example 3. 
     Next, the RAG Engine will be used to get car recommendations based upon the 
     weather conditions.  All of this information can be joined together.
     
@@ -126,12 +146,13 @@ root_agent_instructions = """
     the weather for each day.  Also add a column for which Car Manufacturer, Car
     Model are recommended for that weather condition.
     Agent:  Here are steps I will take to get you the information you need:
-    1. I will query the Postgres database to get the average travel time by day
-    2. I will query the SQL Server database to get the weather by day
-    3. I will join the two datasets together on the day field 
-    4. I will query the RAG Engine to get car recommendations based upon the weather 
+    1. I will query the Postgres database to get the average travel time and
+    the weather by day, joining the taxi rides to nyc_weather_replica
+    2. If the weather replica is stale, I will get the weather by day from the
+    SQL Server database and join it on the day field instead
+    3. I will query the RAG Engine to get car recommendations based upon the weather 
     conditions
-    5. Finally, I will join the car recommendations to the main dataset to provide you
+    4. Finally, I will join the car recommendations to the main dataset to provide you
     with the final result.
     Agent: 
     Here is what I found.
@@ -152,6 +173,13 @@ cloud_sql_postgres_agent_instructions = """
         - cloud_sql_postgres_tool_create_[database_name]
         - cloud_sql_postgres_tool_update_[database_name]
         - cloud_sql_postgres_tool_delete_[database_name]
+    The nyc_weather_replica table is a copy of the SQL Server weather table
+    with the columns date, max_temp_f, low_temp_f, condition and location.
+    Join it to the taxi table on DATE(tpep_pickup_datetime) = date to answer
+    taxi and weather questions in one query.  If a query on it returns an
+    error saying the replica is stale, say so and answer without the weather.
+    If a tool returns a backend_busy error, do not call it again in this turn;
+    tell the user the database is busy and to try again in retry_after_s seconds.
     Always show the SQL Code that will be executed for database actions
     Always show table outputs in markdown
     when outputing any currency values, always use dollar sign and 2 digits
@@ -166,6 +194,8 @@ cloud_sql_sqlsvr_agent_instructions = """
         - cloud_sql_sqlsvr_tool_create_[database_name]
         - cloud_sql_sqlsvr_tool_update_[database_name]
         - cloud_sql_sqlsvr_tool_delete_[database_name]
+    If a tool returns a backend_busy error, do not call it again in this turn;
+    tell the user the database is busy and to try again in retry_after_s seconds.
     Always show the SQL Code that will be executed for database actions
     Always show table outputs in markdown
     when outputing any currency values, always use dollar sign and 2 digits
@@ -0,0 +1,331 @@
+# Admission control and fair scheduling of database-bound tool calls
+#
+# Nothing else limits how many calls concurrent sessions send to Cloud SQL or
+# the RAG Engine at once, so one heavy user can fill the instance and slow
+# every other session down. Each backend gets a scheduler with a limit on the
+# calls it runs at a time. Calls over the limit wait in a queue:
+# - interactive calls (filtered or aggregated queries, lookups, retrievals)
+#   are admitted before exports (unfiltered scans of a whole table), and
+#   exports never hold more than half of the slots;
+# - within a priority, users take turns, so a user with many queued calls
+#   gets one slot per round like everyone else.
+# When the queue, or one user's share of it, is full, a call is rejected at
+# once with a backend_busy error and a retry_after_s estimate, and a call
+# that waits longer than ADMISSION_MAX_WAIT_SECONDS is rejected the same way.
+# Queue times are recorded per backend and priority and exported as
+# OpenTelemetry metrics. Limits apply per worker process.
+
+import asyncio
+import concurrent.futures
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+from opentelemetry import metrics
+
+from db_buddy.tools import single_flight
+from db_buddy.utils.span_metrics import QUANTILES, LatencySketch
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() in ("1", "true", "yes")
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_MAX_QUEUE_PER_USER = int(os.getenv("ADMISSION_MAX_QUEUE_PER_USER", "8"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "20"))
+
+INTERACTIVE = "interactive"
+EXPORT = "export"
+PRIORITIES = (INTERACTIVE, EXPORT)
+ANONYMOUS_USER = "anonymous"
+
+# Weight of the latest call in the moving average of call durations
+_SERVICE_TIME_WEIGHT = 0.2
+_NARROWING = re.compile(r"\b(where|limit|top|fetch|group by|count|sum|avg|min|max)\b")
+
+
+def classify_query(query):
+    """Returns EXPORT for a query that reads whole tables, INTERACTIVE otherwise."""
+    unquoted = single_flight.unquoted_sql(query)
+    if unquoted.startswith("copy ") or not _NARROWING.search(unquoted):
+        return EXPORT
+    return INTERACTIVE
+
+
+def user_of(tool_context):
+    """Returns the user a tool call is made for."""
+    return getattr(tool_context, "user_id", None) or ANONYMOUS_USER
+
+
+class BackendBusy(Exception):
+    """Raised when a call is not admitted: the queue is full or the call waited too long."""
+
+    def __init__(self, backend, reason, retry_after_s):
+        super().__init__(f"{backend} is busy: {reason}")
+        self.backend = backend
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+    def error(self):
+        """Returns the structured error given to the agent."""
+        return {
+            "error": "backend_busy",
+            "message": (
+                f"The call was not sent: {self.backend} is busy ({self.reason}). "
+                f"Retry in about {self.retry_after_s}s, or narrow the request."
+            ),
+            "retry_after_s": self.retry_after_s,
+        }
+
+
+class AdmissionScheduler:
+    """
+    Admits the calls of one backend, up to max_concurrency at a time.
+
+    Waiting calls are held per priority in a round-robin of users: each user
+    has a queue of calls, and a user whose call is admitted moves to the back.
+    slot() and aslot() hold a slot for the duration of a call, from a thread
+    or an event loop.
+    """
+
+    def __init__(
+        self,
+        backend,
+        max_concurrency=ADMISSION_MAX_CONCURRENCY,
+        max_queue=ADMISSION_MAX_QUEUE,
+        max_queue_per_user=ADMISSION_MAX_QUEUE_PER_USER,
+        max_wait_s=ADMISSION_MAX_WAIT_SECONDS,
+    ):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.max_exports = max(1, max_concurrency // 2)
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait_s = max_wait_s
+        self._lock = threading.Lock()
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._waiting = {priority: OrderedDict() for priority in PRIORITIES}
+        self._depth = 0
+        self._service_time_s = 1.0
+        # Cumulative counts exported as counters, unaffected by reset()
+        self.total_admitted = {priority: 0 for priority in PRIORITIES}
+        self.total_rejected = {priority: 0 for priority in PRIORITIES}
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.admitted = {priority: 0 for priority in PRIORITIES}
+        self.rejected = {priority: 0 for priority in PRIORITIES}
+        self.queue_time = {priority: LatencySketch() for priority in PRIORITIES}
+
+    def _has_capacity(self, priority):
+        if sum(self._running.values()) >= self.max_concurrency:
+            return False
+        return priority == INTERACTIVE or self._running[EXPORT] < self.max_exports
+
+    def _retry_after(self):
+        return max(1, math.ceil((self._depth + 1) * self._service_time_s / self.max_concurrency))
+
+    def _admit(self, priority, queue_time_ms):
+        self._running[priority] += 1
+        self.admitted[priority] += 1
+        self.total_admitted[priority] += 1
+        self.queue_time[priority].add(queue_time_ms)
+
+    def _reject(self, priority, reason):
+        self.rejected[priority] += 1
+        self.total_rejected[priority] += 1
+        return BackendBusy(self.backend, reason, self._retry_after())
+
+    def _enter(self, user, priority):
+        """Admits a call now and returns None, or queues it and returns the future it waits on."""
+        with self._lock:
+            queued_ahead = any(self._waiting[p] for p in PRIORITIES[: PRIORITIES.index(priority) + 1])
+            if not queued_ahead and self._has_capacity(priority):
+                self._admit(priority, 0.0)
+                return None
+            if self._depth >= self.max_queue:
+                raise self._reject(priority, f"{self._depth} calls are queued")
+            queue = self._waiting[priority].setdefault(user, deque())
+            if len(queue) >= self.max_queue_per_user:
+                raise self._reject(priority, f"this user already has {len(queue)} calls queued")
+            waiter = concurrent.futures.Future()
+            waiter.enqueued = time.monotonic()
+            queue.append(waiter)
+            self._depth += 1
+            return waiter
+
+    def _dispatch(self):
+        # Called with the lock held, whenever a slot frees up
+        while True:
+            for priority in PRIORITIES:
+                waiting = self._waiting[priority]
+                if waiting and self._has_capacity(priority):
+                    user, queue = waiting.popitem(last=False)
+                    waiter = queue.popleft()
+                    if queue:
+                        waiting[user] = queue
+                    self._depth -= 1
+                    self._admit(priority, (time.monotonic() - waiter.enqueued) * 1000)
+                    waiter.set_result(True)
+                    break
+            else:
+                return
+
+    def _abandon(self, user, priority, waiter):
+        """Takes a waiting call out of the queue. Returns True if it was admitted in the meantime."""
+        with self._lock:
+            if waiter.done():
+                return True
+            queue = self._waiting[priority].get(user)
+            if queue is not None and waiter in queue:
+                queue.remove(waiter)
+                if not queue:
+                    del self._waiting[priority][user]
+                self._depth -= 1
+            waiter.cancel()
+            return False
+
+    def _leave(self, priority, started):
+        with self._lock:
+            elapsed = time.monotonic() - started
+            self._service_time_s += _SERVICE_TIME_WEIGHT * (elapsed - self._service_time_s)
+            self._running[priority] -= 1
+            self._dispatch()
+
+    def _timed_out(self, priority):
+        with self._lock:
+            return self._reject(priority, f"the call waited more than {self.max_wait_s:g}s")
+
+    @contextmanager
+    def slot(self, user, priority=INTERACTIVE):
+        """Holds a slot while the block runs. Raises BackendBusy if the call is not admitted."""
+        waiter = self._enter(user, priority)
+        if waiter is not None:
+            try:
+                waiter.result(timeout=self.max_wait_s)
+            except concurrent.futures.TimeoutError:
+                if not self._abandon(user, priority, waiter):
+                    raise self._timed_out(priority) from None
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._leave(priority, started)
+
+    @asynccontextmanager
+    async def aslot(self, user, priority=INTERACTIVE):
+        """Holds a slot while the block runs, without blocking the event loop."""
+        waiter = self._enter(user, priority)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(waiter)), self.max_wait_s)
+            except asyncio.TimeoutError:
+                if not self._abandon(user, priority, waiter):
+                    raise self._timed_out(priority) from None
+            except asyncio.CancelledError:
+                if self._abandon(user, priority, waiter):
+                    self._leave(priority, time.monotonic())
+                raise
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._leave(priority, started)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": dict(self._running),
+                "queued": {p: sum(len(q) for q in self._waiting[p].values()) for p in PRIORITIES},
+                "admitted": dict(self.admitted),
+                "rejected": dict(self.rejected),
+                "service_time_s": self._service_time_s,
+                "queue_time_ms": {
+                    p: {f"p{int(q * 100)}": self.queue_time[p].quantile(q) for q in QUANTILES}
+                    for p in PRIORITIES
+                },
+            }
+
+    def reset(self):
+        with self._lock:
+            self._reset_stats()
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(backend):
+    """
+    Returns this process's scheduler for a backend.
+
+    ADMISSION_MAX_CONCURRENCY_<BACKEND> (e.g. ADMISSION_MAX_CONCURRENCY_RAG_ENGINE)
+    overrides the concurrency limit of one backend.
+    """
+    with _schedulers_lock:
+        if backend not in _schedulers:
+            limit = os.getenv(f"ADMISSION_MAX_CONCURRENCY_{backend.upper()}")
+            _schedulers[backend] = AdmissionScheduler(
+                backend, max_concurrency=int(limit) if limit else ADMISSION_MAX_CONCURRENCY
+            )
+        return _schedulers[backend]
+
+
+def snapshot():
+    """Returns the statistics of every backend."""
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return {scheduler.backend: scheduler.stats() for scheduler in schedulers}
+
+
+def reset():
+    """Resets the statistics of every backend."""
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    for scheduler in schedulers:
+        scheduler.reset()
+
+
+def _each_priority(value):
+    def observe(_):
+        with _schedulers_lock:
+            schedulers = list(_schedulers.values())
+        observations = []
+        for scheduler in schedulers:
+            with scheduler._lock:
+                for priority in PRIORITIES:
+                    for amount, attributes in value(scheduler, priority):
+                        observations.append(metrics.Observation(
+                            amount, {"backend": scheduler.backend, "priority": priority, **attributes}
+                        ))
+        return observations
+
+    return observe
+
+
+_meter = metrics.get_meter(__name__)
+_meter.create_observable_counter(
+    "db_buddy.admission.admitted",
+    callbacks=[_each_priority(lambda s, p: [(s.total_admitted[p], {})])],
+    description="Database-bound tool calls admitted by the scheduler",
+)
+_meter.create_observable_counter(
+    "db_buddy.admission.rejected",
+    callbacks=[_each_priority(lambda s, p: [(s.total_rejected[p], {})])],
+    description="Database-bound tool calls rejected because the backend was busy",
+)
+_meter.create_observable_gauge(
+    "db_buddy.admission.queued",
+    callbacks=[_each_priority(lambda s, p: [(sum(len(q) for q in s._waiting[p].values()), {})])],
+    description="Database-bound tool calls waiting for a slot",
+)
+_meter.create_observable_gauge(
+    "db_buddy.admission.queue_time",
+    callbacks=[_each_priority(
+        lambda s, p: [(s.queue_time[p].quantile(q), {"quantile": str(q)}) for q in QUANTILES]
+    )],
+    unit="ms",
+    description="Queue time quantiles of database-bound tool calls",
+)
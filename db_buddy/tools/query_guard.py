@@ -0,0 +1,329 @@
+# Cost guard and time limits for Postgres queries
+#
+# The model can write a cross join or a full scan of a large taxi table, which
+# ties up the database and the worker for minutes. Before a query runs, its
+# plan is estimated with EXPLAIN (without running it). A query whose estimated
+# cost is above POSTGRES_MAX_QUERY_COST is rejected. A query returning more
+# than POSTGRES_MAX_QUERY_ROWS rows is wrapped in a LIMIT, or rejected when
+# POSTGRES_ROW_GUARD is "reject", and its results say that they were limited.
+# Rejections are structured errors with hints
+# taken from the plan, so the model can fix the query. Every query also runs
+# under a statement_timeout, and queries in flight can be cancelled. When the
+# database cannot be reached directly, the plan is read through the connector;
+# if there is no plan either way, read queries are still wrapped in the LIMIT.
+
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from db_buddy.tools import rollups
+
+POSTGRES_QUERY_GUARD = os.getenv("POSTGRES_QUERY_GUARD", "true").lower() in ("1", "true", "yes")
+POSTGRES_MAX_QUERY_COST = float(os.getenv("POSTGRES_MAX_QUERY_COST", "5000000"))
+POSTGRES_MAX_QUERY_ROWS = int(os.getenv("POSTGRES_MAX_QUERY_ROWS", "10000"))
+POSTGRES_ROW_GUARD = os.getenv("POSTGRES_ROW_GUARD", "limit").lower()
+POSTGRES_STATEMENT_TIMEOUT_MS = int(os.getenv("POSTGRES_STATEMENT_TIMEOUT_MS", "30000"))
+# After the database cannot be reached for EXPLAIN, use the connector for this long
+GUARD_RETRY_SECONDS = 300
+_guard_unavailable_until = 0.0
+
+# Scans of more rows than this are pointed out in hints
+LARGE_SCAN_ROWS = 100000
+TAXI_FILTER_HINT = (
+    "filter on tpep_pickup_datetime (the partition key), DATE(tpep_pickup_datetime), "
+    "PULocationID or DOLocationID so partitions are pruned and indexes are used"
+)
+
+_running_lock = threading.Lock()
+_running = set()
+
+
+def _is_read_query(query):
+    return query.lstrip().lstrip("(").split(None, 1)[0].lower() in ("select", "with", "values", "table")
+
+
+def _walk(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk(child)
+
+
+def plan_hints(plan):
+    """Returns suggestions for making a plan cheaper, from its most expensive parts."""
+    hints = []
+    for node in _walk(plan):
+        node_type = node.get("Node Type")
+        relation = node.get("Relation Name", "")
+        if node_type == "Seq Scan" and node.get("Plan Rows", 0) >= LARGE_SCAN_ROWS:
+            # Partitions are named after the taxi table
+            parent = rollups.TAXI_TABLE if relation.startswith(rollups.TAXI_TABLE) else relation
+            how = TAXI_FILTER_HINT if parent == rollups.TAXI_TABLE else "filter on an indexed column"
+            hints.append(f"The query scans about {node['Plan Rows']:,} rows of {parent}; {how}.")
+        elif node_type == "Append" and len(node.get("Plans", [])) > 3:
+            hints.append(
+                f"The query reads {len(node['Plans'])} partitions; filter on tpep_pickup_datetime to read fewer."
+            )
+        elif (
+            node_type == "Nested Loop"
+            and node.get("Plan Rows", 0) >= LARGE_SCAN_ROWS
+            and "Join Filter" not in node
+            and not any("Index Cond" in child for child in node.get("Plans", []))
+        ):
+            hints.append("A join has no join condition and pairs every row with every row; join on a key column.")
+    if plan.get("Plan Rows", 0) > POSTGRES_MAX_QUERY_ROWS:
+        hints.append("Aggregate the rows in SQL (GROUP BY with COUNT, SUM or AVG) instead of returning them.")
+    return list(dict.fromkeys(hints))
+
+
+def set_statement_timeout(cur, timeout_ms=POSTGRES_STATEMENT_TIMEOUT_MS):
+    """Limits the statements of the current transaction to timeout_ms."""
+    cur.execute("SET LOCAL statement_timeout = %s", (int(timeout_ms),))
+
+
+def role_statement_timeout_ddl(role, timeout_ms=POSTGRES_STATEMENT_TIMEOUT_MS):
+    """Returns the statement limiting every session of a role, such as the connector's, to timeout_ms."""
+    return f"ALTER ROLE {role} SET statement_timeout = {int(timeout_ms)}"
+
+
+def check_query(conn, query):
+    """
+    Estimates a query with EXPLAIN and applies the cost and row limits.
+
+    Returns (query, error): the query to run, possibly wrapped in a LIMIT,
+    and None, or the original query and a structured error dictionary if it
+    is rejected. Queries EXPLAIN cannot handle (several statements, utility
+    commands, errors) are returned unchanged, and running them reports any
+    error.
+    """
+    import psycopg2
+
+    if _is_multi_statement(query):
+        return query, None
+    try:
+        with conn.cursor() as cur:
+            set_statement_timeout(cur)
+            cur.execute(f"EXPLAIN (FORMAT JSON) {query}")
+            plan = cur.fetchone()[0][0]["Plan"]
+    except psycopg2.Error:
+        return query, None
+    finally:
+        conn.rollback()
+    return check_plan(query, plan)
+
+
+def _is_multi_statement(query):
+    # EXPLAIN covers only the first of several statements
+    return ";" in query.strip().rstrip(";")
+
+
+_LIMIT_SUFFIX = f"\n) AS limited_result LIMIT {POSTGRES_MAX_QUERY_ROWS}"
+LIMIT_NOTE = (
+    f"Results limited to {POSTGRES_MAX_QUERY_ROWS:,} rows; there may be more. "
+    "Aggregate or filter the query to cover every row."
+)
+
+
+def limit_rows(query):
+    """Wraps a read query in a LIMIT of POSTGRES_MAX_QUERY_ROWS."""
+    return f"SELECT * FROM (\n{query.rstrip().rstrip(';')}{_LIMIT_SUFFIX}"
+
+
+def is_limited(query):
+    """Returns True for a query wrapped by limit_rows."""
+    return isinstance(query, str) and query.endswith(_LIMIT_SUFFIX)
+
+
+def check_plan(query, plan):
+    """Applies the cost and row limits to a query's EXPLAIN plan. Returns (query, error) like check_query."""
+    cost, rows = plan.get("Total Cost", 0), plan.get("Plan Rows", 0)
+    if cost > POSTGRES_MAX_QUERY_COST:
+        return query, {
+            "error": "query_too_expensive",
+            "message": (
+                f"The query was not run: its estimated cost {cost:,.0f} is above the limit "
+                f"of {POSTGRES_MAX_QUERY_COST:,.0f}. Rewrite it using the hints."
+            ),
+            "estimated_cost": cost,
+            "max_cost": POSTGRES_MAX_QUERY_COST,
+            "estimated_rows": rows,
+            "hints": plan_hints(plan),
+        }
+    if rows > POSTGRES_MAX_QUERY_ROWS and _is_read_query(query):
+        if POSTGRES_ROW_GUARD == "reject":
+            return query, {
+                "error": "too_many_rows",
+                "message": (
+                    f"The query was not run: it would return about {rows:,} rows, "
+                    f"more than the limit of {POSTGRES_MAX_QUERY_ROWS:,}."
+                ),
+                "estimated_rows": rows,
+                "max_rows": POSTGRES_MAX_QUERY_ROWS,
+                "hints": plan_hints(plan),
+            }
+        query = limit_rows(query)
+    return query, None
+
+
+def timeout_error(timeout_ms=POSTGRES_STATEMENT_TIMEOUT_MS):
+    """Returns the structured error for a query stopped by statement_timeout."""
+    return {
+        "error": "statement_timeout",
+        "message": f"The query was cancelled after running for {timeout_ms / 1000:g}s.",
+        "timeout_ms": timeout_ms,
+        "hints": [
+            f"Narrow the query: {TAXI_FILTER_HINT}.",
+            "Aggregate in SQL instead of returning raw rows.",
+        ],
+    }
+
+
+def format_error(error):
+    """Renders a structured error as the text returned by the query tools."""
+    return f"An error occurred: {json.dumps(error)}"
+
+
+@contextmanager
+def running_query(conn):
+    """Registers a connection while it runs a query, so cancel_running_queries can stop it."""
+    with _running_lock:
+        _running.add(conn)
+    try:
+        yield
+    finally:
+        with _running_lock:
+            _running.discard(conn)
+
+
+def cancel_running_queries():
+    """Cancels every query this process is running. Returns the number cancelled."""
+    with _running_lock:
+        connections = list(_running)
+    for conn in connections:
+        conn.cancel()
+    return len(connections)
+
+
+_MISSING = object()
+
+
+def _find_value(result, key):
+    if isinstance(result, str):
+        try:
+            result = json.loads(result)
+        except ValueError:
+            return _MISSING
+    if isinstance(result, dict):
+        if key in result:
+            return result[key]
+        values = result.values()
+    elif isinstance(result, list):
+        values = result
+    else:
+        return _MISSING
+    for value in values:
+        found = _find_value(value, key)
+        if found is not _MISSING:
+            return found
+    return _MISSING
+
+
+async def query_through_connector(tool, args, tool_context, query, key):
+    """
+    Runs a query with the connector tool being called and returns the first value named key in its result.
+
+    The connector returns rows as nested JSON, possibly inside strings, so the
+    result is searched for the key. Raises KeyError if it is not found, for
+    example because the connector returned an error.
+    """
+    result = await tool.run_async(args={**args, "query": query}, tool_context=tool_context)
+    value = _find_value(result, key)
+    if value is _MISSING:
+        raise KeyError(key)
+    return value
+
+
+def _check_directly(query):
+    from db_buddy.tools.tools_custom import pooled_postgres_connection
+
+    with pooled_postgres_connection() as conn:
+        return check_query(conn, query)
+
+
+def _count_rows(result):
+    """Returns the length of the first list of row objects in a connector result, or None."""
+    if isinstance(result, str):
+        try:
+            result = json.loads(result)
+        except ValueError:
+            return None
+    if isinstance(result, list):
+        if result and all(isinstance(row, dict) for row in result):
+            return len(result)
+        values = result
+    elif isinstance(result, dict):
+        values = result.values()
+    else:
+        return None
+    for value in values:
+        count = _count_rows(value)
+        if count is not None:
+            return count
+    return None
+
+
+def mark_limited_results(tool, args, tool_context, tool_response):
+    """
+    After-tool callback telling the agent when the row LIMIT cut the connector's results short.
+
+    The note is added only when the response holds as many rows as the limit;
+    if the rows cannot be counted, the response is left as it is.
+    """
+    if not is_limited(args.get("query")):
+        return None
+    count = _count_rows(tool_response)
+    if count is None or count < POSTGRES_MAX_QUERY_ROWS:
+        return None
+    if isinstance(tool_response, dict):
+        return {**tool_response, "note": LIMIT_NOTE}
+    return {"result": tool_response, "note": LIMIT_NOTE}
+
+
+async def guard_postgres_queries(tool, args, tool_context):
+    """
+    Before-tool callback applying the cost and row limits to the Postgres connector's queries.
+
+    Rejected queries return a structured error instead of running; queries
+    over the row limit are sent with a LIMIT. The plan is estimated over a
+    pooled connection; if the database cannot be reached directly, it is
+    estimated through the connector for GUARD_RETRY_SECONDS. If neither
+    gives a plan, read queries are sent with the LIMIT.
+    """
+    global _guard_unavailable_until
+    query = args.get("query")
+    if not POSTGRES_QUERY_GUARD or not isinstance(query, str) or _is_multi_statement(query):
+        return None
+    if time.monotonic() >= _guard_unavailable_until:
+        try:
+            query, error = await asyncio.to_thread(_check_directly, query)
+        except Exception:
+            _guard_unavailable_until = time.monotonic() + GUARD_RETRY_SECONDS
+        else:
+            if error:
+                return error
+            args["query"] = query
+            return None
+    try:
+        plan = await query_through_connector(tool, args, tool_context, f"EXPLAIN (FORMAT JSON) {query}", "Plan")
+    except Exception:
+        plan = None
+    if isinstance(plan, dict):
+        query, error = check_plan(query, plan)
+        if error:
+            return error
+    elif _is_read_query(query):
+        query = limit_rows(query)
+    args["query"] = query
+    return None
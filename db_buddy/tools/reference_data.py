@@ -0,0 +1,289 @@
+# In-process cache of small reference data
+#
+# The weather table (one row per day) and the car recommendation JSON are tiny
+# and rarely change, yet answering "what was the weather on ..." or "which car
+# suits snow" otherwise means a connector call or a RAG retrieval. This module
+# loads them into columnar tables held in memory, with an index on the columns
+# they are looked up by. A background thread checks a cheap version marker for
+# each source and reloads only sources whose version changed. The first load
+# also runs on that thread, never on a request. The lookup_reference_data tool
+# answers from memory, without a network hop, and tells the agent to query the
+# database while a table is not loaded yet.
+#
+# Sources:
+# - weather: nyc_weather_replica in Postgres (see weather_replica.py). Its
+#   version is the row count and a hash of the replicated row versions, so
+#   updates, deletes and full resyncs are all seen. Lookups are refused once
+#   the replica was last synced more than WEATHER_REPLICA_MAX_STALENESS_SECONDS
+#   ago, as for queries that read it.
+# - car_recommendations: the recommendation JSON in the RAG source bucket, or
+#   a local file. Its version is the object generation or the file mtime.
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from db_buddy.tools import weather_replica
+
+REFERENCE_DATA_REFRESH_SECONDS = float(os.getenv("REFERENCE_DATA_REFRESH_SECONDS", "300"))
+CAR_RECOMMENDATIONS_FILE = "Taxi Car Weather Recommendation - json.json"
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceTable:
+    """An immutable table stored as one list per column, with value indexes on some columns."""
+
+    def __init__(self, columns, indexed_columns, version):
+        self.columns = columns
+        self.version = version
+        self.row_count = len(next(iter(columns.values()), []))
+        self.indexes = {}
+        for name in indexed_columns:
+            index = {}
+            for position, value in enumerate(columns[name]):
+                index.setdefault(_normalize_key(value), []).append(position)
+            self.indexes[name] = {key: tuple(positions) for key, positions in index.items()}
+
+    def row(self, position):
+        return {name: values[position] for name, values in self.columns.items()}
+
+    def lookup(self, column, value):
+        """Returns the rows whose indexed column equals value, ignoring case."""
+        positions = self.indexes[column].get(_normalize_key(value), ())
+        return [self.row(p) for p in positions]
+
+
+def _normalize_key(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value).strip().lower()
+
+
+def _to_columns(records, names):
+    return {name: [record.get(name) for record in records] for name in names}
+
+
+class WeatherSource:
+    """The replicated weather table, indexed by date and condition."""
+
+    name = "weather"
+    indexed_columns = ("date", "condition")
+
+    def __init__(self):
+        # time.monotonic() of the last sync, as of the last version check
+        self.synced = None
+
+    def version(self):
+        from db_buddy.tools.tools_custom import pooled_postgres_connection
+
+        with pooled_postgres_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"SELECT ({weather_replica.AGE_QUERY}), COUNT(*), "
+                    f"md5(string_agg(source_row_version::text, ',' ORDER BY source_row_version)) "
+                    f"FROM {weather_replica.REPLICA_TABLE}"
+                )
+                age, count, digest = cur.fetchone()
+        self.synced = time.monotonic() - float(age) if age is not None else None
+        return count, digest
+
+    def stale_error(self):
+        """Returns the error refusing lookups while the replica is stale, or None."""
+        age = time.monotonic() - self.synced if self.synced is not None else None
+        return weather_replica.stale_replica_error(age)
+
+    def load(self):
+        from db_buddy.tools.tools_custom import pooled_postgres_connection
+
+        names = [name for name, _ in weather_replica.WEATHER_COLUMNS]
+        with pooled_postgres_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT {', '.join(names)} FROM {weather_replica.REPLICA_TABLE} ORDER BY date")
+                rows = cur.fetchall()
+        columns = {name: [row[i] for row in rows] for i, name in enumerate(names)}
+        columns["date"] = [d.isoformat() if d is not None else None for d in columns["date"]]
+        return columns
+
+
+class CarRecommendationSource:
+    """The car recommendation JSON, indexed by weather condition.
+
+    location is a gs:// URI or a local path. The file holds one recommendation
+    object or a list of them.
+    """
+
+    name = "car_recommendations"
+    indexed_columns = ("Weather",)
+
+    def __init__(self, location):
+        self.location = location
+
+    def _blob(self):
+        from google.cloud import storage
+
+        bucket_name, _, object_name = self.location[len("gs://"):].partition("/")
+        return storage.Client().bucket(bucket_name).blob(object_name)
+
+    def version(self):
+        if self.location.startswith("gs://"):
+            blob = self._blob()
+            blob.reload()
+            return blob.generation
+        return os.stat(self.location).st_mtime_ns
+
+    def load(self):
+        if self.location.startswith("gs://"):
+            data = json.loads(self._blob().download_as_text())
+        else:
+            with open(self.location) as f:
+                data = json.load(f)
+        records = data if isinstance(data, list) else [data]
+        names = list(dict.fromkeys(name for record in records for name in record))
+        return _to_columns(records, names)
+
+
+def default_sources():
+    """Returns the configured reference data sources, those that need no database first."""
+    sources = []
+    location = os.getenv("REFERENCE_CAR_RECOMMENDATIONS_URI")
+    bucket = os.getenv("RAG_SOURCE_BUCKET")
+    if not location and bucket:
+        folder = (os.getenv("RAG_SOURCE_BUCKET_FOLDER") or "rag_source").strip("/")
+        location = f"gs://{bucket}/{folder}/{CAR_RECOMMENDATIONS_FILE}"
+    if location:
+        sources.append(CarRecommendationSource(location))
+    sources.append(WeatherSource())
+    return sources
+
+
+class ReferenceDataCache:
+    """
+    Holds the reference tables of this process and keeps them up to date.
+
+    Each refresh swaps in a new ReferenceTable, so lookups never take a lock
+    and always see a complete table. A source that fails to load keeps
+    serving its previous version. start() returns at once; the first load
+    runs on the background thread, and wait_for_first_refresh() waits for it.
+    """
+
+    def __init__(self, sources, refresh_interval_s=REFERENCE_DATA_REFRESH_SECONDS):
+        self.sources = {source.name: source for source in sources}
+        self.refresh_interval_s = refresh_interval_s
+        self.tables = {}
+        self.refreshed_at = {}
+        # Sources the refresh has tried to load at least once
+        self.attempted = set()
+        self._attempted_changed = threading.Condition()
+        self._refresh_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def refresh(self):
+        """Reloads every source whose version changed. Returns the names reloaded."""
+        reloaded = []
+        with self._refresh_lock:
+            for name, source in self.sources.items():
+                try:
+                    version = source.version()
+                    current = self.tables.get(name)
+                    if current is None or current.version != version:
+                        self.tables[name] = ReferenceTable(source.load(), source.indexed_columns, version)
+                        reloaded.append(name)
+                    self.refreshed_at[name] = time.time()
+                except Exception as e:
+                    logger.warning(f"Could not refresh reference table {name}: {e}")
+                with self._attempted_changed:
+                    self.attempted.add(name)
+                    self._attempted_changed.notify_all()
+        return reloaded
+
+    def wait_for_first_refresh(self, names=None, timeout=None):
+        """
+        Waits until the refresh has tried every named source, or all of them.
+
+        Returns the names that are still not loaded, which is empty once they
+        all loaded. A source that failed to load is returned, not waited on.
+        """
+        names = list(self.sources) if names is None else list(names)
+        with self._attempted_changed:
+            self._attempted_changed.wait_for(lambda: self.attempted.issuperset(names), timeout)
+        return [name for name in names if name not in self.tables]
+
+    def start(self):
+        """Starts the background thread loading and refreshing the tables, once per process."""
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # A thread started before a fork does not exist in the child
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="reference-data-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        self.refresh()
+        while not self._stop.wait(self.refresh_interval_s):
+            self.refresh()
+
+    def stale_error(self, table):
+        """Returns the error refusing lookups of a loaded table whose source is stale, or None."""
+        if table not in self.tables:
+            return None
+        stale_error = getattr(self.sources.get(table), "stale_error", None)
+        return stale_error() if stale_error is not None else None
+
+    def lookup(self, table, column, value):
+        current = self.tables.get(table)
+        if current is None:
+            raise KeyError(f"reference table {table} is not loaded yet; query its database instead")
+        if column not in current.indexes:
+            raise KeyError(f"{table} can be looked up by {', '.join(current.indexes)}, not {column}")
+        return current.lookup(column, value)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_reference_cache():
+    """Returns this process's reference data cache, starting its background load on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ReferenceDataCache(default_sources())
+    _cache.start()
+    return _cache
+
+
+async def lookup_reference_data(table: str, column: str, value: str) -> dict:
+    """
+    Looks up rows of a small reference table held in memory.
+
+    Tables and the columns they can be looked up by:
+    - weather: the daily NYC weather (date, max_temp_f, low_temp_f, condition,
+      location); look up by date (YYYY-MM-DD) or condition (e.g. snow).
+    - car_recommendations: recommended cars per weather condition (Weather,
+      Car Brand, Model, Year, State, License Plate); look up by Weather.
+
+    Matching ignores case. Returns the matching rows, or an error if the table
+    or column is unknown or the weather replica is stale.
+    """
+    # Creating the cache builds its sources, which may create a storage client
+    cache = await asyncio.to_thread(get_reference_cache)
+    error = cache.stale_error(table)
+    if error:
+        return error
+    try:
+        rows = cache.lookup(table, column, value)
+    except KeyError as e:
+        return {"error": str(e.args[0])}
+    return {"table": table, "rows": rows}
@@ -0,0 +1,404 @@
+# Daily rollups of the taxi table and the query rewrite that uses them
+#
+# Nearly every question the Postgres agent answers is a per-day aggregate over
+# nyc_taxi_table. nyc_taxi_daily_rollup keeps one row per pickup date with the
+# ride count and the sum and non-null count of each measure. That is enough to
+# answer COUNT, SUM and AVG exactly. The rollup is refreshed incrementally: rows
+# with a trip_id above the stored watermark are aggregated and added to the
+# existing days. UPDATE, DELETE and TRUNCATE on the taxi table fire a trigger
+# that marks the rollup invalidated, and the next refresh rebuilds it from
+# scratch. Refreshes run in a scheduled job (connector_deployment/
+# refresh_rollup.py), never on the agent's request path. Queries that group
+# the taxi table by pickup date, with only supported aggregates and date-range
+# filters, are rewritten to read the rollup while it covers every taxi row;
+# any other query, or any query while the rollup is behind, runs unchanged.
+
+import asyncio
+import os
+import re
+import time
+
+TAXI_TABLE = os.getenv("GOOGLE_CLOUD_POSTGRES_TABLE") or "nyc_taxi_table"
+ROLLUP_TABLE = "nyc_taxi_daily_rollup"
+ROLLUP_STATE_TABLE = "nyc_taxi_daily_rollup_state"
+
+TRAVEL_SECONDS = "EXTRACT(EPOCH FROM (tpep_dropoff_datetime - tpep_pickup_datetime))"
+
+# Rollup column prefix to the expression it aggregates
+MEASURES = {
+    "travel_seconds": TRAVEL_SECONDS,
+    "trip_distance": "trip_distance",
+    "passenger_count": "passenger_count",
+    "fare_amount": "fare_amount",
+    "tip_amount": "tip_amount",
+    "tolls_amount": "tolls_amount",
+    "total_amount": "total_amount",
+}
+
+ROLLUP_DDL = [
+    f"CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (\n"
+    "    travel_date DATE PRIMARY KEY,\n"
+    "    ride_count BIGINT NOT NULL,\n"
+    + "".join(
+        f"    {name}_sum NUMERIC NOT NULL,\n    {name}_count BIGINT NOT NULL,\n"
+        for name in MEASURES
+    ).rstrip(",\n")
+    + "\n)",
+    f"CREATE TABLE IF NOT EXISTS {ROLLUP_STATE_TABLE} (\n"
+    "    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),\n"
+    "    last_trip_id BIGINT NOT NULL,\n"
+    "    refreshed_at TIMESTAMPTZ,\n"
+    "    invalidated BOOLEAN NOT NULL DEFAULT FALSE\n"
+    ")",
+    f"ALTER TABLE {ROLLUP_STATE_TABLE} ADD COLUMN IF NOT EXISTS invalidated BOOLEAN NOT NULL DEFAULT FALSE",
+    f"INSERT INTO {ROLLUP_STATE_TABLE} (last_trip_id) VALUES (0) ON CONFLICT DO NOTHING",
+    # Changes the incremental refresh cannot see mark the rollup for a rebuild
+    f"CREATE OR REPLACE FUNCTION {ROLLUP_TABLE}_invalidate() RETURNS trigger LANGUAGE plpgsql AS $$\n"
+    "BEGIN\n"
+    f"    UPDATE {ROLLUP_STATE_TABLE} SET invalidated = TRUE WHERE NOT invalidated;\n"
+    "    RETURN NULL;\n"
+    "END\n"
+    "$$",
+    f"DROP TRIGGER IF EXISTS {ROLLUP_TABLE}_invalidate ON {TAXI_TABLE}",
+    f"CREATE TRIGGER {ROLLUP_TABLE}_invalidate AFTER UPDATE OR DELETE OR TRUNCATE ON {TAXI_TABLE} "
+    f"FOR EACH STATEMENT EXECUTE FUNCTION {ROLLUP_TABLE}_invalidate()",
+]
+
+
+def create_rollup_tables(conn):
+    """Creates the rollup and watermark tables if they do not exist, and the taxi table's trigger."""
+    with conn.cursor() as cur:
+        for statement in ROLLUP_DDL:
+            cur.execute(statement)
+    conn.commit()
+
+
+def reset_daily_rollup(cur):
+    """
+    Empties the rollup and its watermark, for callers emptying the taxi table.
+
+    Runs on the caller's cursor, so it commits with the TRUNCATE. Does nothing
+    if the rollup tables do not exist.
+    """
+    cur.execute("SELECT to_regclass(%s)", (ROLLUP_STATE_TABLE,))
+    if cur.fetchone()[0] is None:
+        return
+    cur.execute(f"TRUNCATE TABLE {ROLLUP_TABLE}")
+    cur.execute(f"UPDATE {ROLLUP_STATE_TABLE} SET last_trip_id = 0, invalidated = FALSE, refreshed_at = now()")
+
+
+def refresh_daily_rollup(conn):
+    """
+    Adds taxi rows loaded since the last refresh to the daily rollup.
+
+    If the rollup was invalidated by an UPDATE, DELETE or TRUNCATE of the taxi
+    table, it is emptied and rebuilt from every row instead. The taxi table is
+    locked in SHARE mode for the refresh. Loads still in flight commit before
+    the new watermark is read, so none of their rows can fall below it, and
+    new loads wait until the refresh commits; this is why the refresh belongs
+    in a scheduled job. Returns the number of days updated.
+    """
+    columns = ", ".join(f"{name}_sum, {name}_count" for name in MEASURES)
+    aggregates = ", ".join(
+        f"COALESCE(SUM({expr}), 0), COUNT({expr})" for expr in MEASURES.values()
+    )
+    updates = ", ".join(
+        f"{name}_{kind} = r.{name}_{kind} + EXCLUDED.{name}_{kind}"
+        for name in MEASURES
+        for kind in ("sum", "count")
+    )
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"LOCK TABLE {TAXI_TABLE} IN SHARE MODE")
+            cur.execute(f"SELECT last_trip_id, invalidated FROM {ROLLUP_STATE_TABLE} FOR UPDATE")
+            last_trip_id, invalidated = cur.fetchone()
+            cur.execute(f"SELECT COALESCE(MAX(trip_id), 0) FROM {TAXI_TABLE}")
+            new_trip_id = cur.fetchone()[0]
+            if invalidated:
+                cur.execute(f"TRUNCATE TABLE {ROLLUP_TABLE}")
+                last_trip_id = 0
+            elif new_trip_id <= last_trip_id:
+                conn.rollback()
+                return 0
+            cur.execute(
+                f"INSERT INTO {ROLLUP_TABLE} AS r (travel_date, ride_count, {columns}) "
+                f"SELECT DATE(tpep_pickup_datetime), COUNT(*), {aggregates} "
+                f"FROM {TAXI_TABLE} WHERE trip_id > %s AND trip_id <= %s "
+                f"GROUP BY 1 "
+                f"ON CONFLICT (travel_date) DO UPDATE SET ride_count = r.ride_count + EXCLUDED.ride_count, {updates}",
+                (last_trip_id, new_trip_id),
+            )
+            aggregated = cur.rowcount
+            cur.execute(
+                f"UPDATE {ROLLUP_STATE_TABLE} SET last_trip_id = %s, invalidated = FALSE, refreshed_at = now()",
+                (new_trip_id,),
+            )
+        conn.commit()
+        return aggregated
+    except Exception:
+        conn.rollback()
+        raise
+
+
+FRESHNESS_QUERY = (
+    f"SELECT NOT invalidated AND last_trip_id >= (SELECT COALESCE(MAX(trip_id), 0) FROM {TAXI_TABLE}) "
+    f"AS rollup_fresh FROM {ROLLUP_STATE_TABLE}"
+)
+
+
+def rollup_is_fresh(conn):
+    """Returns whether the rollup covers every row of the taxi table and was not invalidated."""
+    with conn.cursor() as cur:
+        cur.execute(FRESHNESS_QUERY)
+        row = cur.fetchone()
+        return bool(row and row[0])
+
+
+def rollup_is_usable(conn):
+    """
+    Reports whether rewritten queries can read the rollup now.
+
+    Only checks; it never refreshes, so a request never waits on the taxi
+    table lock. Any failure (missing tables, an old unpartitioned taxi table
+    without trip_id, or missing privileges) leaves the connection usable and
+    returns False, so the caller runs the original query instead.
+    """
+    try:
+        return rollup_is_fresh(conn)
+    except Exception:
+        return False
+    finally:
+        conn.rollback()
+
+
+# Query rewrite
+
+_DATE_EXPRS = {
+    "date(tpep_pickup_datetime)",
+    "tpep_pickup_datetime::date",
+    "cast(tpep_pickup_datetime as date)",
+}
+_DATE_LITERAL = r"(?:date\s*)?'(\d{4}-\d{2}-\d{2})(?:[ t]00:00(?::00)?)?'(?:::date|::timestamp)?"
+_ALIAS = r"(?:\s+as)?\s+([a-z_][a-z0-9_]*)"
+
+
+def _normalize(expr):
+    expr = re.sub(r"\s+", " ", expr.strip().lower())
+    return re.sub(r"\s*([(),:*-])\s*", r"\1", expr)
+
+
+def _split_top_level(text, separator=","):
+    parts, depth, current = [], 0, ""
+    for char in text:
+        depth += char == "("
+        depth -= char == ")"
+        if char == separator and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += char
+    parts.append(current)
+    return [p.strip() for p in parts]
+
+
+def _strip_outer_parens(expr):
+    # "((a-b))" -> "a-b", but "(a)-(b)" is left alone
+    while expr.startswith("(") and expr.endswith(")"):
+        depth = 0
+        for i, char in enumerate(expr):
+            depth += char == "("
+            depth -= char == ")"
+            if depth == 0 and i < len(expr) - 1:
+                return expr
+        expr = expr[1:-1]
+    return expr
+
+
+def _is_date_expr(expr):
+    return _normalize(expr) in _DATE_EXPRS
+
+
+def _rewrite_aggregate(expr):
+    """Returns the rollup expression and default column name for an aggregate, or None."""
+    normalized = _normalize(expr)
+    if normalized in ("count(*)", "count(1)"):
+        return "ride_count", "count"
+    match = re.fullmatch(r"(avg|sum|count)\((.+)\)", normalized)
+    if not match:
+        return None
+    function, argument = match.groups()
+    argument = _strip_outer_parens(argument)
+    for name, measure in MEASURES.items():
+        if _normalize(measure) == argument:
+            break
+    else:
+        return None
+    if function == "count":
+        return f"{name}_count", "count"
+    if function == "sum":
+        return f"CASE WHEN {name}_count > 0 THEN {name}_sum END", "sum"
+    return f"{name}_sum / NULLIF({name}_count, 0)", "avg"
+
+
+def _rewrite_predicate(predicate):
+    """Maps a pickup date-range predicate to a travel_date predicate, or returns None."""
+    normalized = re.sub(r"\s+", " ", predicate.strip().lower())
+    column = r"(date\s*\(\s*tpep_pickup_datetime\s*\)|tpep_pickup_datetime\s*::\s*date|cast\s*\(\s*tpep_pickup_datetime\s+as\s+date\s*\)|tpep_pickup_datetime)"
+    match = re.fullmatch(rf"{column}\s*(>=|<=|=|<|>)\s*{_DATE_LITERAL}", normalized)
+    if match:
+        left, operator, day = match.groups()
+        if left == "tpep_pickup_datetime" and operator not in (">=", "<"):
+            # At midnight, only >= and < mean the same on timestamps as on dates
+            return None
+        return f"travel_date {operator} '{day}'"
+    match = re.fullmatch(rf"{column}\s+between\s+{_DATE_LITERAL}\s+and\s+{_DATE_LITERAL}", normalized)
+    if match and match.group(1) != "tpep_pickup_datetime":
+        return f"travel_date BETWEEN '{match.group(2)}' AND '{match.group(3)}'"
+    return None
+
+
+def rewrite_daily_aggregate(query):
+    """
+    Rewrites a per-day aggregate over the taxi table to read the daily rollup.
+
+    Supported: SELECT of the pickup date plus COUNT(*), and COUNT, SUM or AVG
+    of travel time, trip_distance, passenger_count and the fare columns, from
+    the taxi table alone, optionally filtered on pickup date ranges, grouped by
+    the pickup date, with optional ORDER BY and LIMIT. Output column names
+    match the original query. Returns None for anything else.
+    """
+    text = query.strip().rstrip(";").strip()
+    match = re.fullmatch(
+        rf"select\s+(?P<select>.+?)\s+from\s+(?P<table>[a-z_][a-z0-9_]*)"
+        rf"(?:\s+where\s+(?P<where>.+?))?"
+        rf"\s+group\s+by\s+(?P<group>.+?)"
+        rf"(?:\s+order\s+by\s+(?P<order>.+?))?"
+        rf"(?:\s+limit\s+(?P<limit>\d+))?",
+        text,
+        flags=re.IGNORECASE | re.DOTALL,
+    )
+    if not match or match.group("table").lower() != TAXI_TABLE.lower():
+        return None
+
+    select_items = []
+    date_aliases = set()
+    for item in _split_top_level(match.group("select")):
+        alias_match = re.fullmatch(rf"(.+?){_ALIAS}", item, flags=re.IGNORECASE | re.DOTALL)
+        expr, alias = (alias_match.group(1), alias_match.group(2)) if alias_match else (item, None)
+        if alias_match and not (expr.strip().endswith(")") or _is_date_expr(expr)):
+            return None
+        if _is_date_expr(expr):
+            alias = alias or "date"
+            date_aliases.add(alias.lower())
+            select_items.append(f"travel_date AS {alias}")
+            continue
+        rewritten = _rewrite_aggregate(expr)
+        if rewritten is None:
+            return None
+        select_items.append(f"{rewritten[0]} AS {alias or rewritten[1]}")
+    if not date_aliases:
+        return None
+
+    group = match.group("group").strip()
+    date_first = select_items[0].startswith("travel_date AS")
+    if not (_is_date_expr(group) or group.lower() in date_aliases or (group == "1" and date_first)):
+        return None
+
+    conditions = []
+    if match.group("where"):
+        parts = re.split(r"\s+and\s+", match.group("where"), flags=re.IGNORECASE)
+        while parts:
+            predicate = parts.pop(0)
+            if re.search(r"\sbetween\s", predicate, flags=re.IGNORECASE):
+                if not parts:
+                    return None
+                # The AND belongs to BETWEEN ... AND ...
+                predicate = f"{predicate} and {parts.pop(0)}"
+            condition = _rewrite_predicate(predicate)
+            if condition is None:
+                return None
+            conditions.append(condition)
+
+    rewritten = f"SELECT {', '.join(select_items)} FROM {ROLLUP_TABLE}"
+    if conditions:
+        rewritten += " WHERE " + " AND ".join(conditions)
+    if match.group("order"):
+        order_items = []
+        for item in _split_top_level(match.group("order")):
+            direction = re.search(r"\s+(asc|desc)$", item, flags=re.IGNORECASE)
+            column = item[: direction.start()] if direction else item
+            if _is_date_expr(column):
+                column = "travel_date"
+            elif not re.fullmatch(r"[a-z_][a-z0-9_]*|\d+", column.strip(), flags=re.IGNORECASE):
+                return None
+            order_items.append(column.strip() + (f" {direction.group(1).upper()}" if direction else ""))
+        rewritten += " ORDER BY " + ", ".join(order_items)
+    if match.group("limit"):
+        rewritten += f" LIMIT {match.group('limit')}"
+    return rewritten
+
+
+# Tool path integration
+
+POSTGRES_ROLLUP_REWRITE = os.getenv("POSTGRES_ROLLUP_REWRITE", "true").lower() in ("1", "true", "yes")
+# After the database cannot be reached directly, check through the connector for this long
+ROLLUP_RETRY_SECONDS = 300
+_rollup_unavailable_until = 0.0
+
+
+def rewrite_for_connection(conn, query):
+    """Returns the rollup rewrite of a query if the rollup is usable on this connection, else the query."""
+    if not POSTGRES_ROLLUP_REWRITE:
+        return query
+    rewritten = rewrite_daily_aggregate(query)
+    if rewritten is None or not rollup_is_usable(conn):
+        return query
+    return rewritten
+
+
+def _usable_directly():
+    from db_buddy.tools.tools_custom import pooled_postgres_connection
+
+    with pooled_postgres_connection() as conn:
+        return rollup_is_usable(conn)
+
+
+async def _usable_through_connector(tool, args, tool_context):
+    from db_buddy.tools import query_guard
+
+    try:
+        fresh = await query_guard.query_through_connector(tool, args, tool_context, FRESHNESS_QUERY, "rollup_fresh")
+    except Exception:
+        return False
+    return str(fresh).lower() in ("true", "t", "1")
+
+
+async def rewrite_rollup_queries(tool, args, tool_context):
+    """
+    Before-tool callback pointing per-day aggregate queries at the daily rollup.
+
+    Rewrites the ``query`` argument of the Postgres connector's custom query
+    action in place when the rollup is up to date, checked over a pooled
+    connection. If the database cannot be reached directly, the check is made
+    through the connector for ROLLUP_RETRY_SECONDS. If neither check
+    succeeds, the query is sent unchanged; the rollup is never read without
+    a check, so a failed check only costs speed, never correctness.
+    """
+    global _rollup_unavailable_until
+    query = args.get("query")
+    if not POSTGRES_ROLLUP_REWRITE or not isinstance(query, str):
+        return None
+    rewritten = rewrite_daily_aggregate(query)
+    if rewritten is None:
+        return None
+    usable = None
+    if time.monotonic() >= _rollup_unavailable_until:
+        try:
+            usable = await asyncio.to_thread(_usable_directly)
+        except Exception:
+            _rollup_unavailable_until = time.monotonic() + ROLLUP_RETRY_SECONDS
+    if usable is None:
+        usable = await _usable_through_connector(tool, args, tool_context)
+    if usable:
+        args["query"] = rewritten
+    return None
@@ -0,0 +1,207 @@
+# Schema catalog for the SQL sub-agents
+#
+# Without the table definitions the Postgres and SQL Server agents guess column
+# names, or spend tool calls discovering them. The catalog records the tables,
+# columns, types and indexes of each database and is rendered compactly into
+# the agents' instructions. connector_deployment/build_schema_catalog.py
+# introspects both databases and writes schema_catalog.json next to the
+# package, so it is deployed with the agent. When the Postgres database is
+# reachable, its part of the catalog can also be introspected live at start-up.
+# Each database's entry carries a version, a hash of its contents, and an
+# instruction is only re-rendered when that version changes.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+SCHEMA_CATALOG_PATH = os.getenv("SCHEMA_CATALOG_PATH") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "schema_catalog.json"
+)
+
+# Long type names shortened in the rendered catalog
+_SHORT_TYPES = {
+    "timestamp without time zone": "timestamp",
+    "timestamp with time zone": "timestamptz",
+    "character varying": "varchar",
+}
+
+logger = logging.getLogger(__name__)
+
+
+def introspect_postgres(conn):
+    """Returns the tables of the public schema with their columns and indexes.
+
+    Partitions are left out; their columns and indexes are the parent's.
+    """
+    tables = {}
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod) "
+            "FROM pg_attribute a "
+            "JOIN pg_class c ON c.oid = a.attrelid "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'v', 'm') "
+            "AND NOT c.relispartition AND a.attnum > 0 AND NOT a.attisdropped "
+            "ORDER BY c.relname, a.attnum"
+        )
+        for table, column, type_ in cur.fetchall():
+            tables.setdefault(table, {"columns": [], "indexes": []})["columns"].append([column, type_])
+        cur.execute(
+            "SELECT t.relname, ix.indisprimary, pg_get_indexdef(ix.indexrelid) "
+            "FROM pg_index ix "
+            "JOIN pg_class t ON t.oid = ix.indrelid "
+            "JOIN pg_namespace n ON n.oid = t.relnamespace "
+            "WHERE n.nspname = 'public' AND NOT t.relispartition "
+            "ORDER BY t.relname, ix.indisprimary DESC, ix.indexrelid"
+        )
+        for table, primary, definition in cur.fetchall():
+            if table in tables:
+                # "CREATE INDEX name ON table USING btree (cols)" -> "(cols)"
+                columns = definition[definition.index(" USING ") + len(" USING "):].split(" ", 1)[-1]
+                tables[table]["indexes"].append(f"primary key {columns}" if primary else columns)
+    conn.rollback()
+    return tables
+
+
+def introspect_sqlsvr(conn):
+    """Returns the tables of the dbo schema with their columns and indexes."""
+    tables = {}
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE FROM INFORMATION_SCHEMA.COLUMNS "
+            "WHERE TABLE_SCHEMA = 'dbo' ORDER BY TABLE_NAME, ORDINAL_POSITION"
+        )
+        for table, column, type_ in cur.fetchall():
+            tables.setdefault(table, {"columns": [], "indexes": []})["columns"].append([column, type_])
+        cur.execute(
+            "SELECT t.name, i.is_primary_key, "
+            "STRING_AGG(c.name, ', ') WITHIN GROUP (ORDER BY ic.key_ordinal) "
+            "FROM sys.indexes i "
+            "JOIN sys.tables t ON t.object_id = i.object_id "
+            "JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id "
+            "JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id "
+            "WHERE i.type > 0 AND ic.is_included_column = 0 "
+            "GROUP BY t.name, i.index_id, i.is_primary_key "
+            "ORDER BY t.name, i.index_id"
+        )
+        for table, primary, columns in cur.fetchall():
+            if table in tables:
+                tables[table]["indexes"].append(f"primary key ({columns})" if primary else f"({columns})")
+    conn.commit()
+    return tables
+
+
+def catalog_entry(tables):
+    """Wraps introspected tables with their version and the time they were read."""
+    canonical = json.dumps(tables, sort_keys=True, separators=(",", ":"))
+    return {
+        "version": hashlib.sha256(canonical.encode()).hexdigest()[:12],
+        "introspected_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "tables": tables,
+    }
+
+
+def load_catalog(path=SCHEMA_CATALOG_PATH):
+    """Returns the catalog file's database entries, or an empty catalog if there is none."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_catalog(catalog, path=SCHEMA_CATALOG_PATH):
+    """Writes the catalog file atomically."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(catalog, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def render_catalog(entry):
+    """Renders one database's tables as compact text, one line per table and its indexes."""
+    lines = [f"Schema catalog (version {entry['version']}):"]
+    for table, definition in sorted(entry["tables"].items()):
+        columns = ", ".join(
+            f"{name} {_SHORT_TYPES.get(type_, type_)}" for name, type_ in definition["columns"]
+        )
+        lines.append(f"- {table}({columns})")
+        if definition["indexes"]:
+            lines.append(f"  indexes: {'; '.join(definition['indexes'])}")
+    return "\n".join(lines)
+
+
+class SchemaCatalog:
+    """The catalog of this process, loaded from the file on first use."""
+
+    def __init__(self, path=SCHEMA_CATALOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+        self._rendered = {}
+
+    def entries(self):
+        with self._lock:
+            if self._entries is None:
+                self._entries = load_catalog(self.path)
+            return self._entries
+
+    def refresh_postgres(self):
+        """Introspects the Postgres database now and replaces its entry if it changed."""
+        from db_buddy.tools.tools_custom import pooled_postgres_connection
+
+        with pooled_postgres_connection() as conn:
+            entry = catalog_entry(introspect_postgres(conn))
+        entries = self.entries()
+        with self._lock:
+            previous = entries.get("postgres", {}).get("version")
+            if previous != entry["version"]:
+                logger.info(f"Postgres schema catalog version {previous} -> {entry['version']}")
+                self._entries = {**entries, "postgres": entry}
+        return entry["version"]
+
+    def render(self, database):
+        """Returns the rendered catalog of a database, or an empty string if it has none."""
+        entry = self.entries().get(database)
+        if not entry:
+            return ""
+        with self._lock:
+            cached = self._rendered.get(database)
+            if cached is None or cached[0] != entry["version"]:
+                cached = (entry["version"], render_catalog(entry))
+                self._rendered[database] = cached
+            return cached[1]
+
+
+_catalog = SchemaCatalog()
+
+
+def get_schema_catalog():
+    """Returns this process's schema catalog."""
+    return _catalog
+
+
+def instruction_with_catalog(instruction, database):
+    """
+    Returns an instruction provider appending the database's catalog to an instruction.
+
+    The rendered catalog is cached per version, so each invocation only
+    looks it up. Without a catalog the instruction is used unchanged.
+    """
+
+    def provider(readonly_context=None):
+        catalog = _catalog.render(database)
+        if not catalog:
+            return instruction
+        return (
+            f"{instruction}\n"
+            f"    The tables of this database are listed below; use their names and columns exactly.\n"
+            + "\n".join(f"    {line}" for line in catalog.splitlines())
+            + "\n"
+        )
+
+    return provider
@@ -0,0 +1,209 @@
+# Coalescing of identical in-flight backend calls
+#
+# When several sessions ask the same question at once, their agents often send
+# the same query: the same Postgres SELECT, the same SQL Server LIST or the
+# same RAG retrieval. Rather than running it once per session, the first call
+# runs it and every identical call that arrives while it is in flight waits
+# for that result and gets its own copy. Calls are identical when their
+# backend, credentials scope (the identity the call is made with) and
+# normalized request match, so results are never shared across identities.
+# Only reads are coalesced; two identical INSERTs both run. Each backend
+# counts its calls, the calls that ran and the calls that were coalesced,
+# exported as the db_buddy.single_flight OpenTelemetry counter.
+
+import asyncio
+import concurrent.futures
+import copy
+import json
+import os
+import re
+import threading
+
+from opentelemetry import metrics, trace
+
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+# Argument names holding SQL text
+SQL_ARGUMENTS = ("query", "filter_clause", "filterClause")
+# Quoted literals and identifiers, which normalization leaves untouched
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\[[^\]]*\])")
+_READ_STATEMENTS = ("select", "with", "values", "table", "show")
+_WRITE_WORDS = re.compile(
+    r"\b(insert|update|delete|merge|into|create|drop|alter|truncate|grant|revoke|copy|call|lock|vacuum|set)\b"
+)
+
+
+def normalize_sql(query):
+    """Collapses whitespace and case outside quoted literals and identifiers, and drops a trailing semicolon."""
+    parts = _QUOTED.split(query)
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i]).lower()
+    return "".join(parts).strip().rstrip(";").rstrip()
+
+
+def unquoted_sql(query):
+    """Returns the normalized query with its quoted literals and identifiers left out."""
+    return " ".join(_QUOTED.split(normalize_sql(query))[::2])
+
+
+def is_read_query(query):
+    """Returns True for a single statement that only reads."""
+    unquoted = unquoted_sql(query)
+    if ";" in unquoted:
+        return False
+    first = unquoted.lstrip("( ").split(" ", 1)[0]
+    return first in _READ_STATEMENTS and not _WRITE_WORDS.search(unquoted)
+
+
+def request_key(scope, operation, args):
+    """Returns the key identifying a call: its credentials scope, operation and normalized arguments."""
+    normalized = {
+        name: (normalize_sql(value) if name in SQL_ARGUMENTS else value.strip())
+        if isinstance(value, str) else value
+        for name, value in args.items()
+    }
+    return json.dumps([scope, operation, normalized], sort_keys=True, default=str)
+
+
+class _LeaderCancelled(Exception):
+    """Raised to the waiters of a call whose leader was cancelled; they run the call themselves."""
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time and shares its result with identical concurrent calls.
+
+    The first caller of a key is its leader and runs the call; callers with
+    the same key arriving before it finishes wait and get a copy of the
+    result, or the same exception. Works across threads and event loops.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+        # Counts at the last reset(); the exported counters never go back
+        self._baseline = (0, 0, 0)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def _join(self, key):
+        with self._lock:
+            self.calls += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._in_flight[key] = concurrent.futures.Future()
+            self.executed += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def _mark_coalesced(self):
+        trace.get_current_span().set_attribute("db_buddy.single_flight.coalesced", True)
+
+    def do(self, key, fn, *args, **kwargs):
+        """Calls fn(*args, **kwargs), or waits for the identical call in flight."""
+        future, leader = self._join(key)
+        if not leader:
+            self._mark_coalesced()
+            try:
+                return copy.deepcopy(future.result())
+            except _LeaderCancelled:
+                return self.do(key, fn, *args, **kwargs)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e if isinstance(e, Exception) else _LeaderCancelled())
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def do_async(self, key, fn, *args, **kwargs):
+        """Awaits fn(*args, **kwargs), or waits for the identical call in flight."""
+        future, leader = self._join(key)
+        if not leader:
+            self._mark_coalesced()
+            try:
+                # Shielded, so a waiter being cancelled does not cancel the shared call
+                return copy.deepcopy(await asyncio.shield(asyncio.wrap_future(future)))
+            except _LeaderCancelled:
+                return await self.do_async(key, fn, *args, **kwargs)
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e if isinstance(e, Exception) else _LeaderCancelled())
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def stats(self):
+        """Returns the counts since the last reset()."""
+        with self._lock:
+            calls, executed, coalesced = (
+                count - base for count, base in zip((self.calls, self.executed, self.coalesced), self._baseline)
+            )
+            return {
+                "calls": calls,
+                "executed": executed,
+                "coalesced": coalesced,
+                "coalesced_ratio": coalesced / calls if calls else 0.0,
+                "in_flight": len(self._in_flight),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._baseline = (self.calls, self.executed, self.coalesced)
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_single_flight(backend):
+    """Returns this process's SingleFlight for a backend."""
+    with _flights_lock:
+        if backend not in _flights:
+            _flights[backend] = SingleFlight(backend)
+        return _flights[backend]
+
+
+def snapshot():
+    """Returns the statistics of every backend."""
+    with _flights_lock:
+        flights = list(_flights.values())
+    return {flight.name: flight.stats() for flight in flights}
+
+
+def reset():
+    """Resets the statistics of every backend."""
+    with _flights_lock:
+        flights = list(_flights.values())
+    for flight in flights:
+        flight.reset()
+
+
+def _observe(_):
+    with _flights_lock:
+        flights = list(_flights.values())
+    observations = []
+    for flight in flights:
+        # Cumulative, unaffected by reset()
+        for outcome in ("executed", "coalesced"):
+            observations.append(metrics.Observation(getattr(flight, outcome), {"backend": flight.name, "outcome": outcome}))
+    return observations
+
+
+metrics.get_meter(__name__).create_observable_counter(
+    "db_buddy.single_flight",
+    callbacks=[_observe],
+    description="Backend calls that ran, and identical concurrent calls that shared their result",
+)
@@ -0,0 +1,226 @@
+# Local pre-flight checks for model-generated SQL
+#
+# A query with a syntax error, the other database's dialect or a misspelled
+# table only fails after a round trip through the Application Integration
+# connector or the Cloud SQL proxy, and the model then tries again. Before a
+# query is sent, it is parsed here with sqlglot in the target dialect
+# (Postgres or T-SQL), and its tables and columns are resolved against the
+# schema catalog. Problems come back at once as precise errors, with close
+# matches for unknown names. A query written in the other dialect is reported
+# with its transpiled form, or transpiled in place when SQL_AUTO_TRANSPILE is
+# set. Results are cached per query and catalog version.
+
+import difflib
+import functools
+import os
+
+from db_buddy.tools import schema_catalog
+
+SQL_VALIDATION = os.getenv("SQL_VALIDATION", "true").lower() in ("1", "true", "yes")
+SQL_AUTO_TRANSPILE = os.getenv("SQL_AUTO_TRANSPILE", "false").lower() in ("1", "true", "yes")
+
+# Catalog database name to sqlglot dialect
+DIALECTS = {"postgres": "postgres", "sqlsvr": "tsql"}
+DIALECT_NAMES = {"postgres": "PostgreSQL", "tsql": "T-SQL"}
+# Schemas whose tables are in the catalog
+CATALOG_SCHEMAS = {"", "public", "dbo"}
+# System catalogs and views, which are never in the catalog
+SYSTEM_TABLE_PREFIXES = ("pg_", "sys")
+
+
+class ValidationResult:
+    """The outcome of validating one query: errors, and the query to run if it was transpiled."""
+
+    def __init__(self, errors=(), query=None):
+        self.errors = tuple(errors)
+        self.query = query
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def message(self):
+        return "The query was not sent to the database: " + " ".join(self.errors)
+
+
+def _parse_error(error):
+    details = error.errors[0] if getattr(error, "errors", None) else None
+    if not details:
+        return str(error)
+    return (
+        f"Syntax error at line {details['line']}, column {details['col']} near "
+        f"'{details['highlight']}': {details['description']}."
+    )
+
+
+def _suggest(name, candidates):
+    matches = difflib.get_close_matches(name.lower(), [c.lower() for c in candidates], n=1)
+    if not matches:
+        return ""
+    original = next(c for c in candidates if c.lower() == matches[0])
+    return f" Did you mean {original}?"
+
+
+def _unknown_table_error(name, tables):
+    """
+    Returns the error for a table missing from the catalog, or None if it may exist.
+
+    Only a near miss of a catalog table is reported. System catalogs,
+    partitions (named after their parent table) and tables too different to be
+    a typo may exist outside the catalog, so the database decides.
+    """
+    lowered = name.lower()
+    if lowered.startswith(SYSTEM_TABLE_PREFIXES):
+        return None
+    if any(lowered.startswith(f"{table.lower()}_") for table in tables):
+        return None
+    suggestion = _suggest(name, tables)
+    return f"Table {name} does not exist.{suggestion}" if suggestion else None
+
+
+def _identifier_errors(statement, dialect, tables):
+    """
+    Checks the tables and columns a statement references against the catalog tables.
+
+    Only names that are certainly wrong are errors. Anything the catalog
+    cannot resolve (table functions, system catalogs, subqueries, whole-row
+    references) is left to the database.
+    """
+    from sqlglot import exp
+
+    errors = []
+    case_sensitive = dialect == "postgres"
+    by_name = {name.lower(): name for name in tables}
+    derived = {cte.alias_or_name.lower() for cte in statement.find_all(exp.CTE)}
+
+    # Alias or table name to catalog table
+    sources = {}
+    resolvable = True
+    for table in statement.find_all(exp.Table):
+        name = table.name
+        if not isinstance(table.this, exp.Identifier):
+            # A table function such as generate_series(...)
+            resolvable = False
+            sources[table.alias_or_name.lower()] = None
+            continue
+        if name.lower() in derived or table.db.lower() not in CATALOG_SCHEMAS:
+            resolvable = False
+            continue
+        catalog_name = by_name.get(name.lower())
+        if case_sensitive and table.this.quoted and catalog_name != name:
+            errors.append(f"Table {name} does not exist.{_suggest(name, tables)}")
+            resolvable = False
+            continue
+        if catalog_name is None:
+            error = _unknown_table_error(name, tables)
+            if error:
+                errors.append(error)
+            resolvable = False
+            continue
+        sources[table.alias_or_name.lower()] = catalog_name
+        sources[catalog_name.lower()] = catalog_name
+    if any(isinstance(s.parent, (exp.From, exp.Join)) for s in statement.find_all(exp.Subquery)):
+        resolvable = False
+
+    aliases = {alias.alias.lower() for alias in statement.find_all(exp.Alias)}
+    for column in statement.find_all(exp.Column):
+        name = column.name
+        if isinstance(column.this, exp.Star) or not name or name.lower() in aliases:
+            continue
+        if not column.table and name.lower() in sources:
+            # A whole-row reference such as json_agg(t)
+            continue
+        if column.table:
+            catalog_name = sources.get(column.table.lower())
+            if catalog_name is None:
+                continue
+            candidates = [c for c, _ in tables[catalog_name]["columns"]]
+        elif resolvable and sources:
+            candidates = [c for t in set(sources.values()) if t for c, _ in tables[t]["columns"]]
+        else:
+            continue
+        quoted = column.this.quoted if isinstance(column.this, exp.Identifier) else False
+        if case_sensitive and quoted:
+            found = name in candidates
+        else:
+            found = name.lower() in {c.lower() for c in candidates}
+        if not found:
+            where = f" in {column.table}" if column.table else ""
+            errors.append(f"Column {name}{where} does not exist.{_suggest(name, candidates)}")
+    return list(dict.fromkeys(errors))
+
+
+@functools.lru_cache(maxsize=1024)
+def _validate(query, database, catalog_version, auto_transpile):
+    import sqlglot
+    from sqlglot.errors import ParseError, UnsupportedError
+
+    dialect = DIALECTS[database]
+    try:
+        statements = [s for s in sqlglot.parse(query, read=dialect) if s is not None]
+    except ParseError as error:
+        other = next(d for d in DIALECTS.values() if d != dialect)
+        try:
+            transpiled = ";\n".join(
+                sqlglot.transpile(query, read=other, write=dialect, unsupported_level="raise")
+            )
+        except (ParseError, UnsupportedError):
+            return ValidationResult([_parse_error(error)])
+        if not auto_transpile:
+            return ValidationResult([
+                f"{_parse_error(error)} The query looks like {DIALECT_NAMES[other]}; "
+                f"in {DIALECT_NAMES[dialect]} it would be: {transpiled}"
+            ])
+        query = transpiled
+        statements = sqlglot.parse(query, read=dialect)
+    if not statements:
+        return ValidationResult(["The query is empty."])
+
+    entry = schema_catalog.get_schema_catalog().entries().get(database)
+    errors = []
+    if entry:
+        for statement in statements:
+            errors += _identifier_errors(statement, dialect, entry["tables"])
+    return ValidationResult(errors, query)
+
+
+def validate_sql(query, database):
+    """
+    Parses a query in the database's dialect and resolves it against the schema catalog.
+
+    database is "postgres" or "sqlsvr". Returns a ValidationResult whose query
+    is the SQL to run, transpiled when SQL_AUTO_TRANSPILE is set. Without
+    sqlglot installed, or with SQL_VALIDATION off, every query passes.
+    """
+    if not SQL_VALIDATION:
+        return ValidationResult(query=query)
+    try:
+        import sqlglot  # noqa: F401
+    except ImportError:
+        return ValidationResult(query=query)
+    entry = schema_catalog.get_schema_catalog().entries().get(database) or {}
+    return _validate(query, database, entry.get("version"), SQL_AUTO_TRANSPILE)
+
+
+def validate_postgres_queries(tool, args, tool_context):
+    """Before-tool callback validating the Postgres connector's custom queries."""
+    query = args.get("query")
+    if not isinstance(query, str):
+        return None
+    result = validate_sql(query, "postgres")
+    if not result.ok:
+        return {"error": result.message()}
+    args["query"] = result.query
+    return None
+
+
+def validate_sqlsvr_filters(tool, args, tool_context):
+    """Before-tool callback validating the filter clause of SQL Server entity LIST calls."""
+    key = next((k for k in ("filter_clause", "filterClause") if isinstance(args.get(k), str)), None)
+    if key is None or not args[key].strip():
+        return None
+    table = os.getenv("GOOGLE_CLOUD_SQLSVR_TABLE") or "nyc-weather-table"
+    result = validate_sql(f"SELECT * FROM [{table}] WHERE {args[key]}", "sqlsvr")
+    if not result.ok:
+        return {"error": result.message()}
+    return None
@@ -1,15 +1,42 @@
 # Custom tools defintions
 
+import fcntl
 import os
+import socket
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from google.adk.tools import FunctionTool
 import psycopg2
+from psycopg2 import pool
 import subprocess 
 from google.adk.tools.application_integration_tool.application_integration_toolset import ApplicationIntegrationToolset
 from google.adk.agents.callback_context import CallbackContext
+from google.adk.tools.tool_context import ToolContext
+
+from db_buddy.tools import admission, query_guard, rollups, single_flight, weather_replica
+from db_buddy.tools.sql_validation import validate_sql
 
 project_id = os.getenv("GOOGLE_CLOUD_PROJECT_ID")
 region = os.getenv("GOOGLE_CLOUD_LOCATION")
 
+# gcloud access tokens are valid for an hour; refresh them well before that
+ACCESS_TOKEN_TTL_SECONDS = int(os.getenv("ACCESS_TOKEN_TTL_SECONDS", "3000"))
+POSTGRES_POOL_MIN_CONNECTIONS = int(os.getenv("POSTGRES_POOL_MIN_CONNECTIONS", "1"))
+POSTGRES_POOL_MAX_CONNECTIONS = int(os.getenv("POSTGRES_POOL_MAX_CONNECTIONS", "10"))
+
+# Shared state below is guarded by locks for concurrent sessions within a
+# worker, and tagged with the owning process ID so a forked worker never
+# reuses its parent's sockets or credentials.
+_credentials_lock = threading.Lock()
+_credentials = {"pid": None, "user": None, "token": None, "expires": 0.0}
+_pools_lock = threading.Lock()
+_pools = {}
+_pools_pid = None
+_schemas_lock = threading.Lock()
+_schemas = {}
+
 
 def get_gcloud_user():
     """Gets the currently logged in gcloud user."""
@@ -35,11 +62,123 @@ def get_access_token():
     except (subprocess.CalledProcessError, FileNotFoundError) as e:
         raise Exception("Could not get access token. Please ensure you are logged in to gcloud.") from e
 
+def get_cached_credentials():
+    """Returns the gcloud user and access token, refreshing them when they expire."""
+    with _credentials_lock:
+        if (
+            _credentials["pid"] != os.getpid()
+            or time.monotonic() >= _credentials["expires"]
+        ):
+            _credentials["user"] = get_gcloud_user()
+            _credentials["token"] = get_access_token()
+            _credentials["expires"] = time.monotonic() + ACCESS_TOKEN_TTL_SECONDS
+            _credentials["pid"] = os.getpid()
+        return _credentials["user"], _credentials["token"]
+
+class _BoundedConnectionPool(pool.ThreadedConnectionPool):
+    """
+    A ThreadedConnectionPool that blocks instead of failing when exhausted.
+
+    With credentials, a callable returning the user and password, every new
+    connection logs in with the current credentials, so connections opened
+    after the access token is refreshed do not use the expired one.
+    """
+
+    def __init__(self, minconn, maxconn, *args, credentials=None, **kwargs):
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._credentials = credentials
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def _connect(self, key=None):
+        if self._credentials is not None:
+            user, password = self._credentials()
+            self._kwargs.update(user=user, password=password)
+        return super()._connect(key)
+
+    def getconn(self, key=None):
+        self._slots.acquire()
+        try:
+            conn = super().getconn(key)
+            if conn.closed:
+                super().putconn(conn, key, close=True)
+                conn = super().getconn(key)
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, key=None, close=False):
+        try:
+            super().putconn(conn, key, close=close)
+        finally:
+            self._slots.release()
+
+def get_postgres_pool(dbname=None):
+    """Returns this process's connection pool for a PostgreSQL database."""
+    global _pools_pid
+    dbname = dbname if dbname else os.getenv("GOOGLE_CLOUD_POSTGRES_DB")
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # Connections inherited across a fork belong to the parent
+            _pools.clear()
+            _pools_pid = os.getpid()
+        if dbname not in _pools:
+            try:
+                # The IAM token is only checked at login, so open connections
+                # outlive it; new ones log in with the current token
+                _pools[dbname] = _BoundedConnectionPool(
+                    POSTGRES_POOL_MIN_CONNECTIONS,
+                    POSTGRES_POOL_MAX_CONNECTIONS,
+                    credentials=get_cached_credentials,
+                    host='127.0.0.1',
+                    port=5432,
+                    dbname=dbname,
+                )
+            except psycopg2.OperationalError as e:
+                raise Exception(
+                    "Could not connect to PostgreSQL. "
+                    "Please ensure the Cloud SQL Auth Proxy is running in a separate terminal. "
+                    "You can start it by running the `cloud_sql_auth_proxy.sh` script."
+                ) from e
+        return _pools[dbname]
+
+@contextmanager
+def pooled_postgres_connection(dbname=None):
+    """Borrows a connection from the pool and returns it when done."""
+    connection_pool = get_postgres_pool(dbname)
+    conn = connection_pool.getconn()
+    try:
+        yield conn
+    finally:
+        if not conn.closed:
+            conn.rollback()
+        connection_pool.putconn(conn, close=bool(conn.closed))
+
+def get_postgres_table_schemas(dbname=None, refresh=False):
+    """Returns the column names and types of every table, cached per database."""
+    dbname = dbname if dbname else os.getenv("GOOGLE_CLOUD_POSTGRES_DB")
+    with _schemas_lock:
+        if dbname in _schemas and not refresh:
+            return _schemas[dbname]
+    with pooled_postgres_connection(dbname) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT table_name, column_name, data_type "
+                "FROM information_schema.columns "
+                "WHERE table_schema = 'public' "
+                "ORDER BY table_name, ordinal_position"
+            )
+            schemas = {}
+            for table_name, column_name, data_type in cur.fetchall():
+                schemas.setdefault(table_name, []).append((column_name, data_type))
+    with _schemas_lock:
+        _schemas[dbname] = schemas
+    return schemas
+
 def get_postgres_connection(dbname=None):
     """Establishes a connection to the PostgreSQL database using IAM authentication."""
     try:
-        iam_user = get_gcloud_user()
-        access_token = get_access_token()
+        iam_user, access_token = get_cached_credentials()
 
         conn = psycopg2.connect(
             host='127.0.0.1',
@@ -59,16 +198,55 @@ def get_postgres_connection(dbname=None):
         ) from e
 
 
-def execute_postgres_query(query: str) -> str:
+def execute_postgres_query(query: str, tool_context: ToolContext = None) -> str:
     """
     Executes a SQL query against a PostgreSQL database and returns the result.
     The postgres connector and corresponding instance/databse/table contains
     information on nyc taxi rides.
     """
-    conn = get_postgres_connection()
+    validation = validate_sql(query, "postgres")
+    if not validation.ok:
+        return f"An error occurred: {validation.message()}"
+    user = admission.user_of(tool_context)
+    if not single_flight.SINGLE_FLIGHT or not single_flight.is_read_query(validation.query):
+        return _execute_admitted_query(validation.query, user)
+    # Identical reads in flight for the same user and database share one run
+    iam_user, _ = get_cached_credentials()
+    scope = f"{iam_user}/{os.getenv('GOOGLE_CLOUD_POSTGRES_DB')}"
+    key = single_flight.request_key(scope, "execute_postgres_query", {"query": validation.query})
+    return single_flight.get_single_flight("cloud_sql_postgres").do(
+        key, _execute_admitted_query, validation.query, user
+    )
+
+def _execute_admitted_query(query, user):
+    if not admission.ADMISSION_CONTROL:
+        return _execute_validated_query(query)
+    scheduler = admission.get_scheduler("cloud_sql_postgres")
+    try:
+        with scheduler.slot(user, admission.classify_query(query)):
+            return _execute_validated_query(query)
+    except admission.BackendBusy as busy:
+        return query_guard.format_error(busy.error())
+
+def _execute_validated_query(query):
+    with pooled_postgres_connection() as conn:
+        # Per-day aggregates are answered from the daily rollup when possible
+        query = rollups.rewrite_for_connection(conn, query)
+        error = weather_replica.check_replica(conn, query)
+        if error:
+            return query_guard.format_error(error)
+        if query_guard.POSTGRES_QUERY_GUARD:
+            query, error = query_guard.check_query(conn, query)
+            if error:
+                return query_guard.format_error(error)
+        return _run_query(conn, query)
+
+def _run_query(conn, query):
     cur = conn.cursor()
     try:
-        cur.execute(query)
+        query_guard.set_statement_timeout(cur)
+        with query_guard.running_query(conn):
+            cur.execute(query)
         if cur.description:
             # Fetch all rows for queries that return results (e.g., SELECT)
             results = cur.fetchall()
@@ -78,20 +256,46 @@ def execute_postgres_query(query: str) -> str:
             formatted_results = ", ".join(colnames) + "\n"
             for row in results:
                 formatted_results += ", ".join(map(str, row)) + "\n"
+            if query_guard.is_limited(query) and len(results) >= query_guard.POSTGRES_MAX_QUERY_ROWS:
+                formatted_results += query_guard.LIMIT_NOTE + "\n"
             return formatted_results
         else:
             # For queries that don't return rows (e.g., INSERT, UPDATE, DELETE)
             # return the number of rows affected.
             return f"Query executed successfully. {cur.rowcount} rows affected."
+    except psycopg2.errors.QueryCanceled as e:
+        if "statement timeout" in str(e):
+            return query_guard.format_error(query_guard.timeout_error())
+        return query_guard.format_error({"error": "query_cancelled", "message": "The query was cancelled."})
     except Exception as e:
         return f"An error occurred: {e}"
     finally:
         cur.close()
-        conn.close()
+
+def _proxy_is_listening():
+    """Checks whether something is accepting connections on the proxy port."""
+    try:
+        with socket.create_connection(("127.0.0.1", 5432), timeout=1):
+            return True
+    except OSError:
+        return False
 
 def setup_before_agent_call(callback_context: CallbackContext):
     """Setup the agent and ensure that the Cloud SQL Proxy is running"""
-    
+    # Several workers and sessions may run this callback at the same time.
+    # Serialize them across processes and leave a running proxy alone, so
+    # one session never kills the proxy another session is using.
+    lock_path = os.path.join(tempfile.gettempdir(), "db_buddy_cloud_sql_proxy.lock")
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if _proxy_is_listening():
+                return
+            _restart_cloud_sql_proxy()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _restart_cloud_sql_proxy():
     proxy_path = os.getenv("GOOGLE_CLOUD_POSTGRES_PATH")
     proxy_script = os.getenv("GOOGLE_CLOUD_POSTGRES_PROXY_SCRIPT")
 
@@ -1,10 +1,24 @@
 # Native Tools defintion
+#
+# The connectors below are built on first use rather than at import time:
+# building them imports the Application Integration and RAG modules, calls
+# vertexai.init and looks up the RAG corpus over the network. Importing
+# db_buddy.agent therefore stays cheap, and each agent pays for its tools
+# only when it first runs.
+#
+# Read calls of the connectors go through single_flight, so identical calls
+# made at the same time by concurrent sessions share one backend request, and
+# every call that reaches a backend first takes a slot from its admission
+# scheduler.
 
+import asyncio
 import os
-from google.adk.tools.application_integration_tool.application_integration_toolset import ApplicationIntegrationToolset
-from google.adk.tools.retrieval.vertex_ai_rag_retrieval import VertexAiRagRetrieval
-from vertexai.preview import rag
-import vertexai
+import threading
+
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+
+from db_buddy.tools import admission, single_flight
 
 # Helper function to get environment variables
 def get_env_var(key):
@@ -22,16 +36,6 @@ cloud_sql_sqlsvr_app_int_tool_name_prefix = os.getenv("CLOUD_SQL_SQLSVR_APP_INT_
 cloud_sql_sqlsvr_app_int_tool_instructions = os.getenv("CLOUD_SQL_SQLSVR_APP_INT_TOOL_INSTRUCTIONS") # Optional, can be None
 google_cloud_sqlsvr_table = get_env_var("GOOGLE_CLOUD_SQLSVR_TABLE")
 
-# Build Integration Connector object - Cloud SQL SQL Server
-app_int_cloud_sql_sqlsvr_connector = ApplicationIntegrationToolset(
-    project=project_id,
-    location=cloud_sql_sqlsvr_app_int_region, 
-    connection=cloud_sql_sqlsvr_app_int_connection, 
-    entity_operations={google_cloud_sqlsvr_table: ["LIST", "GET", "CREATE", "UPDATE", "DELETE"]},
-    tool_name_prefix=cloud_sql_sqlsvr_app_int_tool_name_prefix,
-    tool_instructions=cloud_sql_sqlsvr_app_int_tool_instructions
-)
-
 # Set variables for Integration Connector - Cloud SQL Postgres
 cloud_sql_postgres_app_int_region = get_env_var("CLOUD_SQL_POSTGRES_APP_INT_REGION")
 cloud_sql_postgres_app_int_connection = get_env_var("CLOUD_SQL_POSTGRES_APP_INT_CONNECTION")
@@ -39,39 +43,214 @@ cloud_sql_postgres_app_int_tool_name_prefix = os.getenv("CLOUD_SQL_POSTGRES_APP_
 cloud_sql_postgres_app_int_tool_instructions = os.getenv("CLOUD_SQL_POSTGRES_APP_INT_TOOL_INSTRUCTIONS") # Optional, can be None
 google_cloud_postgres_table = os.getenv("GOOGLE_CLOUD_POSTGRES_TABLE") # This variable is not directly used in the constructor for Postgres, so it's less critical for this specific error.
 
-# Build Integration Connector object - Cloud SQL Postgres
-app_int_cloud_sql_postgres_connector = ApplicationIntegrationToolset(
-    project=project_id, 
-    location=cloud_sql_postgres_app_int_region, 
-    connection=cloud_sql_postgres_app_int_connection, 
-    actions=["ExecuteCustomQuery"],
-    tool_name_prefix=cloud_sql_postgres_app_int_tool_name_prefix,
-    tool_instructions=cloud_sql_postgres_app_int_tool_instructions
-)
-
 # Set variables for RAG Engine Connector
 rag_engine_region = get_env_var("RAG_ENGINE_REGION")
 rag_engine_name = get_env_var("RAG_ENGINE_NAME")
 
-# Dynamically find the rag_corpus name
-vertexai.init(project=project_id, location=rag_engine_region)
-rag_corpora = rag.list_corpora()
-rag_corpus_name = ""
-for corpus in rag_corpora:
-    if corpus.display_name == rag_engine_name:
-        rag_corpus_name = corpus.name
-        print(f"Found RAG Corpus: {rag_corpus_name}")
-        print(f"Corpus Name: {corpus.name}")
-        break
-
-if not rag_corpus_name:
+
+class BackendTool(BaseTool):
+    """
+    Wraps a tool calling a backend with coalescing and admission control.
+
+    The LLM sees the wrapped tool's declaration unchanged. is_read(tool, args)
+    decides which calls may share one run of the tool, and priority(tool,
+    args) the admission priority of a call. A call that is not admitted
+    returns the backend_busy error.
+    """
+
+    def __init__(self, tool, backend, scope, is_read, priority):
+        super().__init__(name=tool.name, description=tool.description, is_long_running=tool.is_long_running)
+        self.tool = tool
+        self.scope = scope
+        self.is_read = is_read
+        self.priority = priority
+        self.flight = single_flight.get_single_flight(backend)
+        self.scheduler = admission.get_scheduler(backend)
+
+    def _get_declaration(self):
+        return self.tool._get_declaration()
+
+    async def process_llm_request(self, *, tool_context, llm_request):
+        await self.tool.process_llm_request(tool_context=tool_context, llm_request=llm_request)
+        # Function calls are dispatched to the tool registered under the name
+        if llm_request.tools_dict.get(self.name) is self.tool:
+            llm_request.tools_dict[self.name] = self
+
+    async def run_async(self, *, args, tool_context):
+        if not single_flight.SINGLE_FLIGHT or not self.is_read(self.tool, args):
+            return await self._run_admitted(args=args, tool_context=tool_context)
+        key = single_flight.request_key(self.scope, self.name, args)
+        return await self.flight.do_async(key, self._run_admitted, args=args, tool_context=tool_context)
+
+    async def _run_admitted(self, *, args, tool_context):
+        if not admission.ADMISSION_CONTROL:
+            return await self.tool.run_async(args=args, tool_context=tool_context)
+        try:
+            async with self.scheduler.aslot(admission.user_of(tool_context), self.priority(self.tool, args)):
+                return await self.tool.run_async(args=args, tool_context=tool_context)
+        except admission.BackendBusy as busy:
+            return busy.error()
+
+
+class LazyToolset(BaseToolset):
+    """
+    A toolset that builds its tools the first time an agent asks for them.
+
+    With a backend, the tools are wrapped in BackendTool, keyed on scope.
+    """
+
+    def __init__(self, factory, backend=None, scope=None, is_read=None, priority=None):
+        super().__init__()
+        self._factory = factory
+        self._backend = backend
+        self._scope = scope
+        self._is_read = is_read
+        self._priority = priority
+        self._lock = threading.Lock()
+        self._built = None
+        self._wrapped = {}
+
+    def build(self):
+        """Builds (once per process) and returns the wrapped toolset or tool."""
+        with self._lock:
+            if self._built is None:
+                self._built = self._factory()
+            return self._built
+
+    async def get_tools(self, readonly_context=None):
+        built = self._built
+        if built is None:
+            # Building does blocking network calls, keep them off the event loop
+            built = await asyncio.to_thread(self.build)
+        tools = await built.get_tools(readonly_context) if isinstance(built, BaseToolset) else [built]
+        if self._backend is None:
+            return tools
+        return [self._wrap(tool) for tool in tools]
+
+    def _wrap(self, tool):
+        wrapped = self._wrapped.get(id(tool))
+        if wrapped is None or wrapped.tool is not tool:
+            wrapped = self._wrapped[id(tool)] = BackendTool(
+                tool, self._backend, self._scope, self._is_read, self._priority
+            )
+        return wrapped
+
+    async def close(self):
+        if isinstance(self._built, BaseToolset):
+            await self._built.close()
+
+
+def _build_sqlsvr_connector():
+    from google.adk.tools.application_integration_tool.application_integration_toolset import ApplicationIntegrationToolset
+
+    # Build Integration Connector object - Cloud SQL SQL Server
+    return ApplicationIntegrationToolset(
+        project=project_id,
+        location=cloud_sql_sqlsvr_app_int_region,
+        connection=cloud_sql_sqlsvr_app_int_connection,
+        entity_operations={google_cloud_sqlsvr_table: ["LIST", "GET", "CREATE", "UPDATE", "DELETE"]},
+        tool_name_prefix=cloud_sql_sqlsvr_app_int_tool_name_prefix,
+        tool_instructions=cloud_sql_sqlsvr_app_int_tool_instructions
+    )
+
+
+def _build_postgres_connector():
+    from google.adk.tools.application_integration_tool.application_integration_toolset import ApplicationIntegrationToolset
+
+    # Build Integration Connector object - Cloud SQL Postgres
+    return ApplicationIntegrationToolset(
+        project=project_id,
+        location=cloud_sql_postgres_app_int_region,
+        connection=cloud_sql_postgres_app_int_connection,
+        actions=["ExecuteCustomQuery"],
+        tool_name_prefix=cloud_sql_postgres_app_int_tool_name_prefix,
+        tool_instructions=cloud_sql_postgres_app_int_tool_instructions
+    )
+
+
+def resolve_rag_corpus_name():
+    """Finds the resource name of the RAG corpus with the configured display name."""
+    from vertexai.preview import rag
+    import vertexai
+
+    # Dynamically find the rag_corpus name
+    vertexai.init(project=project_id, location=rag_engine_region)
+    for corpus in rag.list_corpora():
+        if corpus.display_name == rag_engine_name:
+            print(f"Found RAG Corpus: {corpus.name}")
+            return corpus.name
     raise ValueError(f"RAG Corpus with display name '{rag_engine_name}' not found.")
 
-# Build RAG Engine Connector object
-rag_engine_connector = VertexAiRagRetrieval(
-    name=rag_engine_name,
-    description="RAG Engine Connector which provides access to car recommendations for weather conditions.",
-    rag_resources=[
-        rag.RagResource(rag_corpus_name)
-    ],
-)
\ No newline at end of file
+
+def _build_rag_engine_connector():
+    from google.adk.tools.retrieval.vertex_ai_rag_retrieval import VertexAiRagRetrieval
+    from vertexai.preview import rag
+
+    rag_corpus_name = resolve_rag_corpus_name()
+
+    # Build RAG Engine Connector object
+    return VertexAiRagRetrieval(
+        name=rag_engine_name,
+        description="RAG Engine Connector which provides access to car recommendations for weather conditions.",
+        rag_resources=[
+            rag.RagResource(rag_corpus_name)
+        ],
+    )
+
+
+def _is_postgres_read(tool, args):
+    query = args.get("query")
+    return isinstance(query, str) and single_flight.is_read_query(query)
+
+
+def _operation_words(tool):
+    # Entity tools are named after their operation, e.g. ..._list_<entity>
+    return set(tool.name.lower().replace("-", "_").split("_"))
+
+
+def _is_sqlsvr_read(tool, args):
+    return bool(_operation_words(tool) & {"list", "get"})
+
+
+def _is_rag_read(tool, args):
+    return True
+
+
+def _postgres_priority(tool, args):
+    query = args.get("query")
+    return admission.classify_query(query) if isinstance(query, str) else admission.INTERACTIVE
+
+
+def _sqlsvr_priority(tool, args):
+    # A LIST without a filter reads the whole table
+    filtered = any(isinstance(args.get(k), str) and args[k].strip() for k in ("filter_clause", "filterClause"))
+    return admission.EXPORT if "list" in _operation_words(tool) and not filtered else admission.INTERACTIVE
+
+
+def _rag_priority(tool, args):
+    return admission.INTERACTIVE
+
+
+# The connectors call their backends as the agent's service account, so every
+# session shares the connection's credentials scope
+app_int_cloud_sql_sqlsvr_connector = LazyToolset(
+    _build_sqlsvr_connector,
+    backend="cloud_sql_sqlserver",
+    scope=f"{project_id}/{cloud_sql_sqlsvr_app_int_region}/{cloud_sql_sqlsvr_app_int_connection}",
+    is_read=_is_sqlsvr_read,
+    priority=_sqlsvr_priority,
+)
+app_int_cloud_sql_postgres_connector = LazyToolset(
+    _build_postgres_connector,
+    backend="cloud_sql_postgres",
+    scope=f"{project_id}/{cloud_sql_postgres_app_int_region}/{cloud_sql_postgres_app_int_connection}",
+    is_read=_is_postgres_read,
+    priority=_postgres_priority,
+)
+rag_engine_connector = LazyToolset(
+    _build_rag_engine_connector,
+    backend="rag_engine",
+    scope=f"{project_id}/{rag_engine_region}/{rag_engine_name}",
+    is_read=_is_rag_read,
+    priority=_rag_priority,
+)
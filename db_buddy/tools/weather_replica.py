@@ -0,0 +1,221 @@
+# Postgres copy of the SQL Server weather table
+#
+# nyc-weather-table is small and holds one row per day, but every taxi and
+# weather question otherwise needs a query to each database and a join done by
+# the model. connector_deployment/replicate_weather.py copies the table into
+# nyc_weather_replica, so the Postgres agent can join it to the taxi table in
+# one query. Changes are captured with the source table's ROWVERSION column:
+# each run copies rows above the stored watermark and deletes rows that no
+# longer exist in the source. The state table records when the replica was
+# last synced. Queries that read a replica older than
+# WEATHER_REPLICA_MAX_STALENESS_SECONDS, or whose sync time cannot be read
+# directly or through the connector, are refused, and the agent asks SQL
+# Server instead.
+
+import asyncio
+import os
+import re
+import time
+
+from db_buddy.tools import query_guard
+
+WEATHER_SOURCE_TABLE = os.getenv("GOOGLE_CLOUD_SQLSVR_TABLE") or "nyc-weather-table"
+REPLICA_TABLE = "nyc_weather_replica"
+REPLICA_STATE_TABLE = "nyc_weather_replica_state"
+
+# Columns copied from the source table, in order
+WEATHER_COLUMNS = [
+    ("date", "DATE"),
+    ("max_temp_f", "INTEGER"),
+    ("low_temp_f", "INTEGER"),
+    ("condition", "VARCHAR(50)"),
+    ("location", "VARCHAR(100)"),
+]
+
+WEATHER_REPLICA_MAX_STALENESS_SECONDS = int(os.getenv("WEATHER_REPLICA_MAX_STALENESS_SECONDS", "3600"))
+
+# A row is identified by its source ROWVERSION, which changes on every update,
+# so an updated row is copied as a new row and its old version is deleted.
+REPLICA_DDL = [
+    f"CREATE TABLE IF NOT EXISTS {REPLICA_TABLE} (\n"
+    "    source_row_version BIGINT PRIMARY KEY,\n"
+    + ",\n".join(f"    {name} {type_}" for name, type_ in WEATHER_COLUMNS)
+    + "\n)",
+    f"CREATE INDEX IF NOT EXISTS {REPLICA_TABLE}_date_idx ON {REPLICA_TABLE} (date)",
+    f"CREATE TABLE IF NOT EXISTS {REPLICA_STATE_TABLE} (\n"
+    "    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),\n"
+    "    last_row_version BIGINT NOT NULL,\n"
+    "    synced_at TIMESTAMPTZ,\n"
+    "    source_rows BIGINT,\n"
+    "    rows_copied BIGINT,\n"
+    "    rows_deleted BIGINT\n"
+    ")",
+    f"INSERT INTO {REPLICA_STATE_TABLE} (last_row_version) VALUES (0) ON CONFLICT DO NOTHING",
+]
+
+
+def create_replica_tables(conn):
+    """Creates the replica and state tables if they do not exist."""
+    with conn.cursor() as cur:
+        for statement in REPLICA_DDL:
+            cur.execute(statement)
+    conn.commit()
+
+
+def get_watermark(conn, full=False):
+    """Returns the last source ROWVERSION copied, or 0 to copy everything again."""
+    if full:
+        return 0
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT last_row_version FROM {REPLICA_STATE_TABLE}")
+        row = cur.fetchone()
+    conn.rollback()
+    return row[0] if row else 0
+
+
+def apply_changes(conn, rows, live_row_versions, new_watermark):
+    """
+    Applies one capture from the source table to the replica in one transaction.
+
+    rows are (row_version, *WEATHER_COLUMNS) tuples changed since the
+    watermark; live_row_versions are the versions of every source row up to
+    new_watermark. Replica rows up to new_watermark that are no longer live
+    were updated or deleted in the source and are removed. Returns the number
+    of rows copied and deleted.
+    """
+    from psycopg2.extras import execute_values
+
+    columns = ", ".join(name for name, _ in WEATHER_COLUMNS)
+    try:
+        with conn.cursor() as cur:
+            # Serializes concurrent runs
+            cur.execute(f"SELECT last_row_version FROM {REPLICA_STATE_TABLE} FOR UPDATE")
+            copied = 0
+            if rows:
+                # One page, so rowcount covers every row
+                execute_values(
+                    cur,
+                    f"INSERT INTO {REPLICA_TABLE} (source_row_version, {columns}) VALUES %s "
+                    f"ON CONFLICT (source_row_version) DO NOTHING",
+                    rows,
+                    page_size=len(rows),
+                )
+                copied = cur.rowcount
+            cur.execute(
+                f"DELETE FROM {REPLICA_TABLE} "
+                f"WHERE source_row_version <= %s AND NOT (source_row_version = ANY(%s))",
+                (new_watermark, list(live_row_versions)),
+            )
+            deleted = cur.rowcount
+            cur.execute(
+                f"UPDATE {REPLICA_STATE_TABLE} SET last_row_version = GREATEST(last_row_version, %s), "
+                f"synced_at = now(), source_rows = %s, rows_copied = %s, rows_deleted = %s",
+                (new_watermark, len(live_row_versions), copied, deleted),
+            )
+        conn.commit()
+        return copied, deleted
+    except Exception:
+        conn.rollback()
+        raise
+
+
+AGE_QUERY = f"SELECT EXTRACT(EPOCH FROM now() - synced_at) AS replica_age_seconds FROM {REPLICA_STATE_TABLE}"
+
+
+def replica_age_seconds(conn):
+    """Returns the seconds since the replica was last synced, or None if it never was."""
+    with conn.cursor() as cur:
+        cur.execute(AGE_QUERY)
+        row = cur.fetchone()
+    conn.rollback()
+    return float(row[0]) if row and row[0] is not None else None
+
+
+# Agent integration
+
+_REPLICA_REFERENCE = re.compile(rf"\b{REPLICA_TABLE}\b", re.IGNORECASE)
+_INSTEAD = "Query the taxi data without it and get the weather from the SQL Server database."
+# Replica age checks are reused for this long
+FRESHNESS_CHECK_SECONDS = 30
+# After the database cannot be reached directly, read the age through the connector for this long
+REPLICA_RETRY_SECONDS = 300
+_freshness = {"checked": 0.0, "age": None}
+_direct_unavailable_until = 0.0
+
+
+def reads_replica(query):
+    """Returns True if a query mentions the weather replica."""
+    return isinstance(query, str) and bool(_REPLICA_REFERENCE.search(query))
+
+
+def stale_replica_error(age):
+    """Returns the error refusing a query on a replica last synced age seconds ago, or None if it is fresh."""
+    if age is not None and age <= WEATHER_REPLICA_MAX_STALENESS_SECONDS:
+        return None
+    synced = "has never been synced" if age is None else f"was last synced {age / 60:.0f} minutes ago"
+    return {
+        "error": (
+            f"{REPLICA_TABLE} {synced}, which is older than the "
+            f"{WEATHER_REPLICA_MAX_STALENESS_SECONDS} second staleness bound. {_INSTEAD}"
+        )
+    }
+
+
+def unchecked_replica_error():
+    """Returns the error refusing a query on a replica whose sync time could not be read."""
+    return {"error": f"The sync time of {REPLICA_TABLE} could not be read, so it may be stale. {_INSTEAD}"}
+
+
+def check_replica(conn, query):
+    """Returns the error refusing a query that reads a stale replica over conn, or None."""
+    if not reads_replica(query):
+        return None
+    try:
+        age = replica_age_seconds(conn)
+    except Exception:
+        conn.rollback()
+        return unchecked_replica_error()
+    return stale_replica_error(age)
+
+
+def _age_directly():
+    from db_buddy.tools.tools_custom import pooled_postgres_connection
+
+    with pooled_postgres_connection() as conn:
+        return replica_age_seconds(conn)
+
+
+async def _read_age(tool, args, tool_context):
+    global _direct_unavailable_until
+    if time.monotonic() >= _direct_unavailable_until:
+        try:
+            return await asyncio.to_thread(_age_directly)
+        except Exception:
+            _direct_unavailable_until = time.monotonic() + REPLICA_RETRY_SECONDS
+    age = await query_guard.query_through_connector(tool, args, tool_context, AGE_QUERY, "replica_age_seconds")
+    return float(age) if age is not None else None
+
+
+async def guard_weather_replica(tool, args, tool_context):
+    """
+    Before-tool callback refusing queries that read a stale weather replica.
+
+    The replica's age is read over a pooled connection, or through the
+    connector while the database cannot be reached directly. Queries that
+    mention the replica are refused when it is stale or its age cannot be
+    read either way, with an error telling the agent to get the weather from
+    SQL Server.
+    """
+    query = args.get("query")
+    if not reads_replica(query):
+        return None
+    if time.monotonic() - _freshness["checked"] >= FRESHNESS_CHECK_SECONDS:
+        try:
+            _freshness["age"] = await _read_age(tool, args, tool_context)
+        except Exception:
+            return unchecked_replica_error()
+        _freshness["checked"] = time.monotonic()
+    age = _freshness["age"]
+    if age is not None:
+        age += time.monotonic() - _freshness["checked"]
+    return stale_replica_error(age)
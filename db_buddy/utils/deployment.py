@@ -13,8 +13,10 @@
 # limitations under the License.
 
 import datetime
+import hashlib
 import json
 import logging
+import os
 from typing import Any
 from dotenv import load_dotenv
 
@@ -39,6 +41,125 @@ def parse_env_vars(env_vars_string: str | None) -> dict[str, str]:
     return env_vars
 
 
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def compute_deployment_manifest(
+    extra_packages: list[str],
+    requirements: list[str],
+    env_vars: dict[str, str],
+    service_account: str | None = None,
+    pickled_sources: list[str] | None = None,
+) -> dict[str, Any]:
+    """Compute content hashes for everything that goes into a deployment.
+
+    Args:
+        extra_packages: Paths of the packaged source directories or files
+        requirements: Requirement specifiers sent to Agent Engine
+        env_vars: Environment variables sent to Agent Engine
+        service_account: Service account the agent runs as
+        pickled_sources: Paths of modules defining classes that are pickled
+            into the deployment rather than packaged, hashed as source
+
+    Returns:
+        Manifest with a hash per packaged file and combined hashes for the
+        source, the requirements and the runtime config (environment
+        variables and service account)
+    """
+    files = {}
+    for package in [*extra_packages, *(pickled_sources or [])]:
+        paths = [package]
+        if os.path.isdir(package):
+            paths = []
+            for root, dirs, filenames in os.walk(package):
+                dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+                paths.extend(
+                    os.path.join(root, name)
+                    for name in sorted(filenames)
+                    if not name.endswith((".pyc", ".pyo"))
+                )
+        for path in paths:
+            with open(path, "rb") as f:
+                files[os.path.normpath(path)] = _sha256(f.read())
+
+    return {
+        "source": _sha256(json.dumps(files, sort_keys=True).encode()),
+        "requirements": _sha256("\n".join(requirements).encode()),
+        # Only the hash is stored so secrets never end up in the manifest
+        "config": _sha256(
+            json.dumps(
+                {"env_vars": env_vars, "service_account": service_account},
+                sort_keys=True,
+            ).encode()
+        ),
+        "files": files,
+    }
+
+
+def load_deployment_manifest(
+    manifest_file: str = "deployment_manifest.json",
+) -> dict[str, Any] | None:
+    """Load the manifest written by the previous deployment.
+
+    Args:
+        manifest_file: Path of the manifest JSON file
+
+    Returns:
+        The manifest, or None if there is no previous deployment
+    """
+    try:
+        with open(manifest_file) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_deployment_manifest(
+    manifest: dict[str, Any],
+    manifest_file: str = "deployment_manifest.json",
+) -> None:
+    """Write the manifest of the current deployment.
+
+    Args:
+        manifest: Manifest from compute_deployment_manifest
+        manifest_file: Path to write the manifest JSON file
+    """
+    with open(manifest_file, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    logging.info(f"Deployment manifest written to {manifest_file}")
+
+
+def diff_deployment_manifests(
+    previous: dict[str, Any] | None, current: dict[str, Any]
+) -> dict[str, Any]:
+    """Compare two deployment manifests.
+
+    Args:
+        previous: Manifest of the last deployment, or None
+        current: Manifest of the deployment being prepared
+
+    Returns:
+        Dictionary flagging which parts changed (source, requirements,
+        config) and listing the added, changed and removed packaged files
+    """
+    previous = previous or {}
+    previous_files = previous.get("files", {})
+    current_files = current["files"]
+    return {
+        "source": previous.get("source") != current["source"],
+        "requirements": previous.get("requirements") != current["requirements"],
+        "config": previous.get("config") != current["config"],
+        "added": sorted(set(current_files) - set(previous_files)),
+        "changed": sorted(
+            path
+            for path in set(current_files) & set(previous_files)
+            if current_files[path] != previous_files[path]
+        ),
+        "removed": sorted(set(previous_files) - set(current_files)),
+    }
+
+
 def write_deployment_metadata(
     remote_agent: Any,
     metadata_file: str = "deployment_metadata.json",
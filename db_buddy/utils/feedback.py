@@ -0,0 +1,196 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any
+
+from db_buddy.utils.typing import Feedback
+
+
+class ScoreAggregate:
+    """Running score statistics for an invocation or an agent."""
+
+    __slots__ = ("count", "total", "min")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+
+    def add(self, score: float) -> None:
+        self.count += 1
+        self.total += score
+        self.min = min(self.min, score)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self) -> dict[str, float]:
+        return {"count": self.count, "mean": self.mean, "min": self.min}
+
+
+class FeedbackBuffer:
+    """
+    Accepts feedback in memory and writes it to Cloud Logging in batches.
+
+    Feedback is queued on the request path and flushed by a background thread,
+    either every ``flush_interval_s`` seconds or as soon as ``batch_size`` entries
+    are waiting. Running score aggregates per invocation and per agent are kept
+    so low-scoring invocations can be looked up without scanning the logs.
+    """
+
+    def __init__(
+        self,
+        logger: Any,
+        flush_interval_s: float = 5,
+        batch_size: int = 100,
+        max_buffered: int = 10000,
+        max_invocations: int = 10000,
+        max_agents: int = 100,
+        low_score_threshold: float = 0.5,
+    ) -> None:
+        """
+        Initialize the buffer and start the flush thread.
+
+        :param logger: Google Cloud Logging logger that feedback is written to
+        :param flush_interval_s: Maximum time feedback waits before being written
+        :param batch_size: Number of entries that triggers an immediate flush
+        :param max_buffered: Maximum entries held; the oldest are dropped beyond it
+        :param max_invocations: Maximum invocations with tracked aggregates
+        :param max_agents: Maximum agent names with tracked aggregates; agent
+            names come from the client, so the least recently rated are dropped
+        :param low_score_threshold: Invocations whose lowest score is at or
+            below this value are considered negatively rated
+        """
+        self.logger = logger
+        self.flush_interval_s = flush_interval_s
+        self.batch_size = batch_size
+        self.max_invocations = max_invocations
+        self.max_agents = max_agents
+        self.low_score_threshold = low_score_threshold
+        self._pending: deque[dict[str, Any]] = deque(maxlen=max_buffered)
+        self._invocations: OrderedDict[str, ScoreAggregate] = OrderedDict()
+        self._agents: OrderedDict[str, ScoreAggregate] = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="feedback-flush", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, feedback: Feedback) -> None:
+        """
+        Queue feedback for logging and update the score aggregates.
+
+        :param feedback: The validated feedback
+        """
+        score = float(feedback.score)
+        with self._lock:
+            self._pending.append(feedback.model_dump())
+            invocation = self._invocations.pop(feedback.invocation_id, None)
+            if invocation is None:
+                invocation = ScoreAggregate()
+                if len(self._invocations) >= self.max_invocations:
+                    self._invocations.popitem(last=False)
+            invocation.add(score)
+            self._invocations[feedback.invocation_id] = invocation
+            agent = self._agents.pop(feedback.agent_name, None)
+            if agent is None:
+                agent = ScoreAggregate()
+                if len(self._agents) >= self.max_agents:
+                    self._agents.popitem(last=False)
+            agent.add(score)
+            self._agents[feedback.agent_name] = agent
+            ready = len(self._pending) >= self.batch_size
+        if ready:
+            self._wake.set()
+
+    def is_flagged(self, invocation_id: str) -> bool:
+        """
+        Check whether an invocation received negative feedback.
+
+        :param invocation_id: The invocation ID
+        :return: True if the lowest score is at or below the threshold
+        """
+        with self._lock:
+            invocation = self._invocations.get(invocation_id)
+            return invocation is not None and invocation.min <= self.low_score_threshold
+
+    def low_scoring_invocations(
+        self, threshold: float | None = None, limit: int = 100
+    ) -> list[dict[str, Any]]:
+        """
+        List the most recent invocations with a low mean score.
+
+        :param threshold: Mean score at or below which an invocation is
+            returned (defaults to the buffer's low score threshold)
+        :param limit: Maximum number of invocations to return
+        :return: Invocation IDs with their score aggregates, newest first
+        """
+        threshold = self.low_score_threshold if threshold is None else threshold
+        with self._lock:
+            result = [
+                {"invocation_id": invocation_id, **aggregate.to_dict()}
+                for invocation_id, aggregate in reversed(self._invocations.items())
+                if aggregate.mean <= threshold
+            ]
+        return result[:limit]
+
+    def agent_scores(self) -> dict[str, dict[str, float]]:
+        """
+        :return: Score aggregates per agent name
+        """
+        with self._lock:
+            return {name: agg.to_dict() for name, agg in self._agents.items()}
+
+    def flush(self) -> None:
+        """Write all pending feedback to Cloud Logging."""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [
+                        self._pending.popleft()
+                        for _ in range(min(self.batch_size, len(self._pending)))
+                    ]
+                if not batch:
+                    return
+                try:
+                    with self.logger.batch() as logging_batch:
+                        for entry in batch:
+                            logging_batch.log_struct(entry, severity="INFO")
+                except Exception as e:
+                    logging.warning(f"Failed to write {len(batch)} feedback entries: {e}")
+                    with self._lock:
+                        self._pending.extendleft(reversed(batch))
+                    return
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.wait(timeout=self.flush_interval_s)
+            self._wake.clear()
+            self.flush()
+
+    def close(self) -> None:
+        """Stop the flush thread and write any remaining feedback."""
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()
@@ -0,0 +1,266 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.trace import StatusCode
+
+INVOCATION_ID_ATTRIBUTE = "gcp.vertex.agent.invocation_id"
+
+
+class _TraceBuffer:
+    """Spans collected for a single trace while waiting for its root span."""
+
+    __slots__ = ("created", "spans")
+
+    def __init__(self) -> None:
+        self.created = time.monotonic()
+        self.spans: list[ReadableSpan] = []
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    A span processor that decides whether to keep a trace once its root span ends.
+
+    Spans are buffered per trace. When the root span ends, the whole trace is
+    forwarded to the wrapped processor if it was slow, contains an error, or was
+    flagged with negative feedback; otherwise it is kept with probability
+    ``sample_rate``. Buffers are bounded by a total span count and a maximum age,
+    after which the oldest traces are decided on with whatever spans they have.
+
+    Feedback usually arrives after the root span has ended, so a trace that
+    would be dropped is held for ``feedback_grace_s`` seconds. It is exported
+    as soon as ``flag_invocation`` is called for its invocation, and otherwise
+    checked against ``is_flagged`` once more before it is dropped. Held traces
+    count towards ``max_buffered_spans``.
+    """
+
+    def __init__(
+        self,
+        delegate: SpanProcessor,
+        sample_rate: float = 0.1,
+        slow_threshold_ms: float = 10000,
+        max_buffered_spans: int = 20000,
+        max_trace_age_s: float = 300,
+        is_flagged: Callable[[str], bool] | None = None,
+        feedback_grace_s: float = 120,
+    ) -> None:
+        """
+        Initialize the sampler.
+
+        :param delegate: Processor (typically a BatchSpanProcessor) receiving kept spans
+        :param sample_rate: Fraction of unremarkable traces to keep, from 0 to 1
+        :param slow_threshold_ms: Traces lasting at least this long are always kept
+        :param max_buffered_spans: Upper bound on spans held across all traces
+        :param max_trace_age_s: Traces whose root has not ended after this many
+            seconds are decided on and released
+        :param is_flagged: Callback receiving an invocation ID and returning True
+            if that invocation received negative feedback
+        :param feedback_grace_s: How long a trace that would be dropped is held
+            in case negative feedback for its invocation arrives
+        """
+        self.delegate = delegate
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.slow_threshold_ns = int(slow_threshold_ms * 1_000_000)
+        self.max_buffered_spans = max_buffered_spans
+        self.max_trace_age_s = max_trace_age_s
+        self.is_flagged = is_flagged
+        self.feedback_grace_s = feedback_grace_s
+        self._traces: OrderedDict[int, _TraceBuffer] = OrderedDict()
+        self._buffered_spans = 0
+        self._held: OrderedDict[int, _TraceBuffer] = OrderedDict()
+        self._held_spans = 0
+        self._held_invocations: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.kept_traces = 0
+        self.dropped_traces = 0
+
+    def on_start(self, span: Span, parent_context: Context | None = None) -> None:
+        self.delegate.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        trace_id = span.get_span_context().trace_id
+        released: list[list[ReadableSpan]] = []
+        with self._lock:
+            buffer = self._traces.get(trace_id)
+            if buffer is None:
+                buffer = self._traces[trace_id] = _TraceBuffer()
+            buffer.spans.append(span)
+            self._buffered_spans += 1
+
+            # A remote parent belongs to the caller; this process's root is local
+            if span.parent is None or span.parent.is_remote:
+                released.append(self._pop(trace_id))
+            released.extend(self._evict())
+            expired = self._expire_held()
+
+        for spans in released:
+            self._decide(spans)
+        for spans in expired:
+            self._decide(spans, hold=False)
+
+    def _pop(self, trace_id: int) -> list[ReadableSpan]:
+        buffer = self._traces.pop(trace_id)
+        self._buffered_spans -= len(buffer.spans)
+        return buffer.spans
+
+    def _evict(self) -> list[list[ReadableSpan]]:
+        """Release traces that are too old or that push the buffer over its bound."""
+        evicted = []
+        deadline = time.monotonic() - self.max_trace_age_s
+        while self._traces:
+            trace_id, buffer = next(iter(self._traces.items()))
+            if (
+                buffer.created > deadline
+                and self._buffered_spans <= self.max_buffered_spans
+            ):
+                break
+            evicted.append(self._pop(trace_id))
+        return evicted
+
+    @staticmethod
+    def _invocation_ids(spans: list[ReadableSpan]) -> set[str]:
+        return {
+            str(invocation_id)
+            for span in spans
+            if (invocation_id := (span.attributes or {}).get(INVOCATION_ID_ATTRIBUTE))
+        }
+
+    def _hold(self, spans: list[ReadableSpan]) -> bool:
+        """Hold a trace that would be dropped until its feedback grace period ends."""
+        if self.is_flagged is None or self.feedback_grace_s <= 0:
+            return False
+        invocation_ids = self._invocation_ids(spans)
+        if not invocation_ids:
+            return False
+        trace_id = spans[0].get_span_context().trace_id
+        with self._lock:
+            buffer = self._held[trace_id] = _TraceBuffer()
+            buffer.spans = spans
+            self._held_spans += len(spans)
+            for invocation_id in invocation_ids:
+                self._held_invocations[invocation_id] = trace_id
+        return True
+
+    def _unhold(self, trace_id: int) -> list[ReadableSpan]:
+        buffer = self._held.pop(trace_id)
+        self._held_spans -= len(buffer.spans)
+        for invocation_id in self._invocation_ids(buffer.spans):
+            if self._held_invocations.get(invocation_id) == trace_id:
+                del self._held_invocations[invocation_id]
+        return buffer.spans
+
+    def _expire_held(self, everything: bool = False) -> list[list[ReadableSpan]]:
+        """Release held traces whose grace period is over or that exceed the span bound."""
+        expired = []
+        deadline = time.monotonic() - self.feedback_grace_s
+        while self._held:
+            trace_id, buffer = next(iter(self._held.items()))
+            if (
+                not everything
+                and buffer.created > deadline
+                and self._buffered_spans + self._held_spans <= self.max_buffered_spans
+            ):
+                break
+            expired.append(self._unhold(trace_id))
+        return expired
+
+    def flag_invocation(self, invocation_id: str) -> None:
+        """
+        Export the held trace of an invocation that received negative feedback.
+
+        :param invocation_id: The invocation ID
+        """
+        with self._lock:
+            trace_id = self._held_invocations.get(invocation_id)
+            spans = self._unhold(trace_id) if trace_id is not None else None
+        if spans is not None:
+            self._export(spans)
+
+    def should_keep(self, spans: list[ReadableSpan]) -> bool:
+        """
+        Decide whether a trace should be exported.
+
+        :param spans: The spans collected for the trace
+        :return: True if the trace should be exported
+        """
+        start = min(s.start_time or 0 for s in spans)
+        end = max(s.end_time or 0 for s in spans)
+        if end - start >= self.slow_threshold_ns:
+            return True
+
+        for span in spans:
+            if span.status is not None and span.status.status_code == StatusCode.ERROR:
+                return True
+            if self.is_flagged is not None:
+                invocation_id = (span.attributes or {}).get(INVOCATION_ID_ATTRIBUTE)
+                if invocation_id and self.is_flagged(str(invocation_id)):
+                    return True
+
+        # Hash on the trace ID so every span of a trace gets the same decision
+        trace_id = spans[0].get_span_context().trace_id
+        return (trace_id & 0xFFFFFFFFFFFFFFFF) < self.sample_rate * 2**64
+
+    def _export(self, spans: list[ReadableSpan]) -> None:
+        self.kept_traces += 1
+        for span in spans:
+            self.delegate.on_end(span)
+
+    def _decide(self, spans: list[ReadableSpan], hold: bool = True) -> None:
+        if self.should_keep(spans):
+            self._export(spans)
+        elif not (hold and self._hold(spans)):
+            self.dropped_traces += 1
+
+    def _release_all(self) -> None:
+        with self._lock:
+            released = [self._pop(trace_id) for trace_id in list(self._traces)]
+        for spans in released:
+            self._decide(spans, hold=False)
+        with self._lock:
+            expired = self._expire_held(everything=True)
+        for spans in expired:
+            self._decide(spans, hold=False)
+
+    def shutdown(self) -> None:
+        """Decide on all buffered traces and shut down the wrapped processor."""
+        self._release_all()
+        logging.info(
+            f"Tail sampler kept {self.kept_traces} and dropped "
+            f"{self.dropped_traces} traces"
+        )
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        """
+        Flush traces that have aged out or whose feedback grace period is over,
+        then flush the wrapped processor.
+
+        :param timeout_millis: Maximum time to wait for the wrapped processor
+        :return: The result of the wrapped processor's flush
+        """
+        with self._lock:
+            released = self._evict()
+            expired = self._expire_held()
+        for spans in released:
+            self._decide(spans)
+        for spans in expired:
+            self._decide(spans, hold=False)
+        return self.delegate.force_flush(timeout_millis)
@@ -0,0 +1,274 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import os
+import threading
+import time
+from collections.abc import Iterable
+
+from opentelemetry import metrics
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.trace import StatusCode
+
+AGENT_NAME_ATTRIBUTE = "gen_ai.agent.name"
+TOOL_NAME_ATTRIBUTE = "gen_ai.tool.name"
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class LatencySketch:
+    """
+    A fixed-memory streaming quantile sketch in the style of DDSketch.
+
+    Values are counted in logarithmic buckets so every quantile estimate is
+    within ``relative_accuracy`` of the true value. When the bucket count would
+    exceed ``max_bins`` the two lowest buckets are merged, which only affects the
+    accuracy of the smallest values.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 1024) -> None:
+        """
+        :param relative_accuracy: Relative error bound of quantile estimates
+        :param max_bins: Maximum number of buckets held in memory
+        """
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.bins: dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        """
+        Record a value.
+
+        :param value: The value to record; values <= 0 are counted in a zero bucket
+        """
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        if value <= 0:
+            self.zero_count += 1
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[key] = self.bins.get(key, 0) + 1
+        if len(self.bins) > self.max_bins:
+            lowest, second = sorted(self.bins)[:2]
+            self.bins[second] += self.bins.pop(lowest)
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile.
+
+        :param q: The quantile, from 0 to 1
+        :return: The estimated value, or 0 if nothing was recorded
+        """
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return 2 * self.gamma**key / (self.gamma + 1)
+        return self.max
+
+
+class _Totals:
+    """Cumulative request and error counts for one agent, tool or backend."""
+
+    __slots__ = ("requests", "errors")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+
+
+class _Series:
+    """Request, error and duration statistics for one agent, tool or backend."""
+
+    __slots__ = ("requests", "errors", "sketch")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.sketch = LatencySketch()
+
+
+def default_tool_backends() -> dict[str, str]:
+    """
+    Map tool name prefixes to the backend they call, based on the environment.
+
+    :return: A dictionary of tool name prefix to backend name
+    """
+    backends = {"execute_postgres_query": "cloud_sql_postgres"}
+    for env_var, backend in (
+        ("CLOUD_SQL_POSTGRES_APP_INT_TOOL_NAME_PREFIX", "cloud_sql_postgres"),
+        ("CLOUD_SQL_SQLSVR_APP_INT_TOOL_NAME_PREFIX", "cloud_sql_sqlserver"),
+        ("RAG_ENGINE_NAME", "rag_engine"),
+    ):
+        prefix = os.getenv(env_var)
+        if prefix:
+            backends[prefix] = backend
+    return backends
+
+
+class SpanMetricsProcessor(SpanProcessor):
+    """
+    A span processor that derives RED (rate, errors, duration) metrics from spans.
+
+    Agent invocations, tool calls and the backends behind those tools each get a
+    request count, an error count and a fixed-memory latency sketch. The values
+    are published as OpenTelemetry observable instruments, so whichever metric
+    reader is configured on the MeterProvider exports them periodically, and
+    :meth:`snapshot` returns them directly for tests and load generators.
+    The exported counters are cumulative for the life of the process;
+    :meth:`reset` only starts a new window for :meth:`snapshot`.
+    """
+
+    def __init__(self, tool_backends: dict[str, str] | None = None) -> None:
+        """
+        :param tool_backends: Map of tool name prefix to backend name
+            (defaults to :func:`default_tool_backends`)
+        """
+        self.tool_backends = (
+            default_tool_backends() if tool_backends is None else tool_backends
+        )
+        self._series: dict[tuple[str, str], _Series] = {}
+        self._totals: dict[tuple[str, str], _Totals] = {}
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+        meter = metrics.get_meter(__name__)
+        meter.create_observable_counter(
+            "db_buddy.requests",
+            callbacks=[self._observe_requests],
+            description="Agent invocations, tool calls and backend calls",
+        )
+        meter.create_observable_counter(
+            "db_buddy.errors",
+            callbacks=[self._observe_errors],
+            description="Failed agent invocations, tool calls and backend calls",
+        )
+        meter.create_observable_gauge(
+            "db_buddy.latency",
+            callbacks=[self._observe_latency],
+            unit="ms",
+            description="Latency quantiles of agent invocations, tool calls and backend calls",
+        )
+
+    def _classify(self, span: ReadableSpan) -> list[tuple[str, str]]:
+        attributes = span.attributes or {}
+        if span.name.startswith("invoke_agent"):
+            agent = attributes.get(AGENT_NAME_ATTRIBUTE) or span.name.split(" ", 1)[-1]
+            return [("agent", str(agent))]
+        if span.name.startswith("execute_tool"):
+            tool = str(attributes.get(TOOL_NAME_ATTRIBUTE) or span.name.split(" ", 1)[-1])
+            keys = [("tool", tool)]
+            for prefix, backend in self.tool_backends.items():
+                if tool.startswith(prefix):
+                    keys.append(("backend", backend))
+                    break
+            return keys
+        return []
+
+    def on_start(self, span: Span, parent_context: Context | None = None) -> None:
+        pass
+
+    def on_end(self, span: ReadableSpan) -> None:
+        keys = self._classify(span)
+        if not keys:
+            return
+        duration_ms = ((span.end_time or 0) - (span.start_time or 0)) / 1e6
+        failed = span.status is not None and span.status.status_code == StatusCode.ERROR
+        with self._lock:
+            for key in keys:
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = _Series()
+                series.requests += 1
+                series.errors += failed
+                series.sketch.add(duration_ms)
+                totals = self._totals.get(key)
+                if totals is None:
+                    totals = self._totals[key] = _Totals()
+                totals.requests += 1
+                totals.errors += failed
+
+    def snapshot(self) -> dict[str, dict[str, dict[str, float]]]:
+        """
+        Return the current metrics.
+
+        :return: A nested dictionary of kind ("agent", "tool" or "backend") to
+            name to statistics (requests, errors, rate_per_s, error_rate,
+            mean_ms, max_ms and p50_ms/p90_ms/p99_ms)
+        """
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        result: dict[str, dict[str, dict[str, float]]] = {}
+        with self._lock:
+            for (kind, name), series in self._series.items():
+                stats = {
+                    "requests": series.requests,
+                    "errors": series.errors,
+                    "rate_per_s": series.requests / elapsed,
+                    "error_rate": series.errors / series.requests,
+                    "mean_ms": series.sketch.sum / series.sketch.count,
+                    "max_ms": series.sketch.max,
+                }
+                for q in QUANTILES:
+                    stats[f"p{int(q * 100)}_ms"] = series.sketch.quantile(q)
+                result.setdefault(kind, {})[name] = stats
+        return result
+
+    def reset(self) -> None:
+        """Start a new snapshot window; the exported cumulative counters are kept."""
+        with self._lock:
+            self._series.clear()
+            self._started = time.monotonic()
+
+    def _observe_requests(self, _) -> Iterable[metrics.Observation]:
+        with self._lock:
+            return [
+                metrics.Observation(t.requests, {"kind": kind, "name": name})
+                for (kind, name), t in self._totals.items()
+            ]
+
+    def _observe_errors(self, _) -> Iterable[metrics.Observation]:
+        with self._lock:
+            return [
+                metrics.Observation(t.errors, {"kind": kind, "name": name})
+                for (kind, name), t in self._totals.items()
+            ]
+
+    def _observe_latency(self, _) -> Iterable[metrics.Observation]:
+        with self._lock:
+            return [
+                metrics.Observation(
+                    s.sketch.quantile(q),
+                    {"kind": kind, "name": name, "quantile": str(q)},
+                )
+                for (kind, name), s in self._series.items()
+                for q in QUANTILES
+            ]
+
+    def shutdown(self) -> None:
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
@@ -0,0 +1,235 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import hashlib
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import google.cloud.storage as storage
+from google.api_core import exceptions
+
+
+class PayloadStore(ABC):
+    """
+    Base class for the backends that hold oversized span attribute payloads.
+
+    Payloads are gzip-compressed and named by the SHA-256 of their content, so
+    identical payloads (e.g. the same long agent instructions attached to many
+    spans) resolve to the same object and are only written once.
+    """
+
+    prefix = "spans"
+
+    def blob_name(self, digest: str) -> str:
+        """
+        Build the object name for a payload digest.
+
+        :param digest: Hex SHA-256 of the uncompressed payload
+        :return: The object name relative to the store root
+        """
+        return f"{self.prefix}/{digest}.json.gz"
+
+    def available(self) -> bool:
+        """
+        Check whether the backend can accept writes.
+
+        :return: True if payloads can be stored
+        """
+        return True
+
+    @abstractmethod
+    def write(self, name: str, data: bytes) -> None:
+        """
+        Write a gzip-compressed JSON object, leaving any existing copy in place.
+
+        :param name: The object name
+        :param data: The compressed payload
+        """
+
+    @abstractmethod
+    def uri(self, name: str) -> str:
+        """
+        :param name: The object name
+        :return: A URI identifying the stored object
+        """
+
+    def url(self, name: str) -> str:
+        """
+        :param name: The object name
+        :return: A browsable URL for the stored object
+        """
+        return self.uri(name)
+
+
+class GcsPayloadStore(PayloadStore):
+    """Stores payloads in a Google Cloud Storage bucket."""
+
+    def __init__(self, storage_client: storage.Client, bucket_name: str) -> None:
+        """
+        :param storage_client: Google Cloud Storage client
+        :param bucket_name: Name of the GCS bucket to store payloads in
+        """
+        self.bucket_name = bucket_name
+        self.bucket = storage_client.bucket(bucket_name)
+        self._bucket_exists: bool | None = None
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """
+        Check (once) whether the bucket exists and cache the answer.
+
+        :return: True if the bucket exists
+        """
+        if self._bucket_exists is None:
+            with self._lock:
+                if self._bucket_exists is None:
+                    self._bucket_exists = self.bucket.exists()
+                    if not self._bucket_exists:
+                        logging.warning(
+                            f"Bucket {self.bucket_name} not found. "
+                            "Unable to store span attributes in GCS."
+                        )
+        return self._bucket_exists
+
+    def write(self, name: str, data: bytes) -> None:
+        blob = self.bucket.blob(name)
+        blob.content_encoding = "gzip"
+        try:
+            # if_generation_match=0 makes the write a no-op if another
+            # process already stored the same content.
+            blob.upload_from_string(
+                data, content_type="application/json", if_generation_match=0
+            )
+        except exceptions.PreconditionFailed:
+            pass
+
+    def uri(self, name: str) -> str:
+        return f"gs://{self.bucket_name}/{name}"
+
+    def url(self, name: str) -> str:
+        return f"https://storage.mtls.cloud.google.com/{self.bucket_name}/{name}"
+
+
+class LocalPayloadStore(PayloadStore):
+    """Stores payloads on the local filesystem, for offline testing."""
+
+    def __init__(self, root_dir: str) -> None:
+        """
+        :param root_dir: Directory to write payloads under
+        """
+        self.root_dir = os.path.abspath(root_dir)
+
+    def available(self) -> bool:
+        os.makedirs(self.root_dir, exist_ok=True)
+        return True
+
+    def write(self, name: str, data: bytes) -> None:
+        path = os.path.join(self.root_dir, name)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def uri(self, name: str) -> str:
+        return f"file://{os.path.join(self.root_dir, name)}"
+
+
+class PayloadUploader:
+    """
+    Offloads payload writes to a thread pool so they stay off the span export path.
+
+    The object name is derived from the content hash, so the URI can be returned
+    to the caller immediately while the write happens in the background. The
+    names already written are remembered up to ``max_known``, least recently
+    used first out; a forgotten payload is checked against the store again.
+    """
+
+    def __init__(
+        self, store: PayloadStore, max_workers: int = 4, max_known: int = 100000
+    ) -> None:
+        """
+        :param store: The backend to write payloads to
+        :param max_workers: Number of upload threads
+        :param max_known: Maximum number of written object names remembered
+        """
+        self.store = store
+        self.max_known = max_known
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="span-payload"
+        )
+        self._lock = threading.Lock()
+        self._known: OrderedDict[str, None] = OrderedDict()
+        self._pending: dict[str, Future] = {}
+
+    def submit(self, content: str) -> str | None:
+        """
+        Schedule a payload for storage.
+
+        :param content: The JSON payload to store
+        :return: The object name, or None if the store is unavailable
+        """
+        if not self.store.available():
+            return None
+
+        raw = content.encode()
+        name = self.store.blob_name(hashlib.sha256(raw).hexdigest())
+        with self._lock:
+            if name in self._known:
+                self._known.move_to_end(name)
+                return name
+            self._known[name] = None
+            if len(self._known) > self.max_known:
+                self._known.popitem(last=False)
+            future = self._executor.submit(self._upload, name, raw)
+            self._pending[name] = future
+        future.add_done_callback(lambda _: self._forget(name))
+        return name
+
+    def _upload(self, name: str, raw: bytes) -> None:
+        try:
+            self.store.write(name, gzip.compress(raw))
+        except Exception as e:
+            logging.warning(f"Failed to store span payload {name}: {e}")
+            with self._lock:
+                self._known.pop(name, None)
+
+    def _forget(self, name: str) -> None:
+        with self._lock:
+            self._pending.pop(name, None)
+
+    def flush(self, timeout: float | None = None) -> None:
+        """
+        Block until all scheduled uploads have finished.
+
+        :param timeout: Maximum seconds to wait for each pending upload
+        """
+        with self._lock:
+            pending = list(self._pending.values())
+        for future in pending:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+
+    def shutdown(self) -> None:
+        """Wait for pending uploads and stop the worker threads."""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,417 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fcntl
+import json
+import logging
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from collections.abc import Sequence
+from typing import Any
+
+from opentelemetry import metrics
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import Event, ReadableSpan
+from opentelemetry.sdk.util.instrumentation import InstrumentationScope
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.trace import Link, SpanContext, SpanKind, Status, StatusCode
+from opentelemetry.trace import TraceFlags, TraceState
+
+# length, crc32 and write timestamp of each record
+_HEADER = struct.Struct("<IId")
+_SEGMENT_PREFIX = "segment-"
+_SEGMENT_SUFFIX = ".spool"
+_CURSOR_FILE = "cursor.json"
+_LOCK_FILE = ".lock"
+
+
+def _encode_context(context: SpanContext | None) -> list | None:
+    if context is None:
+        return None
+    return [
+        context.trace_id,
+        context.span_id,
+        context.is_remote,
+        int(context.trace_flags),
+        list(context.trace_state.items()) if context.trace_state else [],
+    ]
+
+
+def _decode_context(data: list | None) -> SpanContext | None:
+    if data is None:
+        return None
+    trace_id, span_id, is_remote, flags, state = data
+    return SpanContext(
+        trace_id=trace_id,
+        span_id=span_id,
+        is_remote=is_remote,
+        trace_flags=TraceFlags(flags),
+        trace_state=TraceState(state),
+    )
+
+
+def encode_span(span: ReadableSpan) -> dict[str, Any]:
+    """
+    Convert a span into a JSON-serializable dictionary.
+
+    :param span: The span to encode
+    :return: A compact dictionary holding everything needed to rebuild the span
+    """
+    scope = span.instrumentation_scope
+    return {
+        "n": span.name,
+        "c": _encode_context(span.get_span_context()),
+        "p": _encode_context(span.parent),
+        "r": dict(span.resource.attributes) if span.resource else {},
+        "a": dict(span.attributes or {}),
+        "e": [[e.name, dict(e.attributes or {}), e.timestamp] for e in span.events],
+        "l": [[_encode_context(l.context), dict(l.attributes or {})] for l in span.links],
+        "k": span.kind.value,
+        "s": [span.status.status_code.value, span.status.description],
+        "t": [span.start_time, span.end_time],
+        "i": [scope.name, scope.version, scope.schema_url] if scope else None,
+    }
+
+
+def decode_span(data: dict[str, Any]) -> ReadableSpan:
+    """
+    Rebuild a span from the output of :func:`encode_span`.
+
+    :param data: The encoded span
+    :return: The reconstructed span
+    """
+    status_code, description = data["s"]
+    return ReadableSpan(
+        name=data["n"],
+        context=_decode_context(data["c"]),
+        parent=_decode_context(data["p"]),
+        resource=Resource(data["r"]),
+        attributes=data["a"],
+        events=[Event(name, attrs, ts) for name, attrs, ts in data["e"]],
+        links=[Link(_decode_context(ctx), attrs) for ctx, attrs in data["l"]],
+        kind=SpanKind(data["k"]),
+        status=Status(StatusCode(status_code), description),
+        start_time=data["t"][0],
+        end_time=data["t"][1],
+        instrumentation_scope=InstrumentationScope(*data["i"]) if data["i"] else None,
+    )
+
+
+def claim_spool_dir(spool_dir: str) -> tuple[str, Any]:
+    """
+    Take an exclusive lock on a spool directory for this process.
+
+    Several worker processes may be configured with the same directory. The
+    first one uses it; each of the others uses the first free ``worker-N``
+    subdirectory, so every spool has a single writer and a restarted worker
+    picks up the spool a previous one left behind.
+
+    :param spool_dir: The configured spool directory
+    :return: The directory claimed, and the open lock file to keep for the
+        life of the process
+    """
+    candidate, index = spool_dir, 0
+    while True:
+        os.makedirs(candidate, exist_ok=True)
+        lock_file = open(os.path.join(candidate, _LOCK_FILE), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return candidate, lock_file
+        except BlockingIOError:
+            lock_file.close()
+            index += 1
+            candidate = os.path.join(spool_dir, f"worker-{index}")
+
+
+class SpoolingSpanExporter(SpanExporter):
+    """
+    A span exporter that writes spans to a durable local spool before export.
+
+    ``export`` appends each batch as a zlib-compressed record to segmented,
+    append-only files and returns immediately. A background thread drains the
+    spool into the wrapped exporter at a bounded rate, retrying failures with
+    backoff. The read position is persisted, so draining resumes after a
+    restart. When the spool exceeds ``max_bytes`` the oldest segments are evicted.
+    Each process claims its own spool directory (see :func:`claim_spool_dir`).
+    """
+
+    def __init__(
+        self,
+        delegate: SpanExporter,
+        spool_dir: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        segment_bytes: int = 8 * 1024 * 1024,
+        max_batches_per_second: float = 10,
+        max_retry_delay_s: float = 60,
+    ) -> None:
+        """
+        Initialize the spool and start the drain thread.
+
+        :param delegate: The exporter that spans are drained into
+        :param spool_dir: Directory holding the spool segments; another
+            process's spool in it moves this one to a subdirectory
+        :param max_bytes: Size cap for the spool; the oldest segments are evicted above it
+        :param segment_bytes: Size at which the active segment is rolled over
+        :param max_batches_per_second: Upper bound on the drain rate
+        :param max_retry_delay_s: Upper bound on the backoff between failed exports
+        """
+        self.delegate = delegate
+        self.spool_dir, self._dir_lock = claim_spool_dir(spool_dir)
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.min_interval_s = 1 / max_batches_per_second if max_batches_per_second else 0
+        self.max_retry_delay_s = max_retry_delay_s
+
+        self._lock = threading.Lock()
+        self._data_ready = threading.Event()
+        self._stopped = threading.Event()
+        self.evicted_records = 0
+        self.exported_records = 0
+        self.corrupt_records = 0
+
+        # Always start a fresh segment so a record torn by a crash is never
+        # followed by new writes in the same file.
+        segments = self._segments()
+        self._write_seq = segments[-1] + 1 if segments else 0
+        self._writer = open(self._segment_path(self._write_seq), "ab")
+        self._read_seq, self._read_offset = self._load_cursor(segments)
+        if self.depth_bytes():
+            self._data_ready.set()
+
+        meter = metrics.get_meter(__name__)
+        meter.create_observable_gauge(
+            "db_buddy.telemetry_spool.depth",
+            callbacks=[lambda _: [metrics.Observation(self.depth_bytes())]],
+            unit="By",
+            description="Bytes of spooled telemetry waiting to be exported",
+        )
+        meter.create_observable_gauge(
+            "db_buddy.telemetry_spool.lag",
+            callbacks=[lambda _: [metrics.Observation(self.lag_seconds())]],
+            unit="s",
+            description="Age of the oldest spooled telemetry record",
+        )
+
+        self._drainer = threading.Thread(
+            target=self._drain, name="telemetry-spool", daemon=True
+        )
+        self._drainer.start()
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.spool_dir, f"{_SEGMENT_PREFIX}{seq:012d}{_SEGMENT_SUFFIX}")
+
+    def _segments(self) -> list[int]:
+        return sorted(
+            int(name[len(_SEGMENT_PREFIX) : -len(_SEGMENT_SUFFIX)])
+            for name in os.listdir(self.spool_dir)
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX)
+        )
+
+    def _load_cursor(self, segments: list[int]) -> tuple[int, int]:
+        try:
+            with open(os.path.join(self.spool_dir, _CURSOR_FILE)) as f:
+                cursor = json.load(f)
+            if cursor["segment"] in segments:
+                return cursor["segment"], cursor["offset"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return (segments[0] if segments else self._write_seq), 0
+
+    def _save_cursor(self) -> None:
+        path = os.path.join(self.spool_dir, _CURSOR_FILE)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"segment": self._read_seq, "offset": self._read_offset}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        """
+        Append a batch of spans to the spool.
+
+        :param spans: A sequence of spans to export
+        :return: SUCCESS once the batch is durably written
+        """
+        if self._stopped.is_set():
+            return SpanExportResult.FAILURE
+        payload = zlib.compress(
+            json.dumps([encode_span(s) for s in spans], separators=(",", ":")).encode()
+        )
+        record = _HEADER.pack(len(payload), zlib.crc32(payload), time.time()) + payload
+        with self._lock:
+            if self._writer.tell() >= self.segment_bytes:
+                self._writer.close()
+                self._write_seq += 1
+                self._writer = open(self._segment_path(self._write_seq), "ab")
+            self._writer.write(record)
+            self._writer.flush()
+            self._enforce_cap()
+        self._data_ready.set()
+        return SpanExportResult.SUCCESS
+
+    def _enforce_cap(self) -> None:
+        """Evict the oldest unread segments while the spool is over its size cap."""
+        while self.depth_bytes() > self.max_bytes and self._read_seq < self._write_seq:
+            path = self._segment_path(self._read_seq)
+            self.evicted_records += sum(1 for _ in self._iter_headers(path, self._read_offset))
+            os.remove(path)
+            self._read_seq += 1
+            self._read_offset = 0
+            self._save_cursor()
+            logging.warning(f"Telemetry spool over {self.max_bytes} bytes, evicted {path}")
+
+    @staticmethod
+    def _iter_headers(path: str, offset: int):
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while header := f.read(_HEADER.size):
+                if len(header) < _HEADER.size:
+                    return
+                length, _, written = _HEADER.unpack(header)
+                f.seek(length, os.SEEK_CUR)
+                yield written
+
+    def depth_bytes(self) -> int:
+        """
+        :return: Bytes of spooled records not yet exported
+        """
+        depth = -self._read_offset
+        for seq in range(self._read_seq, self._write_seq + 1):
+            try:
+                depth += os.path.getsize(self._segment_path(seq))
+            except OSError:
+                pass
+        return max(depth, 0)
+
+    def lag_seconds(self) -> float:
+        """
+        :return: Age of the oldest unexported record, or 0 if the spool is empty
+        """
+        with self._lock:
+            for seq in range(self._read_seq, self._write_seq + 1):
+                offset = self._read_offset if seq == self._read_seq else 0
+                try:
+                    for written in self._iter_headers(self._segment_path(seq), offset):
+                        return max(time.time() - written, 0.0)
+                except OSError:
+                    continue
+        return 0.0
+
+    def _read_next(self) -> tuple[list[ReadableSpan], int, int] | None:
+        """Read the record at the cursor, advancing past finished segments."""
+        with self._lock:
+            while True:
+                path = self._segment_path(self._read_seq)
+                try:
+                    with open(path, "rb") as f:
+                        f.seek(self._read_offset)
+                        header = f.read(_HEADER.size)
+                        payload = b""
+                        if len(header) == _HEADER.size:
+                            length, crc, _ = _HEADER.unpack(header)
+                            payload = f.read(length)
+                except FileNotFoundError:
+                    header = b""
+
+                if len(header) == _HEADER.size and len(payload) == length:
+                    if zlib.crc32(payload) == crc:
+                        spans = [decode_span(d) for d in json.loads(zlib.decompress(payload))]
+                        return spans, self._read_seq, self._read_offset + _HEADER.size + length
+                    # The length is intact, so the records after this one can still be read
+                    self.corrupt_records += 1
+                    logging.warning(f"Skipping corrupt telemetry spool record in {path}")
+                    self._read_offset += _HEADER.size + length
+                    self._save_cursor()
+                    continue
+
+                if self._read_seq >= self._write_seq:
+                    if not header or self._read_offset + len(header) + len(payload) < self._writer.tell():
+                        # The active segment has no complete record past the cursor
+                        return None
+                    # Everything written has been read, yet the record is
+                    # incomplete: its header is corrupt and it never will be
+                    self.corrupt_records += 1
+                    logging.warning(f"Skipping the rest of corrupt telemetry spool segment {path}")
+                    self._writer.close()
+                    self._write_seq += 1
+                    self._writer = open(self._segment_path(self._write_seq), "ab")
+                # Finished (or truncated) segment, move on to the next one
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._read_seq += 1
+                self._read_offset = 0
+                self._save_cursor()
+
+    def _commit(self, seq: int, offset: int) -> None:
+        with self._lock:
+            # The segment may have been evicted while the record was exported
+            if seq == self._read_seq:
+                self._read_offset = offset
+                self._save_cursor()
+
+    def _drain(self) -> None:
+        delay = self.min_interval_s
+        while not self._stopped.is_set():
+            record = self._read_next()
+            if record is None:
+                self._data_ready.wait(timeout=1)
+                self._data_ready.clear()
+                continue
+
+            spans, seq, next_offset = record
+            started = time.monotonic()
+            try:
+                result = self.delegate.export(spans)
+            except Exception as e:
+                logging.warning(f"Telemetry export from spool failed: {e}")
+                result = SpanExportResult.FAILURE
+
+            if result == SpanExportResult.SUCCESS:
+                self._commit(seq, next_offset)
+                self.exported_records += 1
+                delay = self.min_interval_s
+                wait = self.min_interval_s - (time.monotonic() - started)
+            else:
+                delay = min(max(delay * 2, 1), self.max_retry_delay_s)
+                wait = random.uniform(delay / 2, delay)
+            if wait > 0:
+                self._stopped.wait(wait)
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        """
+        Wait for the spool to drain.
+
+        :param timeout_millis: Maximum time to wait
+        :return: True if the spool was fully drained in time
+        """
+        deadline = time.monotonic() + timeout_millis / 1000
+        while self.depth_bytes() and time.monotonic() < deadline:
+            self._data_ready.set()
+            time.sleep(0.05)
+        return not self.depth_bytes() and self.delegate.force_flush(
+            max(int((deadline - time.monotonic()) * 1000), 0)
+        )
+
+    def shutdown(self) -> None:
+        """Stop draining and shut down the wrapped exporter; unsent spans stay on disk."""
+        self._stopped.set()
+        self._data_ready.set()
+        self._drainer.join(timeout=5)
+        with self._lock:
+            self._writer.close()
+        self.delegate.shutdown()
@@ -14,6 +14,7 @@
 
 import json
 import logging
+import os
 from collections.abc import Sequence
 from typing import Any
 
@@ -23,6 +24,13 @@ from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
 from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace.export import SpanExportResult
 
+from db_buddy.utils.span_payloads import (
+    GcsPayloadStore,
+    LocalPayloadStore,
+    PayloadStore,
+    PayloadUploader,
+)
+
 
 class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
     """
@@ -39,6 +47,9 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         storage_client: storage.Client | None = None,
         bucket_name: str | None = None,
         debug: bool = False,
+        payload_store: PayloadStore | None = None,
+        payload_dir: str | None = None,
+        upload_workers: int = 4,
         **kwargs: Any,
     ) -> None:
         """
@@ -48,6 +59,10 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         :param storage_client: Google Cloud Storage client
         :param bucket_name: Name of the GCS bucket to store large payloads
         :param debug: Enable debug mode for additional logging
+        :param payload_store: Backend for large payloads (defaults to GCS)
+        :param payload_dir: Store large payloads in this local directory instead
+            of GCS, for offline testing
+        :param upload_workers: Number of background threads uploading payloads
         :param kwargs: Additional arguments to pass to the parent class
         """
         super().__init__(**kwargs)
@@ -61,6 +76,15 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
             bucket_name or f"{self.project_id}-db-buddy-logs"
         )
         self.bucket = self.storage_client.bucket(self.bucket_name)
+        payload_dir = payload_dir or os.environ.get("SPAN_PAYLOAD_LOCAL_DIR")
+        if payload_store is None:
+            payload_store = (
+                LocalPayloadStore(payload_dir)
+                if payload_dir
+                else GcsPayloadStore(self.storage_client, self.bucket_name)
+            )
+        self.payload_store = payload_store
+        self.uploader = PayloadUploader(payload_store, max_workers=upload_workers)
 
     def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
         """
@@ -97,26 +121,34 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         # Export spans to Google Cloud Trace using the parent class method
         return super().export(spans)
 
-    def store_in_gcs(self, content: str, span_id: str) -> str:
+    def store_in_gcs(self, content: str, span_id: str) -> str | None:
         """
-        Initiate storing large content in Google Cloud Storage/
+        Schedule large content for storage in Google Cloud Storage.
+
+        The content is gzip-compressed and named by its SHA-256, so identical
+        payloads are only written once. The upload runs on a background thread.
 
         :param content: The content to store
         :param span_id: The ID of the span
-        :return: The  GCS URI of the stored content
+        :return: The object name of the stored content, or None if the
+            payload store is unavailable
         """
-        if not self.storage_client.bucket(self.bucket_name).exists():
-            logging.warning(
-                f"Bucket {self.bucket_name} not found. "
-                "Unable to store span attributes in GCS."
-            )
-            return "GCS bucket not found"
+        return self.uploader.submit(content)
 
-        blob_name = f"spans/{span_id}.json"
-        blob = self.bucket.blob(blob_name)
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        """
+        Wait for pending payload uploads.
+
+        :param timeout_millis: Maximum time to wait for each upload
+        :return: True once pending uploads have finished
+        """
+        self.uploader.flush(timeout=timeout_millis / 1000)
+        return True
 
-        blob.upload_from_string(content, "application/json")
-        return f"gs://{self.bucket_name}/{blob_name}"
+    def shutdown(self) -> None:
+        """Flush pending payload uploads and shut down the exporter."""
+        self.uploader.shutdown()
+        super().shutdown()
 
     def _process_large_attributes(self, span_dict: dict, span_id: str) -> dict:
         """
@@ -135,12 +167,12 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
             attributes_retain = dict(attributes.items())
 
             # Store large payload in GCS
-            gcs_uri = self.store_in_gcs(json.dumps(attributes_payload), span_id)
-            attributes_retain["uri_payload"] = gcs_uri
-            attributes_retain["url_payload"] = (
-                f"https://storage.mtls.cloud.google.com/"
-                f"{self.bucket_name}/spans/{span_id}.json"
-            )
+            blob_name = self.store_in_gcs(json.dumps(attributes_payload), span_id)
+            if blob_name is None:
+                attributes_retain["uri_payload"] = "GCS bucket not found"
+            else:
+                attributes_retain["uri_payload"] = self.payload_store.uri(blob_name)
+                attributes_retain["url_payload"] = self.payload_store.url(blob_name)
 
             span_dict["attributes"] = attributes_retain
             logging.info(
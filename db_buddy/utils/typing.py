@@ -29,3 +29,4 @@ class Feedback(BaseModel):
     log_type: Literal["feedback"] = "feedback"
     service_name: Literal["db-buddy"] = "db-buddy"
     user_id: str = ""
+    agent_name: str = "RootAgent"
@@ -0,0 +1,176 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any
+
+# Steps that need the Cloud SQL proxy (postgres_pool, table_schemas,
+# reference_data, schema_catalog) are opt-in, since Agent Engine has no proxy
+DEFAULT_WARMUP_STEPS = ("rag_corpus", "toolsets", "model_clients", "car_recommendations")
+
+
+def _iter_agents(agent: Any):
+    yield agent
+    for tool in getattr(agent, "tools", []):
+        sub_agent = getattr(tool, "agent", None)
+        if sub_agent is not None:
+            yield from _iter_agents(sub_agent)
+    for sub_agent in getattr(agent, "sub_agents", []):
+        yield from _iter_agents(sub_agent)
+
+
+def warm_rag_corpus() -> None:
+    """Resolve the RAG corpus used by the RAG Engine agent."""
+    from db_buddy.tools import tools_native
+
+    tools_native.rag_engine_connector.build()
+
+
+def warm_toolsets() -> None:
+    """Generate the tool specs of the Application Integration toolsets."""
+    from db_buddy.tools import tools_native
+
+    async def build() -> None:
+        await asyncio.gather(
+            tools_native.app_int_cloud_sql_postgres_connector.get_tools(),
+            tools_native.app_int_cloud_sql_sqlsvr_connector.get_tools(),
+        )
+
+    # Building the connectors themselves happens in worker threads
+    asyncio.run(build())
+
+
+def warm_model_clients(root_agent: Any) -> None:
+    """Create the model API clients of every agent in the tree."""
+    for agent in _iter_agents(root_agent):
+        model = getattr(agent, "canonical_model", None)
+        if model is not None and hasattr(model, "api_client"):
+            model.api_client
+
+
+def warm_postgres_pool() -> None:
+    """Fetch credentials and open the minimum connections of the Postgres pool."""
+    from db_buddy.tools import tools_custom
+
+    tools_custom.get_postgres_pool()
+
+
+def warm_table_schemas() -> None:
+    """Prefetch the Postgres table schemas into the schema cache."""
+    from db_buddy.tools import tools_custom
+
+    tools_custom.get_postgres_table_schemas()
+
+
+def warm_reference_data() -> None:
+    """Start the background refresh of the reference tables and wait for their first load."""
+    from db_buddy.tools import reference_data
+
+    missing = reference_data.get_reference_cache().wait_for_first_refresh()
+    if missing:
+        raise RuntimeError(f"reference tables not loaded: {', '.join(missing)}")
+
+
+def warm_car_recommendations() -> None:
+    """Start the background refresh of the reference tables and wait for the car recommendations."""
+    from db_buddy.tools import reference_data
+
+    cache = reference_data.get_reference_cache()
+    if "car_recommendations" in cache.sources and cache.wait_for_first_refresh(["car_recommendations"]):
+        raise RuntimeError("reference table car_recommendations not loaded")
+
+
+def warm_schema_catalog() -> None:
+    """Load the schema catalog and refresh its Postgres entry from the database."""
+    from db_buddy.tools import schema_catalog
+
+    schema_catalog.get_schema_catalog().refresh_postgres()
+
+
+def default_warmup_steps(root_agent: Any) -> dict[str, Callable[[], None]]:
+    """
+    Build the available warm-up steps.
+
+    :param root_agent: The root agent whose model clients should be created
+    :return: A dictionary of step name to callable
+    """
+    return {
+        "rag_corpus": warm_rag_corpus,
+        "toolsets": warm_toolsets,
+        "model_clients": lambda: warm_model_clients(root_agent),
+        "postgres_pool": warm_postgres_pool,
+        "table_schemas": warm_table_schemas,
+        "reference_data": warm_reference_data,
+        "car_recommendations": warm_car_recommendations,
+        "schema_catalog": warm_schema_catalog,
+    }
+
+
+def run_warmup(
+    steps: dict[str, Callable[[], None]],
+    max_workers: int = 4,
+    timeout_s: float = 120,
+) -> dict[str, dict[str, Any]]:
+    """
+    Run warm-up steps concurrently and log how long each one took.
+
+    A failing step is logged and reported but does not stop the others; the
+    affected resource is then created on first use as before.
+
+    :param steps: A dictionary of step name to callable
+    :param max_workers: Number of steps run at the same time
+    :param timeout_s: Maximum time to wait for all steps
+    :return: A dictionary of step name to status ("ok", "failed" or
+        "timed out"), duration and error
+    """
+    report: dict[str, dict[str, Any]] = {}
+
+    def timed(name: str, step: Callable[[], None]) -> None:
+        started = time.perf_counter()
+        try:
+            step()
+            report[name] = {"status": "ok"}
+        except Exception as e:
+            report[name] = {"status": "failed", "error": str(e)}
+        report[name]["duration_s"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="warmup")
+    futures = [executor.submit(timed, name, step) for name, step in steps.items()]
+    wait(futures, timeout=timeout_s)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    for name in steps:
+        result = report.setdefault(name, {"status": "timed out"})
+        logging.info(
+            f"Warm-up step {name}: {result['status']} "
+            f"in {result.get('duration_s', timeout_s)}s"
+            + (f" ({result['error']})" if "error" in result else "")
+        )
+    logging.info(f"Warm-up finished in {time.perf_counter() - started:.3f}s")
+    return report
+
+
+def failed_steps(report: dict[str, dict[str, Any]]) -> list[str]:
+    """
+    List the warm-up steps that did not finish successfully.
+
+    :param report: The report returned by run_warmup
+    :return: The names of the failed and timed-out steps
+    """
+    return [name for name, result in report.items() if result["status"] != "ok"]
@@ -22,15 +22,12 @@ gcloud services enable secretmanager.googleapis.com
 gcloud services enable connectors.googleapis.com
 gcloud services enable compute.googleapis.com
 
-# Deploy database infrastructure
-python3 connector_deployment/db_deploy.py postgres
-
-# Open another terminal to run the next command if desired in parallel
-python3 connector_deployment/db_deploy.py sqlsvr
-
-# Open another terminal to run the next command if desired in parallel
-# Create RAG engine
-python3 connector_deployment/rag_create.py
+# Deploy database infrastructure and create the RAG engine, all in parallel.
+# A timing report is printed at the end.  To provision a single back end,
+# pass it as an argument (postgres, sqlsvr, rag), or run
+# connector_deployment/db_deploy.py / rag_create.py directly.
+# Add --fake to exercise the flow offline against an in-memory Cloud SQL API.
+python3 connector_deployment/provision_all.py
 
 # Populate databases
 # These may fail to run remotely depending on the network setup of the
@@ -52,7 +49,8 @@ INSTANCE_NAME=$(grep GOOGLE_CLOUD_SQLSVR_INSTANCE .env | cut -d '=' -f2)
 DB_NAME=$(grep GOOGLE_CLOUD_SQLSVR_DB .env | cut -d '=' -f2)
 gcloud sql connect $GOOGLE_CLOUD_SQLSVR_INSTANCE --database=$DGOOGLE_CLOUD_SQLSVR_DB --user=sqlserver < connector_deployment/db_sqlsvr_populate.sql
 
-# Create RAG engine
+# Create or sync the RAG engine (only new, changed and removed files are
+# processed; pass --rebuild to recreate the corpus from scratch)
 python3 connector_deployment/rag_create.py
 
 # Ensure you follow the readme.md to deploy the connectors
@@ -15,6 +15,7 @@
 # mypy: disable-error-code="attr-defined,arg-type"
 import logging
 import os
+import tempfile
 from typing import Any
 
 import click
@@ -22,7 +23,10 @@ import google.auth
 import vertexai
 from google.adk.artifacts import GcsArtifactService
 from google.cloud import logging as google_cloud_logging
-from opentelemetry import trace
+from opentelemetry import metrics, trace
+from opentelemetry.exporter.cloud_monitoring import CloudMonitoringMetricsExporter
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
 from opentelemetry.sdk.trace import TracerProvider, export
 from vertexai._genai.types import AgentEngine, AgentEngineConfig
 from vertexai.agent_engines.templates.adk import AdkApp
@@ -32,13 +36,27 @@ load_dotenv()
 
 from db_buddy.agent import root_agent
 from db_buddy.utils.deployment import (
+    compute_deployment_manifest,
+    diff_deployment_manifests,
+    load_deployment_manifest,
     parse_env_vars,
     print_deployment_success,
+    write_deployment_manifest,
     write_deployment_metadata,
 )
+from db_buddy.utils.feedback import FeedbackBuffer
 from db_buddy.utils.gcs import create_bucket_if_not_exists
+from db_buddy.utils.sampling import TailSamplingSpanProcessor
+from db_buddy.utils.span_metrics import SpanMetricsProcessor
+from db_buddy.utils.spool import SpoolingSpanExporter
 from db_buddy.utils.tracing import CloudTraceLoggingSpanExporter
 from db_buddy.utils.typing import Feedback
+from db_buddy.utils.warmup import (
+    DEFAULT_WARMUP_STEPS,
+    default_warmup_steps,
+    failed_steps,
+    run_warmup,
+)
 
 
 class AgentEngineApp(AdkApp):
@@ -50,19 +68,95 @@ class AgentEngineApp(AdkApp):
         logging.basicConfig(level=logging.INFO)
         logging_client = google_cloud_logging.Client()
         self.logger = logging_client.logger(__name__)
+        self.feedback = FeedbackBuffer(
+            self.logger,
+            flush_interval_s=float(os.environ.get("FEEDBACK_FLUSH_INTERVAL_SECONDS", "5")),
+            low_score_threshold=float(os.environ.get("FEEDBACK_LOW_SCORE_THRESHOLD", "0.5")),
+        )
+        meter_provider = MeterProvider(
+            metric_readers=[
+                PeriodicExportingMetricReader(
+                    CloudMonitoringMetricsExporter(
+                        project_id=os.environ.get("GOOGLE_CLOUD_PROJECT")
+                    ),
+                    export_interval_millis=int(
+                        os.environ.get("METRICS_EXPORT_INTERVAL_SECONDS", "60")
+                    )
+                    * 1000,
+                )
+            ]
+        )
+        metrics.set_meter_provider(meter_provider)
+
         provider = TracerProvider()
-        processor = export.BatchSpanProcessor(
-            CloudTraceLoggingSpanExporter(
-                project_id=os.environ.get("GOOGLE_CLOUD_PROJECT")
-            )
+        # Metrics see every span, ahead of sampling
+        self.span_metrics = SpanMetricsProcessor()
+        provider.add_span_processor(self.span_metrics)
+        self.sampler = TailSamplingSpanProcessor(
+            export.BatchSpanProcessor(
+                SpoolingSpanExporter(
+                    CloudTraceLoggingSpanExporter(
+                        project_id=os.environ.get("GOOGLE_CLOUD_PROJECT")
+                    ),
+                    spool_dir=os.environ.get("TELEMETRY_SPOOL_DIR")
+                    or os.path.join(tempfile.gettempdir(), "db-buddy-telemetry-spool"),
+                    max_bytes=int(os.environ.get("TELEMETRY_SPOOL_MAX_MB", "256")) * 1024 * 1024,
+                    max_batches_per_second=float(
+                        os.environ.get("TELEMETRY_SPOOL_BATCHES_PER_SECOND", "10")
+                    ),
+                )
+            ),
+            sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", "0.1")),
+            slow_threshold_ms=float(os.environ.get("TRACE_SLOW_THRESHOLD_MS", "10000")),
+            max_buffered_spans=int(os.environ.get("TRACE_MAX_BUFFERED_SPANS", "20000")),
+            max_trace_age_s=float(os.environ.get("TRACE_MAX_AGE_SECONDS", "300")),
+            is_flagged=self.feedback.is_flagged,
+            feedback_grace_s=float(os.environ.get("TRACE_FEEDBACK_GRACE_SECONDS", "120")),
         )
-        provider.add_span_processor(processor)
+        provider.add_span_processor(self.sampler)
         trace.set_tracer_provider(provider)
 
+        # Warm up before reporting ready so the first request does not pay
+        # for corpus lookup, tool spec generation and client creation
+        self.ready = False
+        step_names = os.environ.get("WARMUP_STEPS") or ",".join(DEFAULT_WARMUP_STEPS)
+        available_steps = default_warmup_steps(root_agent)
+        self.warmup_report = run_warmup(
+            {
+                name: available_steps[name]
+                for name in (n.strip() for n in step_names.split(","))
+                if name in available_steps
+            },
+            timeout_s=float(os.environ.get("WARMUP_TIMEOUT_SECONDS", "120")),
+        )
+        # A failed step is retried on first use, but the worker is not warm
+        self.ready = not failed_steps(self.warmup_report)
+
     def register_feedback(self, feedback: dict[str, Any]) -> None:
-        """Collect and log feedback."""
+        """Collect feedback; it is logged in batches in the background."""
         feedback_obj = Feedback.model_validate(feedback)
-        self.logger.log_struct(feedback_obj.model_dump(), severity="INFO")
+        self.feedback.add(feedback_obj)
+        # Export the trace if it was held back by the sampler
+        if self.feedback.is_flagged(feedback_obj.invocation_id):
+            self.sampler.flag_invocation(feedback_obj.invocation_id)
+
+    def get_low_scoring_invocations(
+        self, threshold: float | None = None, limit: int = 100
+    ) -> dict[str, Any]:
+        """Return recent low-scoring invocations and per-agent score aggregates."""
+        return {
+            "invocations": self.feedback.low_scoring_invocations(threshold, limit),
+            "agents": self.feedback.agent_scores(),
+        }
+
+    def get_readiness(self) -> dict[str, Any]:
+        """Return whether every warm-up step succeeded, with the failed steps and per-step timings."""
+        report = getattr(self, "warmup_report", {})
+        return {
+            "ready": getattr(self, "ready", False),
+            "failed_steps": failed_steps(report),
+            "warmup": report,
+        }
 
     def register_operations(self) -> dict[str, list[str]]:
         """Registers the operations of the Agent.
@@ -70,7 +164,11 @@ class AgentEngineApp(AdkApp):
         Extends the base operations to include feedback registration functionality.
         """
         operations = super().register_operations()
-        operations[""] = operations.get("", []) + ["register_feedback"]
+        operations[""] = operations.get("", []) + [
+            "register_feedback",
+            "get_low_scoring_invocations",
+            "get_readiness",
+        ]
         return operations
 
 
@@ -121,6 +219,30 @@ class AgentEngineApp(AdkApp):
     default=os.getenv("GOOGLE_CLOUD_STORAGE_STAGING_BUCKET", None),
     help="GCS bucket name for artifacts (defaults to gs://{project}-agent-engine)",
 )
+@click.option(
+    "--num-workers",
+    default=int(os.getenv("NUM_WORKERS", "1")),
+    type=int,
+    help="Number of worker processes per Agent Engine instance",
+)
+@click.option(
+    "--container-concurrency",
+    default=int(os.getenv("AGENT_CONTAINER_CONCURRENCY", "9")),
+    type=int,
+    help="Maximum concurrent requests per Agent Engine instance",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    default=False,
+    help="Report what would be deployed without contacting Vertex AI",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Redeploy even if nothing changed since the last deployment",
+)
 def deploy_agent_engine_app(
     project: str | None,
     location: str,
@@ -131,7 +253,11 @@ def deploy_agent_engine_app(
     service_account: str | None,
     staging_bucket_uri: str | None,
     artifacts_bucket_name: str | None,
-) -> AgentEngine:
+    num_workers: int,
+    container_concurrency: int,
+    dry_run: bool,
+    force: bool,
+) -> AgentEngine | None:
     """Deploy the agent engine app to Vertex AI."""
 
     logging.basicConfig(level=logging.INFO)
@@ -153,6 +279,42 @@ def deploy_agent_engine_app(
                     if key not in env_vars and key != 'GOOGLE_CLOUD_PROJECT' and key != 'GOOGLE_CLOUD_LOCATION':
                         env_vars[key] = os.environ.get(key)
 
+    # Set worker parallelism; the tools keep their shared state per process
+    # and guard it with locks, so several workers and sessions can run at once
+    env_vars["NUM_WORKERS"] = str(num_workers)
+
+    # Read requirements
+    with open(requirements_file) as f:
+        requirements = f.read().strip().split("\n")
+
+    extra_packages_list = list(extra_packages)
+    manifest = compute_deployment_manifest(
+        extra_packages_list,
+        requirements,
+        {**env_vars, "CONTAINER_CONCURRENCY": str(container_concurrency)},
+        service_account,
+        # AgentEngineApp is pickled from this script, so its code is source too
+        pickled_sources=[os.path.relpath(os.path.abspath(__file__))],
+    )
+    previous_manifest = load_deployment_manifest()
+    changes = diff_deployment_manifests(previous_manifest, manifest)
+    code_changed = changes["source"] or changes["requirements"]
+
+    if dry_run:
+        print("Dry run: comparing against the last deployment manifest")
+        for part in ("source", "requirements", "config"):
+            print(f"  {part}: {'changed' if changes[part] else 'unchanged'}")
+        for kind in ("added", "changed", "removed"):
+            for path in changes[kind]:
+                print(f"  {kind}: {path}")
+        if code_changed or force:
+            print(f"Would upload packages {extra_packages_list} and {len(requirements)} requirements")
+        elif changes["config"]:
+            print("Would push a config-only update (environment variables/service account)")
+        else:
+            print("Nothing changed; the deployment would be skipped")
+        return None
+
     if not project:
         _, project = google.auth.default()
 
@@ -183,7 +345,6 @@ def deploy_agent_engine_app(
     ╚═══════════════════════════════════════════════════════════╝
     """)
 
-    extra_packages_list = list(extra_packages)
     print(f"Extra packages to include: {extra_packages_list}")
 
     # Initialize vertexai client
@@ -193,10 +354,6 @@ def deploy_agent_engine_app(
     )
     vertexai.init(project=project, location=location)
 
-    # Read requirements
-    with open(requirements_file) as f:
-        requirements = f.read().strip().split("\n")
-
     agent_engine = AgentEngineApp(
         agent=root_agent,
         artifact_service_builder=lambda: GcsArtifactService(
@@ -204,9 +361,6 @@ def deploy_agent_engine_app(
         ),
     )
 
-    # Set worker parallelism to 1
-    env_vars["NUM_WORKERS"] = "1"
-
     # print("DEBUG: Environment variables being sent to Agent Engine:")
     # for i, (key, value) in enumerate(env_vars.items()):
     #     print(f"  {i}: {key}={value}")
@@ -222,6 +376,7 @@ def deploy_agent_engine_app(
         env_vars=env_vars,
         service_account=service_account,
         requirements=requirements,
+        container_concurrency=container_concurrency,
         staging_bucket=staging_bucket_uri,
         labels=labels,
         gcs_dir_name=agent_name.replace(" ", "_").lower()
@@ -241,7 +396,27 @@ def deploy_agent_engine_app(
         if agent.api_resource.display_name == agent_name
     ]
 
-    if matching_agents:
+    # The manifest only describes the agent it was written for
+    if matching_agents and (previous_manifest or {}).get(
+        "remote_agent_engine_id"
+    ) != matching_agents[0].api_resource.name:
+        force = True
+
+    if matching_agents and not force and not code_changed and not changes["config"]:
+        logging.info(f"\n⏭️  No changes since the last deployment of {agent_name}, skipping")
+        return matching_agents[0]
+    elif matching_agents and not force and not code_changed:
+        # Only the runtime config changed, so skip packaging the agent
+        logging.info(f"\n⚙️  Updating config of existing agent: {agent_name}")
+        remote_agent = client.agent_engines.update(
+            name=matching_agents[0].api_resource.name,
+            config=AgentEngineConfig(
+                env_vars=env_vars,
+                service_account=service_account,
+                container_concurrency=container_concurrency,
+            ),
+        )
+    elif matching_agents:
         # Update the existing agent with new configuration
         logging.info(f"\n📝 Updating existing agent: {agent_name}")
         remote_agent = client.agent_engines.update(
@@ -253,6 +428,8 @@ def deploy_agent_engine_app(
         remote_agent = client.agent_engines.create(**agent_config)
 
     write_deployment_metadata(remote_agent)
+    manifest["remote_agent_engine_id"] = remote_agent.api_resource.name
+    write_deployment_manifest(manifest)
     print_deployment_success(remote_agent, location, project)
 
     return remote_agent
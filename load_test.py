@@ -0,0 +1,154 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+import time
+import uuid
+
+import click
+from dotenv import load_dotenv
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+
+load_dotenv()
+
+from db_buddy.tools import admission, single_flight
+from db_buddy.utils.span_metrics import SpanMetricsProcessor
+
+DEFAULT_PROMPTS = [
+    "What are the days that are present for NYC taxi rides?",
+    "Please provide the average taxi ride travel time by day",
+    "What is the weather in NYC broken out by each day?",
+    "Which car is recommended for snowy weather?",
+]
+
+
+async def _run_session(runner, prompt: str) -> tuple[float, bool]:
+    from google.genai import types
+
+    user_id = f"load-test-{uuid.uuid4().hex[:8]}"
+    session = await runner.session_service.create_session(
+        app_name=runner.app_name, user_id=user_id
+    )
+    message = types.Content(role="user", parts=[types.Part(text=prompt)])
+    started = time.perf_counter()
+    try:
+        async for _ in runner.run_async(
+            user_id=user_id, session_id=session.id, new_message=message
+        ):
+            pass
+        ok = True
+    except Exception as e:
+        print(f"Session failed: {e}")
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+async def _run_level(runner, concurrency: int, sessions: int, prompts: list[str]) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(i: int):
+        async with semaphore:
+            return await _run_session(runner, prompts[i % len(prompts)])
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(bounded(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "errors": sum(1 for _, ok in results if not ok),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_per_s": round(sessions / elapsed, 3),
+        "p50_s": round(latencies[len(latencies) // 2], 2),
+        "max_s": round(latencies[-1], 2),
+    }
+
+
+@click.command()
+@click.option(
+    "--concurrency",
+    "concurrency_levels",
+    multiple=True,
+    type=int,
+    default=[1, 2, 4, 8, 16],
+    help="Concurrent session levels to measure (repeatable)",
+)
+@click.option(
+    "--sessions-per-level",
+    default=16,
+    type=int,
+    help="Number of sessions to run at each concurrency level",
+)
+@click.option(
+    "--prompt",
+    "prompts",
+    multiple=True,
+    help="Prompt to send (repeatable, defaults to the sample questions)",
+)
+def load_test(
+    concurrency_levels: tuple[int, ...],
+    sessions_per_level: int,
+    prompts: tuple[str, ...],
+) -> None:
+    """Run many concurrent sessions through one process and report scaling."""
+    from google.adk.runners import InMemoryRunner
+
+    from db_buddy.agent import root_agent
+
+    span_metrics = SpanMetricsProcessor()
+    provider = TracerProvider()
+    provider.add_span_processor(span_metrics)
+    trace.set_tracer_provider(provider)
+
+    runner = InMemoryRunner(agent=root_agent, app_name="db_buddy_load_test")
+    prompt_list = list(prompts) or DEFAULT_PROMPTS
+
+    async def run_all() -> list[dict]:
+        # One event loop for every level, so clients bound to it are reused
+        reports = []
+        for concurrency in concurrency_levels:
+            span_metrics.reset()
+            single_flight.reset()
+            admission.reset()
+            report = await _run_level(
+                runner, concurrency, sessions_per_level, prompt_list
+            )
+            report["spans"] = span_metrics.snapshot()
+            report["single_flight"] = single_flight.snapshot()
+            report["admission"] = admission.snapshot()
+            reports.append(report)
+            print(
+                f"concurrency={concurrency:>3} throughput={report['throughput_per_s']}/s "
+                f"p50={report['p50_s']}s max={report['max_s']}s errors={report['errors']}"
+            )
+        return reports
+
+    reports = asyncio.run(run_all())
+
+    baseline = reports[0]["throughput_per_s"] / reports[0]["concurrency"]
+    print("\nScaling efficiency (1.0 = linear):")
+    for report in reports:
+        efficiency = report["throughput_per_s"] / (baseline * report["concurrency"])
+        print(f"  concurrency={report['concurrency']:>3} efficiency={efficiency:.2f}")
+
+    with open("load_test_report.json", "w") as f:
+        json.dump(reports, f, indent=2)
+    print("\nFull report written to load_test_report.json")
+
+
+if __name__ == "__main__":
+    load_test()
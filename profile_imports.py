@@ -0,0 +1,99 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import sys
+
+import click
+
+
+def profile_import(module: str) -> tuple[float, list[tuple[str, float, float]]]:
+    """Import a module in a fresh interpreter and collect -X importtime output.
+
+    Args:
+        module: Dotted name of the module to import
+
+    Returns:
+        Import time in milliseconds, excluding interpreter startup, and a list
+        of (module, self time ms, cumulative time ms) for every module imported
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        # Drop the importtime lines so only the traceback is shown
+        traceback = "\n".join(
+            l for l in result.stderr.splitlines() if not l.startswith("import time:")
+        )
+        raise click.ClickException(f"Importing {module} failed:\n{traceback}")
+
+    modules = []
+    total_ms = 0.0
+    after_startup = False
+    for line in result.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, raw_name = line[len("import time:") :].split("|", 2)
+        name = raw_name.strip()
+        top_level = raw_name.startswith(" ") and not raw_name.startswith("  ")
+        if not after_startup:
+            # Everything up to and including `site` is interpreter startup
+            after_startup = top_level and name == "site"
+            continue
+        modules.append((name, int(self_us) / 1000, int(cumulative_us) / 1000))
+        if top_level:
+            total_ms += int(cumulative_us) / 1000
+
+    return total_ms, modules
+
+
+@click.command()
+@click.argument("module", default="db_buddy")
+@click.option("--top", default=25, help="Number of slowest modules to show")
+@click.option(
+    "--budget-ms",
+    default=None,
+    type=float,
+    help="Exit with an error if the total import time exceeds this budget",
+)
+def main(module: str, top: int, budget_ms: float | None) -> None:
+    """Report a per-module import-time breakdown for MODULE (default: db_buddy)."""
+    total_ms, modules = profile_import(module)
+
+    by_package: dict[str, float] = {}
+    for name, self_ms, _ in modules:
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_ms
+
+    print(f"Importing {module} took {total_ms:.1f} ms\n")
+    print("Slowest modules (cumulative ms):")
+    for name, _, cumulative_ms in sorted(modules, key=lambda m: -m[2])[:top]:
+        print(f"  {cumulative_ms:10.1f}  {name}")
+    print("\nBy top-level package (self ms):")
+    for package, self_ms in sorted(by_package.items(), key=lambda p: -p[1])[:top]:
+        print(f"  {self_ms:10.1f}  {package}")
+
+    if budget_ms is not None and total_ms > budget_ms:
+        raise click.ClickException(
+            f"Import of {module} took {total_ms:.1f} ms, over the {budget_ms:.1f} ms budget"
+        )
+
+
+if __name__ == "__main__":
+    main()
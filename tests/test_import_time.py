@@ -0,0 +1,42 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+pytest.importorskip("click")
+
+from profile_imports import profile_import
+
+# Generous, so only a real regression (a heavy import at package level) fails
+IMPORT_BUDGET_MS = 200
+# Loaded lazily, on first use of the agent, its connectors or the Postgres pool
+LAZY_PACKAGES = ("google.adk", "vertexai", "psycopg2")
+
+
+@pytest.fixture(scope="module")
+def db_buddy_import():
+    return profile_import("db_buddy")
+
+
+def test_import_stays_under_budget(db_buddy_import):
+    total_ms, _ = db_buddy_import
+    assert total_ms < IMPORT_BUDGET_MS
+
+
+@pytest.mark.parametrize("package", LAZY_PACKAGES)
+def test_heavy_packages_are_not_imported(db_buddy_import, package):
+    _, modules = db_buddy_import
+    imported = [name for name, _, _ in modules if name == package or name.startswith(f"{package}.")]
+    assert imported == []
@@ -0,0 +1,64 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+pytest.importorskip("google.cloud.storage")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "connector_deployment"))
+import db_deploy
+import provision_all
+from fake_sqladmin import FakeSqlAdminService
+
+
+def test_failed_iam_step_skips_both_databases(monkeypatch):
+    deployed = []
+
+    def no_gcloud_user():
+        raise RuntimeError("gcloud is not logged in")
+
+    monkeypatch.setattr(db_deploy, "get_gcloud_user", no_gcloud_user)
+    monkeypatch.setattr(db_deploy, "deploy_database", lambda db_type, **kwargs: deployed.append(db_type))
+
+    report = provision_all.run_graph(provision_all.build_steps(["postgres", "sqlsvr"]))
+
+    assert report["iam"]["status"] == "failed"
+    assert report["postgres"]["status"] == "skipped"
+    assert report["sqlsvr"]["status"] == "skipped"
+    assert deployed == []
+
+
+def test_operation_is_polled_until_done(monkeypatch):
+    monkeypatch.setattr(db_deploy, "POLL_INITIAL_DELAY_SECONDS", 0.001)
+    monkeypatch.setattr(db_deploy, "POLL_MAX_DELAY_SECONDS", 0.001)
+    service = FakeSqlAdminService(polls_until_done=3)
+    statuses = []
+    get_operation = service._operations_get
+
+    def recording_get(project, operation):
+        result = get_operation(project, operation)
+        statuses.append(result["status"])
+        return result
+
+    monkeypatch.setattr(service, "_operations_get", recording_get)
+    operation = service.instances().insert(project="p", body={"name": "instance"}).execute()
+
+    assert operation["status"] == "PENDING"
+    assert db_deploy.wait_for_operation_to_complete(service, "p", operation["name"])
+    assert statuses == ["RUNNING", "RUNNING", "DONE"]
@@ -0,0 +1,65 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("vertexai")
+pytest.importorskip("google.cloud.storage")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "connector_deployment"))
+import rag_create
+from fake_gcs import LocalBucket
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(rag_create, "UPLOAD_INITIAL_RETRY_DELAY_SECONDS", 0)
+
+
+@pytest.fixture
+def source_folder(tmp_path):
+    folder = tmp_path / "source"
+    for subfolder, content in (("2020", "first"), ("2021", "second")):
+        (folder / subfolder).mkdir(parents=True)
+        (folder / subfolder / "report.txt").write_text(content)
+    return folder
+
+
+def test_same_named_files_in_subfolders_both_upload_after_retries(tmp_path, source_folder):
+    bucket = LocalBucket(tmp_path / "bucket", failures_per_object=2)
+    files = rag_create.list_source_files(str(source_folder), "rag_source")
+
+    stats = rag_create.upload_files(bucket, files, max_workers=2)
+
+    assert sorted(stats["uploaded"]) == ["rag_source/2020/report.txt", "rag_source/2021/report.txt"]
+    assert stats["failed"] == []
+    assert bucket.upload_attempts == {name: 3 for name in stats["uploaded"]}
+    assert (tmp_path / "bucket" / "rag_source" / "2020" / "report.txt").read_text() == "first"
+    assert (tmp_path / "bucket" / "rag_source" / "2021" / "report.txt").read_text() == "second"
+
+
+def test_second_run_skips_unchanged_files(tmp_path, source_folder):
+    bucket = LocalBucket(tmp_path / "bucket", failures_per_object=2)
+    files = rag_create.list_source_files(str(source_folder), "rag_source")
+    rag_create.upload_files(bucket, files)
+
+    stats = rag_create.upload_files(bucket, files)
+
+    assert stats["uploaded"] == []
+    assert sorted(stats["skipped"]) == sorted(files)
+    assert stats["bytes"] == 0
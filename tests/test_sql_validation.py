@@ -0,0 +1,62 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+pytest.importorskip("sqlglot")
+
+from db_buddy.tools import schema_catalog, sql_validation
+
+CATALOG = {
+    "postgres": schema_catalog.catalog_entry({
+        "nyc_taxi_table": {
+            "columns": [["trip_id", "bigint"], ["tpep_pickup_datetime", "timestamp"], ["fare_amount", "numeric"]],
+            "indexes": [],
+        },
+    }),
+    "sqlsvr": schema_catalog.catalog_entry({
+        "nyc-weather-table": {"columns": [["date", "date"], ["condition", "varchar"]], "indexes": []},
+    }),
+}
+
+
+@pytest.fixture(autouse=True)
+def catalog(monkeypatch):
+    monkeypatch.setattr(schema_catalog.get_schema_catalog(), "_entries", CATALOG)
+    monkeypatch.setattr(sql_validation, "SQL_VALIDATION", True)
+
+
+@pytest.mark.parametrize("query, database", [
+    ("SELECT t.* FROM nyc_taxi_table t", "postgres"),
+    ("SELECT COUNT(t.*) FROM nyc_taxi_table t", "postgres"),
+    ("SELECT w.* FROM [nyc-weather-table] w", "sqlsvr"),
+    ("SELECT g FROM generate_series(1, 10) AS g", "postgres"),
+    ("SELECT * FROM generate_series(1, 10)", "postgres"),
+    ("SELECT d.day, t.fare_amount FROM nyc_taxi_table t JOIN generate_series(1, 2) AS d(day) ON TRUE", "postgres"),
+    ("SELECT * FROM pg_stat_activity", "postgres"),
+    ("SELECT json_agg(t) FROM nyc_taxi_table t", "postgres"),
+    ("SELECT * FROM nyc_taxi_table_2025_01", "postgres"),
+])
+def test_valid_queries_pass(query, database):
+    result = sql_validation.validate_sql(query, database)
+    assert result.ok, result.errors
+
+
+@pytest.mark.parametrize("query, error", [
+    ("SELECT fare_amout FROM nyc_taxi_table", "Column fare_amout does not exist. Did you mean fare_amount?"),
+    ("SELECT * FROM nyc_taxi_tabel", "Table nyc_taxi_tabel does not exist. Did you mean nyc_taxi_table?"),
+])
+def test_misspelled_names_are_reported(query, error):
+    result = sql_validation.validate_sql(query, "postgres")
+    assert result.errors == (error,)